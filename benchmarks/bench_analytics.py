@@ -0,0 +1,306 @@
+"""
+Бенчмарк масштабирования аналитики и экспорта на синтетических данных.
+
+Генератор воспроизводимо (фиксированный seed) заполняет свежую базу —
+схема создаётся миграциями Database — для каждого масштаба из --scales:
+
+    detailed_sessions             N строк
+    workout/eng_exercise_completions  по N/4
+    sleep_records, english_srs    по N/10
+
+Все строки принадлежат одному пользователю (худший случай — самый активный
+пользователь) и разбросаны по последним 365 дням; --users распределяет их
+по нескольким пользователям, замеры идут по пользователю 0.
+
+Меряется каждая ступень пути «запрос к базе -> generate_*/export_*»: лучшее и
+медианное время из --repeat прогонов и пик Python-аллокаций отдельного
+прогона (tracemalloc: строки sqlite3, словари, буферы NumPy/pandas; память
+самой SQLite и matplotlib вне Python-кучи не учитывается). Результат
+пишется в JSON (--output) вместе с версией кода, чтобы сравнивать версии:
+
+    python benchmarks/bench_analytics.py --output before.json
+    python benchmarks/bench_analytics.py --output after.json --compare before.json
+
+Запуск из корня репозитория:
+    python benchmarks/bench_analytics.py [--scales 1000,100000,1000000] [--repeat 3]
+        [--users 1] [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import Database  # noqa: E402
+from services import analytics, export  # noqa: E402
+
+DEFAULT_SCALES = (1_000, 100_000, 1_000_000)
+BENCH_USER = 0
+STATUSES = ('completed', 'completed', 'completed', 'cancelled', 'skipped')
+DOMAINS = ('QA', 'Python', 'English', 'Math')
+EXERCISES = ('Приседания', 'Отжимания', 'Планка', 'Подтягивания')
+
+
+def table_sizes(rows: int) -> Dict[str, int]:
+    """Сколько строк каждой таблицы генерируется для масштаба rows."""
+    return {
+        'detailed_sessions': rows,
+        'workout_exercise_completions': rows // 4,
+        'eng_exercise_completions': rows // 4,
+        'sleep_records': max(rows // 10, 1),
+        'english_srs': max(rows // 10, 1),
+    }
+
+
+def generate(db_path: str, rows: int, users: int = 1, seed: int = 42) -> Dict[str, int]:
+    """
+    Создаёт базу миграциями и заполняет её синтетическими данными.
+
+    Вставка идёт напрямую через executemany, минуя очередь записи Database, а
+    дневные итоги (daily_user_stats) потом пересчитываются целиком — как
+    командой --backfill-daily-stats.
+
+    Returns:
+        Таблица -> количество вставленных строк
+    """
+    sizes = table_sizes(rows)
+    rnd = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+
+    def moment() -> datetime:
+        return now - timedelta(seconds=rnd.randrange(365 * 86400))
+
+    def sessions():
+        for _ in range(sizes['detailed_sessions']):
+            dt = moment()
+            actual = rnd.randrange(5, 41)
+            yield (
+                rnd.randrange(users), dt.strftime("%Y-%m-%d"), rnd.choice(DOMAINS), 'theory',
+                20, actual, rnd.choice(STATUSES), 'focused', 'синтетическая сессия', dt.isoformat()
+            )
+
+    def completions(count: int):
+        for _ in range(count):
+            dt = moment()
+            index = rnd.randrange(len(EXERCISES))
+            yield (
+                rnd.randrange(users), dt.strftime("%Y-%m-%d"), dt.weekday(), index, EXERCISES[index],
+                1 if rnd.random() < 0.7 else 0, dt.isoformat()
+            )
+
+    def sleep():
+        for _ in range(sizes['sleep_records']):
+            end = moment()
+            minutes = rnd.randrange(300, 600)
+            start = end - timedelta(minutes=minutes)
+            yield (rnd.randrange(users), end.strftime("%Y-%m-%d"), start.isoformat(), end.isoformat(),
+                   minutes, start.isoformat())
+
+    def phrases():
+        for i in range(sizes['english_srs']):
+            reviewed = moment()
+            interval = rnd.choice((1, 3, 7, 14, 30))
+            yield (
+                rnd.randrange(users), f"phrase {i}", f"фраза {i}", interval, reviewed.isoformat(),
+                (reviewed + timedelta(days=interval)).isoformat(), rnd.randrange(10), rnd.randrange(5),
+                reviewed.isoformat()
+            )
+
+    database = Database(db_path)
+    database.close()
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(
+            """INSERT INTO detailed_sessions (user_id, date, domain, task_type, planned_minutes, actual_minutes,
+               status, focus_status, description, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            sessions()
+        )
+        for table in ('workout_exercise_completions', 'eng_exercise_completions'):
+            conn.executemany(
+                f"""INSERT INTO {table} (user_id, date, day_of_week, exercise_index, exercise_name, completed,
+                    created_at) VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                completions(sizes[table])
+            )
+        conn.executemany(
+            """INSERT INTO sleep_records (user_id, date, sleep_start, sleep_end, duration_minutes, created_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            sleep()
+        )
+        conn.executemany(
+            """INSERT INTO english_srs (user_id, phrase_en, phrase_ru, interval_days, last_reviewed, next_review,
+               success_count, fail_count, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            phrases()
+        )
+    conn.execute("ANALYZE")
+    conn.close()
+
+    database = Database(db_path)
+    try:
+        database.rebuild_daily_stats()
+    finally:
+        database.close()
+    return sizes
+
+
+def stages(db: Database, user_id: int) -> List[Tuple[str, Callable[[Dict[str, Any]], Any]]]:
+    """
+    Ступени в порядке выполнения: (имя, функция от результатов предыдущих ступеней).
+
+    Запросы с теми же параметрами, что у обработчиков бота: графики — за 14
+    дней, экспорт — за 365.
+    """
+    return [
+        ('db.get_detailed_sessions', lambda r: db.get_detailed_sessions(user_id, days=365)),
+        ('db.get_heatmap_cells', lambda r: db.get_heatmap_cells(user_id, days=14)),
+        ('db.get_daily_session_stats', lambda r: db.get_daily_session_stats(user_id, days=14)),
+        ('db.get_sleep_records', lambda r: db.get_sleep_records(user_id, days=365)),
+        ('db.get_all_english_phrases', lambda r: db.get_all_english_phrases(user_id)),
+        ('analytics.generate_productivity_heatmap',
+         lambda r: analytics.generate_productivity_heatmap(r['db.get_detailed_sessions'])),
+        ('analytics.generate_stats_charts', lambda r: analytics.generate_stats_charts(r['db.get_detailed_sessions'])),
+        ('analytics.generate_heatmap_from_cells',
+         lambda r: analytics.generate_heatmap_from_cells(r['db.get_heatmap_cells'])),
+        ('analytics.generate_daily_stats_chart',
+         lambda r: analytics.generate_daily_stats_chart(r['db.get_daily_session_stats'])),
+        ('analytics.generate_sleep_chart', lambda r: analytics.generate_sleep_chart(r['db.get_sleep_records'])),
+        ('export.export_sessions_to_csv', lambda r: export.export_sessions_to_csv(r['db.get_detailed_sessions'])),
+        ('export.export_english_to_csv',
+         lambda r: export.export_english_to_csv(r['db.get_all_english_phrases'], [])),
+        ('export.export_sleep_to_csv', lambda r: export.export_sleep_to_csv(r['db.get_sleep_records'])),
+    ]
+
+
+def output_size(value: Any) -> Dict[str, int]:
+    """Размер результата ступени: строк для списков, байт для CSV и картинок."""
+    if isinstance(value, list):
+        return {'rows_out': len(value)}
+    if isinstance(value, str):
+        return {'bytes_out': len(value.encode('utf-8'))}
+    if hasattr(value, 'getbuffer'):
+        return {'bytes_out': value.getbuffer().nbytes}
+    return {}
+
+
+def measure(func: Callable[[], Any], repeat: int) -> Tuple[Any, Dict[str, float]]:
+    """Прогрев, repeat замеров времени и отдельный прогон под tracemalloc."""
+    result = func()
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    gc.collect()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, {
+        'best_ms': min(times) * 1000,
+        'median_ms': statistics.median(times) * 1000,
+        'peak_mb': peak / 1024 / 1024,
+    }
+
+
+def run_scale(rows: int, users: int, repeat: int, seed: int) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        t0 = time.perf_counter()
+        sizes = generate(db_path, rows, users=users, seed=seed)
+        generate_s = time.perf_counter() - t0
+        db = Database(db_path)
+        try:
+            results, report = {}, {}
+            for name, stage in stages(db, BENCH_USER):
+                results[name], metrics = measure(lambda: stage(results), repeat)
+                report[name] = {**metrics, **output_size(results[name])}
+                print(f"  {name:<42} {metrics['best_ms']:>10.1f} мс {metrics['peak_mb']:>9.1f} МБ", file=sys.stderr)
+        finally:
+            db.close()
+    return {'tables': sizes, 'generate_s': round(generate_s, 2), 'stages': report}
+
+
+def code_version() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]):
+    """Печатает изменение лучшего времени и пика памяти относительно прошлого прогона."""
+    print(f"\nСравнение с {baseline['meta']['version']} ({baseline['meta']['created_at']}):")
+    print(f"{'масштаб':>9} {'ступень':<42} {'время':>8} {'память':>8}")
+    for scale, result in report['scales'].items():
+        old_stages = baseline['scales'].get(scale, {}).get('stages', {})
+        for name, new in result['stages'].items():
+            old = old_stages.get(name)
+            if old is None:
+                continue
+            time_change = new['best_ms'] / old['best_ms'] - 1 if old['best_ms'] else 0.0
+            memory_change = new['peak_mb'] / old['peak_mb'] - 1 if old['peak_mb'] else 0.0
+            print(f"{scale:>9} {name:<42} {time_change:>+8.0%} {memory_change:>+8.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default=','.join(map(str, DEFAULT_SCALES)),
+                        help="Размеры detailed_sessions через запятую")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--users', type=int, default=1, help="По скольким пользователям распределить строки")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Записать результат в JSON-файл")
+    parser.add_argument('--compare', help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+    os.environ.setdefault('CHART_BACKEND', analytics.DEFAULT_CHART_BACKEND)
+
+    report = {
+        'meta': {
+            'version': code_version(),
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sqlite': sqlite3.sqlite_version,
+            'chart_backend': os.environ['CHART_BACKEND'],
+            'repeat': args.repeat,
+            'users': args.users,
+            'seed': args.seed,
+        },
+        'scales': {},
+    }
+    for rows in (int(scale) for scale in args.scales.split(',')):
+        print(f"Масштаб {rows}:", file=sys.stderr)
+        # Сообщения миграций и базы — в stderr, stdout остаётся под JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            report['scales'][str(rows)] = run_scale(rows, args.users, args.repeat, args.seed)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
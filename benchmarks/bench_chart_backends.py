@@ -0,0 +1,95 @@
+"""
+Бенчмарк бэкендов графиков: matplotlib (services.chart_mpl) vs Pillow (services.chart_pil).
+
+Каждый бэкенд меряется в отдельном интерпретаторе, как в воркере рендера:
+импорт + прогрев, затем тепловая карта, три графика статистики и график сна
+на одних и тех же агрегатах. Для каждого графика — лучшее время из repeat,
+пик Python-аллокаций одного рендера (tracemalloc) и размер PNG (рендер
+вместе с кодированием services.encode); для процесса —
+время импорта с прогревом и RSS после прогрева.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_chart_backends.py [--repeat 10] [--days 14] [--json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKENDS = ('matplotlib', 'pillow')
+
+# Выполняется в дочернем интерпретаторе; печатает одну строку JSON
+CHILD = """
+import json, sys, time, tracemalloc
+from datetime import date, timedelta
+sys.path.insert(0, {root!r})
+import numpy as np
+
+started = time.perf_counter()
+from services import analytics, encode
+backend = analytics.get_backend({backend!r})
+backend.warm()
+warm_s = time.perf_counter() - started
+with open('/proc/self/status') as f:
+    rss_mb = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:')) / 1024
+
+rng = np.random.default_rng(42)
+days = [date.today() - timedelta(days=i) for i in range({days} - 1, -1, -1)]
+counts = rng.integers(0, 6, size=(7, 24)).astype(float)
+rates = np.where(counts > 0, rng.random((7, 24)), 0)
+charts = {{
+    'heatmap': lambda: backend.heatmap(rates, counts),
+    'stats': lambda: backend.stats(days, rng.integers(1, 12, len(days)), rng.uniform(10, 50, len(days)),
+                                   rng.uniform(0, 100, len(days))),
+    'sleep': lambda: backend.sleep(days[-7:], rng.uniform(5, 9, 7)),
+}}
+result = {{'warm_s': warm_s, 'rss_mb': rss_mb, 'charts': {{}}}}
+for kind, render in charts.items():
+    best = float('inf')
+    for _ in range({repeat}):
+        t0 = time.perf_counter()
+        png = encode.encode(render(), kind).getvalue()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    encode.encode(render(), kind)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result['charts'][kind] = {{'ms': best * 1000, 'peak_mb': peak / 1024 / 1024, 'png_kb': len(png) / 1024}}
+print(json.dumps(result))
+"""
+
+
+def run_backend(backend: str, repeat: int, days: int) -> dict:
+    code = CHILD.format(root=ROOT, backend=backend, repeat=repeat, days=days)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--days', type=int, default=14, help="Дней на графике статистики")
+    parser.add_argument('--json', action='store_true', help="Вывести результат в JSON")
+    args = parser.parse_args()
+
+    report = {backend: run_backend(backend, args.repeat, args.days) for backend in BACKENDS}
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    for backend, r in report.items():
+        print(f"{backend}: импорт + прогрев {r['warm_s']:.2f} с, RSS после прогрева {r['rss_mb']:.0f} МБ")
+    print(f"{'график':<8} {'бэкенд':<11} {'время, мс':>10} {'пик, МБ':>8} {'PNG, КБ':>8}")
+    for kind in report[BACKENDS[0]]['charts']:
+        for backend in BACKENDS:
+            c = report[backend]['charts'][kind]
+            print(f"{kind:<8} {backend:<11} {c['ms']:>10.1f} {c['peak_mb']:>8.2f} {c['png_kb']:>8.1f}")
+        old, new = (report[b]['charts'][kind]['ms'] for b in BACKENDS)
+        print(f"{'':<8} {'ускорение':<11} {old / new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Бенчмарк кодирования графиков: размер отправляемой картинки и время кодирования.
+
+Для каждого бэкенда и типа графика рисуются --samples наборов случайных
+данных, и каждая картинка кодируется во все форматы services.encode
+(png — полноцветный PNG, как было до выбора формата; png8 — палитровый;
+jpeg). Печатаются медианы размера и времени кодирования и отличие от
+исходных пикселей: средняя абсолютная ошибка на канал (0–255) и PSNR.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_chart_encoding.py [--samples 20] [--json]
+"""
+
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from services import analytics, encode  # noqa: E402
+
+BACKENDS = ('matplotlib', 'pillow')
+
+
+def sample_images(backend, rng: np.random.Generator, samples: int):
+    """Тип графика -> список картинок на случайных данных."""
+    days = [date.today() - timedelta(days=i) for i in range(13, -1, -1)]
+    images = {'heatmap': [], 'stats': [], 'sleep': []}
+    for _ in range(samples):
+        counts = rng.integers(0, 6, size=(7, 24)).astype(float) * (rng.random((7, 24)) < 0.6)
+        rates = np.where(counts > 0, rng.random((7, 24)), 0)
+        images['heatmap'].append(backend.heatmap(rates, counts))
+        images['stats'].append(backend.stats(days, rng.integers(1, 12, 14), rng.uniform(10, 50, 14),
+                                             rng.uniform(0, 100, 14)))
+        images['sleep'].append(backend.sleep(days[-7:], rng.uniform(5, 9, 7)))
+    return images
+
+
+def measure(images, kind: str, encoding: str) -> dict:
+    sizes, times, errors = [], [], []
+    for image in images:
+        buf = encode.encode(image, kind, encoding)
+        record = encode.drain_records()[-1]
+        sizes.append(record.bytes)
+        times.append(record.encode_ms)
+        decoded = np.asarray(Image.open(buf).convert("RGB"), dtype=np.int16)
+        errors.append(np.abs(decoded - np.asarray(image, dtype=np.int16)).mean())
+    mae = statistics.mean(errors)
+    return {
+        'median_kb': statistics.median(sizes) / 1024,
+        'median_encode_ms': statistics.median(times),
+        'mae': mae,
+        # Грубая оценка PSNR через среднюю ошибку; inf — без потерь
+        'psnr_db': 20 * math.log10(255 / mae) if mae else float('inf'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--samples', type=int, default=20)
+    parser.add_argument('--json', action='store_true', help="Вывести результат в JSON")
+    args = parser.parse_args()
+
+    report = {}
+    for name in BACKENDS:
+        backend = analytics.get_backend(name)
+        backend.warm()
+        images = sample_images(backend, np.random.default_rng(42), args.samples)
+        report[name] = {
+            kind: {encoding: measure(kind_images, kind, encoding) for encoding in encode.FORMATS}
+            for kind, kind_images in images.items()
+        }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"Медианы по {args.samples} графикам; по умолчанию: {encode.CHART_ENCODINGS}")
+    print(f"{'бэкенд':<11} {'график':<8} {'формат':<6} {'КБ':>7} {'мс':>7} {'ошибка':>7} {'к png':>7}")
+    for name, kinds in report.items():
+        for kind, encodings in kinds.items():
+            baseline = encodings['png']['median_kb']
+            for encoding, r in encodings.items():
+                print(f"{name:<11} {kind:<8} {encoding:<6} {r['median_kb']:>7.1f} {r['median_encode_ms']:>7.1f} "
+                      f"{r['mae']:>7.2f} {r['median_kb'] / baseline:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Бенчмарк шаблонов фигур matplotlib: рендер в заранее собранную фигуру vs сборка фигуры на каждый вызов.
+
+Сборка «на каждый вызов» — тот же класс шаблона, созданный заново перед
+рендером, то есть разница — ровно стоимость создания осей, подписей,
+колорбара и легенды.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_chart_templates.py [--sessions 5000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_heatmap import synthetic_sessions  # noqa: E402
+from services import analytics, chart_mpl  # noqa: E402
+
+
+def best_ms(func, repeat: int) -> float:
+    func()  # прогрев
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sessions', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    os.environ['CHART_BACKEND'] = 'matplotlib'
+
+    now = datetime.now()
+    sessions = synthetic_sessions(args.sessions)
+    for i, session in enumerate(sessions):
+        session['created_at'] = (now - timedelta(days=i % 14, minutes=i % 600)).isoformat()
+        session['actual_minutes'] = 10 + i % 40
+    sleep_records = [
+        {'created_at': (now - timedelta(days=i)).isoformat(), 'duration_minutes': 360 + (i * 37) % 180}
+        for i in range(14)
+    ]
+
+    charts = {
+        'heatmap': (analytics.generate_productivity_heatmap, sessions),
+        'stats': (analytics.generate_stats_charts, sessions),
+        'sleep': (analytics.generate_sleep_chart, sleep_records),
+    }
+
+    print(f"{'график':<10} {'новая фигура, мс':>17} {'шаблон, мс':>11} {'ускорение':>10}")
+    for kind, (generate, rows) in charts.items():
+        def fresh():
+            chart_mpl._templates.pop(kind, None)
+            generate(rows)
+
+        fresh_ms = best_ms(fresh, args.repeat)
+        template_ms = best_ms(lambda: generate(rows), args.repeat)
+        print(f"{kind:<10} {fresh_ms:>17.1f} {template_ms:>11.1f} {fresh_ms / template_ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Бенчмарк задержки вызовов Database: соединение на каждый вызов vs пул.
+
+Сравнивается только работа с соединениями: в обоих вариантах кэш чтений
+выключен (cache_max_bytes=0), а записи фиксируются сразу (durable), без
+очереди групповой фиксации. Вариант «до пула» открывает соединение на
+вызов и закрывает его по завершении вызова, как делал код до пула.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_db_connections.py [--rows 100000] [--calls 2000]
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+
+class PerCallDatabase(Database):
+    """Поведение до пула: новое соединение на каждый вызов метода, закрываемое после него."""
+
+    def __init__(self, *args, **kwargs):
+        self._opened = []
+        super().__init__(*args, **kwargs)
+        self._close_opened()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        self._opened.append(conn)
+        return conn
+
+    def _close_opened(self):
+        while self._opened:
+            self._opened.pop().close()
+
+    @contextlib.contextmanager
+    def call(self):
+        """Границы одного вызова метода: открытые в нём соединения закрываются."""
+        try:
+            yield
+        finally:
+            self._close_opened()
+
+
+def seed(db_path: str, rows: int, users: int = 100):
+    """Заполняет detailed_sessions и vocabulary_words синтетическими данными."""
+    Database(db_path).close()
+    conn = sqlite3.connect(db_path)
+    rnd = random.Random(42)
+    start = datetime.now() - timedelta(days=365)
+
+    def sessions():
+        for _ in range(rows):
+            dt = start + timedelta(minutes=rnd.randrange(365 * 24 * 60))
+            yield (
+                rnd.randrange(users), dt.strftime("%Y-%m-%d"), "QA", "theory",
+                20, rnd.randrange(5, 40), rnd.choice(["completed", "cancelled"]),
+                "ok", None, dt.isoformat()
+            )
+
+    def words():
+        for i in range(rows):
+            due = start + timedelta(days=rnd.randrange(400))
+            yield (rnd.randrange(users), f"word{i}", "explanation", "перевод",
+                   due.strftime("%Y-%m-%d"), start.isoformat())
+
+    conn.executemany(
+        "INSERT INTO detailed_sessions (user_id, date, domain, task_type, planned_minutes, actual_minutes, status, focus_status, description, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        sessions()
+    )
+    conn.executemany(
+        "INSERT INTO vocabulary_words (user_id, word, explanation, translation, next_review_date, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        words()
+    )
+    conn.commit()
+    conn.close()
+
+
+def measure(db: Database, calls: int, users: int = 100) -> dict:
+    """Прогоняет смесь типичных вызовов обработчиков и возвращает задержки в мкс."""
+    rnd = random.Random(7)
+    operations = [
+        lambda u: db.get_detailed_sessions(u, days=14),
+        lambda u: db.get_words_for_review(u),
+        lambda u: db.get_all_focus_tasks(u),
+        lambda u: db.get_first_session_date(u),
+        lambda u: db.mark_workout_exercise_completed(u, "2024-01-01", 0, 0, "bench", True, durable=True),
+    ]
+    scope = db.call if isinstance(db, PerCallDatabase) else contextlib.nullcontext
+    latencies = []
+    for _ in range(calls):
+        op = rnd.choice(operations)
+        t0 = time.perf_counter()
+        with scope():
+            op(rnd.randrange(users))
+        latencies.append((time.perf_counter() - t0) * 1e6)
+    latencies.sort()
+    return {
+        'mean_us': sum(latencies) / len(latencies),
+        'p50_us': latencies[len(latencies) // 2],
+        'p95_us': latencies[int(len(latencies) * 0.95)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        print(f"Заполняем базу: {args.rows} строк...")
+        seed(db_path, args.rows)
+
+        results = {}
+        for name, cls in (("per-call", PerCallDatabase), ("pooled", Database)):
+            db = cls(db_path, cache_max_bytes=0)
+            measure(db, 100)  # прогрев кэша страниц ОС
+            results[name] = measure(db, args.calls)
+            db.close()
+
+    print(f"{'режим':<10} {'mean, мкс':>12} {'p50, мкс':>12} {'p95, мкс':>12}")
+    for name, r in results.items():
+        print(f"{name:<10} {r['mean_us']:>12.1f} {r['p50_us']:>12.1f} {r['p95_us']:>12.1f}")
+    speedup = results['per-call']['mean_us'] / results['pooled']['mean_us']
+    print(f"Ускорение среднего вызова: x{speedup:.2f}")
+
+
+if __name__ == "__main__":
+    main()
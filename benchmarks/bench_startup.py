@@ -0,0 +1,97 @@
+"""
+Холодный старт процесса бота: время импорта bot.py и резидентная память (RSS).
+
+Сравниваются два режима в отдельных интерпретаторах:
+    lazy  — текущий код: analytics и клиенты поиска не импортируются при старте;
+    eager — как до ленивых импортов: matplotlib/seaborn/pandas (services.analytics),
+            googleapiclient и requests загружаются вместе с bot.py.
+
+Импорт bot.py — это всё, что процесс делает до подъёма webhook (создание
+Bot, Dispatcher, базы с миграциями, регистрация обработчиков). Скрипт
+запускается во временном каталоге с фиктивным BOT_TOKEN, поэтому рабочая
+база и .env не затрагиваются.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_startup.py [--repeat 5] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PRELOAD = {
+    'lazy': "",
+    'eager': "import services.analytics, googleapiclient.discovery, requests",
+}
+
+# Выполняется в дочернем интерпретаторе; печатает одну строку JSON
+CHILD = """
+import json, os, sys, time, io, contextlib
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    {preload}
+    import bot
+elapsed = time.perf_counter() - started
+rss_kb = 0
+try:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+except OSError:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+heavy = [m for m in ('matplotlib', 'seaborn', 'pandas', 'googleapiclient', 'requests') if m in sys.modules]
+print(json.dumps({{'import_s': elapsed, 'rss_mb': rss_kb / 1024, 'heavy': heavy}}))
+"""
+
+
+def run_once(mode: str) -> dict:
+    code = CHILD.format(root=ROOT, preload=PRELOAD[mode])
+    env = dict(os.environ, BOT_TOKEN="123456:" + "A" * 35)
+    with tempfile.TemporaryDirectory() as cwd:
+        result = subprocess.run(
+            [sys.executable, "-c", code], cwd=cwd, env=env,
+            capture_output=True, text=True, check=True
+        )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help="Вывести результат в JSON")
+    args = parser.parse_args()
+
+    report = {}
+    for mode in PRELOAD:
+        runs = [run_once(mode) for _ in range(args.repeat)]
+        report[mode] = {
+            'import_s': statistics.median(r['import_s'] for r in runs),
+            'rss_mb': statistics.median(r['rss_mb'] for r in runs),
+            'heavy_modules': runs[0]['heavy'],
+        }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"Медиана из {args.repeat} запусков")
+    print(f"{'режим':<6} {'импорт bot.py, с':>17} {'RSS, МБ':>9}  тяжёлые модули в памяти")
+    for mode, r in report.items():
+        print(f"{mode:<6} {r['import_s']:>17.2f} {r['rss_mb']:>9.1f}  {', '.join(r['heavy_modules']) or '—'}")
+    lazy, eager = report['lazy'], report['eager']
+    print(f"Готов к работе быстрее на {eager['import_s'] - lazy['import_s']:.2f} с "
+          f"(x{eager['import_s'] / lazy['import_s']:.1f}), "
+          f"RSS меньше на {eager['rss_mb'] - lazy['rss_mb']:.0f} МБ")
+
+
+if __name__ == "__main__":
+    main()
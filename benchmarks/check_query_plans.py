@@ -0,0 +1,120 @@
+"""
+Проверка планов горячих запросов Database через EXPLAIN QUERY PLAN.
+
+Вызывает методы Database, перехватывает реальный SQL (с подставленными
+параметрами) и падает, если хоть один запрос делает полный проход по
+таблице (SCAN без индекса) или сортирует через временное B-дерево.
+
+Запуск из корня репозитория:
+    python benchmarks/check_query_plans.py
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+USER_ID = 1
+TODAY = "2024-01-01"
+
+# Горячие вызовы обработчиков и планировщика: имя -> функция от Database
+HOT_CALLS = {
+    'get_today_sessions': lambda db: db.get_today_sessions(USER_ID),
+    'get_all_brain_dumps': lambda db: db.get_all_brain_dumps(USER_ID),
+    'get_all_learning_notes': lambda db: db.get_all_learning_notes(USER_ID),
+    'get_detailed_sessions': lambda db: db.get_detailed_sessions(USER_ID, days=14),
+    'get_detailed_sessions_filtered': lambda db: db.get_detailed_sessions(USER_ID, domain="QA", task_type="theory"),
+    'get_combined_sessions_for_heatmap': lambda db: db.get_combined_sessions_for_heatmap(USER_ID, days=14),
+    'get_heatmap_cells': lambda db: db.get_heatmap_cells(USER_ID, days=14),
+    'get_daily_session_stats': lambda db: db.get_daily_session_stats(USER_ID, days=14),
+    'get_daily_stats': lambda db: db.get_daily_stats(USER_ID, 14),
+    'get_phrase_for_review': lambda db: db.get_phrase_for_review(USER_ID),
+    'get_all_english_phrases': lambda db: db.get_all_english_phrases(USER_ID),
+    'get_sleep_records': lambda db: db.get_sleep_records(USER_ID, days=7),
+    'get_average_sleep': lambda db: db.get_average_sleep(USER_ID, days=7),
+    'get_latest_sleep_record': lambda db: db.get_latest_sleep_record(USER_ID),
+    'has_completed_sleep_today': lambda db: db.has_completed_sleep_today(USER_ID),
+    'get_workout_plan': lambda db: db.get_workout_plan(USER_ID, 0),
+    'get_all_workout_plans': lambda db: db.get_all_workout_plans(USER_ID),
+    'get_workout_completions': lambda db: db.get_workout_completions(USER_ID, 14),
+    'get_workout_exercise_completions_for_date': lambda db: db.get_workout_exercise_completions_for_date(USER_ID, TODAY, 0),
+    'get_eng_plan': lambda db: db.get_eng_plan(USER_ID, 0),
+    'get_all_eng_plans': lambda db: db.get_all_eng_plans(USER_ID),
+    'get_eng_exercise_completions_for_date': lambda db: db.get_eng_exercise_completions_for_date(USER_ID, TODAY, 0),
+    'get_all_irregular_verbs': lambda db: db.get_all_irregular_verbs(),
+    'get_all_focus_tasks': lambda db: db.get_all_focus_tasks(USER_ID),
+    'get_first_session_date': lambda db: db.get_first_session_date(USER_ID),
+    'get_last_heatmap_notification_date': lambda db: db.get_last_heatmap_notification_date(USER_ID),
+    'get_due_notifications': lambda db: db.get_due_notifications(TODAY),
+    'get_due_notifications_sunday': lambda db: db.get_due_notifications("2024-01-07"),
+    'enqueue_due_notifications': lambda db: db.enqueue_due_notifications(TODAY),
+    'claim_scheduled_jobs': lambda db: db.claim_scheduled_jobs(),
+    'recover_stale_jobs': lambda db: db.recover_stale_jobs(),
+    'get_next_scheduled_job_time': lambda db: db.get_next_scheduled_job_time(),
+    'get_all_vocabulary_words': lambda db: db.get_all_vocabulary_words(USER_ID),
+    'get_words_for_review': lambda db: db.get_words_for_review(USER_ID),
+    'count_vocabulary_words': lambda db: db.count_vocabulary_words(USER_ID),
+    'get_vocabulary_words_page': lambda db: db.get_vocabulary_words_page(USER_ID, 10, 20),
+    'get_vocabulary_word_position': lambda db: db.get_vocabulary_word_position(USER_ID, 1),
+}
+
+# Группировка по вычисляемому ключу (день недели x час) без временного B-дерева
+# невозможна; групп не больше 7 * 24, а строки выбираются по индексу
+BOUNDED_GROUP_BY = {'get_heatmap_cells'}
+
+
+def plan_problems(conn, sql: str, allow_group_by: bool = False) -> list:
+    """Возвращает строки плана с полным проходом или временной сортировкой."""
+    problems = []
+    for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"):
+        detail = row[3]
+        # Проход по результату подзапроса — не проход по таблице
+        full_scan = detail.startswith("SCAN ") and " USING " not in detail and "subquery" not in detail
+        temp_sort = "USE TEMP B-TREE" in detail and not (allow_group_by and "GROUP BY" in detail)
+        if full_scan or temp_sort:
+            problems.append(detail)
+    return problems
+
+
+def check(db: Database) -> dict:
+    """Прогоняет HOT_CALLS и собирает проблемы планов по каждому вызову."""
+    conn = db._connect()
+    failures = {}
+    for name, call in HOT_CALLS.items():
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            call(db)
+        finally:
+            conn.set_trace_callback(None)
+        for sql in statements:
+            if not sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+                continue
+            problems = plan_problems(conn, sql, allow_group_by=name in BOUNDED_GROUP_BY)
+            if problems:
+                failures.setdefault(name, []).append((sql, problems))
+    return failures
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "plans.db"))
+        # Статистика планировщика как на живой базе: без ANALYZE SQLite может выбрать другой индекс
+        db._connect().execute("ANALYZE")
+        failures = check(db)
+        db.close()
+
+    if not failures:
+        print(f"OK: {len(HOT_CALLS)} горячих вызовов без полного прохода и временной сортировки")
+        return 0
+    for name, items in failures.items():
+        for sql, problems in items:
+            print(f"FAIL {name}: {'; '.join(problems)}\n    {sql}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -28,18 +28,19 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from database import Database
+from database import Database, AsyncDatabase, resolve_timezone
 from timer import FocusTimer
+from scheduler import NotificationScheduler, HEATMAP, SLEEP_CHART, NOTIFICATION_HOUR, local_now
+from fanout import NotificationFanout
 from services import (
-    generate_productivity_heatmap,
-    generate_stats_charts,
-    generate_sleep_chart,
+    ChartCache,
+    ChartRenderer,
     search_info,
     export_sessions_to_csv,
     export_english_to_csv,
     export_sleep_to_csv
 )
-from irregular_verbs import IRREGULAR_VERBS
+from irregular_verbs import IRREGULAR_VERBS, VerbIndex
 
 # Читаем токен НАПРЯМУЮ из .env файла, игнорируя переменные окружения
 # Это гарантирует, что systemd Environment переменные не переопределят токен
@@ -204,7 +205,40 @@ print(f"DEBUG: BOT_TOKEN для создания бота: {BOT_TOKEN[:20]}... (
 
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher(storage=MemoryStorage())
-db = Database()
+db = AsyncDatabase(Database())
+# Графики рисуются в пуле процессов, чтобы matplotlib не блокировал event loop
+renderer = ChartRenderer(max_workers=int(os.getenv("RENDER_WORKERS", "2")))
+# Готовые графики; сбрасываются при записи новых сессий/сна пользователя
+chart_cache = ChartCache()
+db.database.add_write_listener(chart_cache.on_write)
+
+
+async def user_heatmap_png(user_id: int) -> Optional[bytes]:
+    """Тепловая карта за 14 дней (FOCUS + WORKOUT + ENG) из кэша или с рендером"""
+    return await chart_cache.get_or_render(
+        user_id, 'heatmap',
+        lambda: db.get_heatmap_cells(user_id, days=14),
+        renderer.render_heatmap
+    )
+
+
+async def user_stats_png(user_id: int) -> Optional[bytes]:
+    """Графики статистики за 14 дней из кэша или с рендером"""
+    return await chart_cache.get_or_render(
+        user_id, 'stats',
+        lambda: db.get_daily_session_stats(user_id, days=14),
+        renderer.render_stats
+    )
+
+
+async def user_sleep_png(user_id: int, allow_empty: bool = True) -> Optional[bytes]:
+    """График сна за 7 дней из кэша или с рендером (без данных — заглушка или None)"""
+    return await chart_cache.get_or_render(
+        user_id, 'sleep',
+        lambda: db.get_sleep_records(user_id, days=7),
+        renderer.render_sleep,
+        allow_empty=allow_empty
+    )
 
 # Хранилище активных таймеров (user_id -> FocusTimer)
 active_timers: dict[int, FocusTimer] = {}
@@ -212,6 +246,9 @@ active_timers: dict[int, FocusTimer] = {}
 # Хранилище данных активных сессий (user_id -> {direction, ...})
 active_sessions: dict[int, dict] = {}
 
+# Индекс неправильных глаголов в памяти, строится один раз в init_irregular_verbs()
+verb_index = VerbIndex()
+
 
 # Вспомогательные функции
 def get_focus_tasks_keyboard() -> InlineKeyboardMarkup:
@@ -407,9 +444,9 @@ async def cmd_start(message: Message):
     """Обработчик команды /start"""
     user_id = message.from_user.id
     # Сохраняем дату первого использования для этого пользователя, если еще не сохранены
-    first_session = db.get_first_session_date(user_id)
+    first_session = await db.get_first_session_date(user_id)
     if not first_session:
-        db.set_first_session_date(user_id)
+        await db.set_first_session_date(user_id)
     
     # Получаем username или используем имя
     username = message.from_user.username
@@ -568,31 +605,16 @@ async def back_to_focus_tasks_menu_handler(callback: CallbackQuery):
 
 
 # Обработчики callback для подразделов ENG
-@dp.callback_query(F.data == "eng_verbs")
-async def eng_verbs_handler(callback: CallbackQuery):
-    """Обработчик неправильных глаголов"""
-    await callback.answer()
-    # Инициализируем базу глаголов, если пуста
-    verbs = db.get_all_irregular_verbs()
-    if len(verbs) < 50:
-        # Загружаем глаголы
-        for form1, form2, form3, translation, example2, example3 in IRREGULAR_VERBS:
-            try:
-                db.add_irregular_verb(form1, form2, form3, translation, example2, example3)
-            except:
-                pass  # Глагол уже существует
-    
-    # Получаем случайный глагол
-    import random
-    verbs = db.get_all_irregular_verbs()
-    if verbs:
-        verb = random.choice(verbs)
-        text = f"{verb['verb_form1']} – {verb['verb_form2']} – {verb['verb_form3']}\n"
-        text += f"{verb['translation']}\n\n"
-        if verb.get('example_form2'):
-            text += f"{verb['example_form2']}\n"
-        if verb.get('example_form3'):
-            text += f"{verb['example_form3']}"
+async def _show_random_verb(callback: CallbackQuery):
+    """Показать случайный глагол из индекса в памяти (без обращения к базе)"""
+    verb = verb_index.random()
+    if verb:
+        text = f"{verb.verb_form1} – {verb.verb_form2} – {verb.verb_form3}\n"
+        text += f"{verb.translation}\n\n"
+        if verb.example_form2:
+            text += f"{verb.example_form2}\n"
+        if verb.example_form3:
+            text += f"{verb.example_form3}"
         
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="Дальше", callback_data="eng_next")],
@@ -608,42 +630,24 @@ async def eng_verbs_handler(callback: CallbackQuery):
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="Назад", callback_data="back_to_eng_main")]
         ])
-        await callback.message.edit_text("База глаголов пуста.", reply_markup=keyboard)
+        try:
+            await callback.message.edit_caption(caption="База глаголов пуста.", reply_markup=keyboard)
+        except:
+            await callback.message.edit_text("База глаголов пуста.", reply_markup=keyboard)
+
+
+@dp.callback_query(F.data == "eng_verbs")
+async def eng_verbs_handler(callback: CallbackQuery):
+    """Обработчик неправильных глаголов"""
+    await callback.answer()
+    await _show_random_verb(callback)
 
 
 @dp.callback_query(F.data == "eng_next")
 async def eng_next_verb(callback: CallbackQuery):
     """Следующий неправильный глагол"""
     await callback.answer()
-    import random
-    verbs = db.get_all_irregular_verbs()
-    if verbs:
-        verb = random.choice(verbs)
-        text = f"{verb['verb_form1']} – {verb['verb_form2']} – {verb['verb_form3']}\n"
-        text += f"{verb['translation']}\n\n"
-        if verb.get('example_form2'):
-            text += f"{verb['example_form2']}\n"
-        if verb.get('example_form3'):
-            text += f"{verb['example_form3']}"
-        
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="Дальше", callback_data="eng_next")],
-            [InlineKeyboardButton(text="Назад", callback_data="back_to_eng_main")]
-        ])
-        # Редактируем caption фото-сообщения
-        try:
-            await callback.message.edit_caption(caption=text, reply_markup=keyboard)
-        except:
-            # Если не получилось (например, это текстовое сообщение), редактируем текст
-            await callback.message.edit_text(text, reply_markup=keyboard)
-    else:
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="Назад", callback_data="back_to_eng_main")]
-        ])
-        try:
-            await callback.message.edit_caption(caption="База глаголов пуста.", reply_markup=keyboard)
-        except:
-            await callback.message.edit_text("База глаголов пуста.", reply_markup=keyboard)
+    await _show_random_verb(callback)
 
 
 @dp.callback_query(F.data == "eng_vocabulary")
@@ -697,7 +701,7 @@ async def eng_training_handler(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     user_id = callback.from_user.id
     
-    plans_list = db.get_all_eng_plans(user_id)
+    plans_list = await db.get_all_eng_plans(user_id)
     plans = {p['day_of_week']: p['exercises'] for p in plans_list}
     day_names_full = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
     today_weekday = datetime.now().weekday()
@@ -736,7 +740,7 @@ async def eng_day_handler(callback: CallbackQuery, state: FSMContext):
     today_weekday = datetime.now().weekday()
     is_today = day_of_week == today_weekday
     
-    plan = db.get_eng_plan(user_id, day_of_week)
+    plan = await db.get_eng_plan(user_id, day_of_week)
     has_plan = bool(plan)
     
     if has_plan:
@@ -795,10 +799,10 @@ async def process_eng_single_day(message: Message, state: FSMContext):
     
     exercises = message.text.strip() if message.text else ""
     if exercises:
-        db.set_eng_plan(user_id, day_of_week, exercises)
+        await db.set_eng_plan(user_id, day_of_week, exercises)
         await state.clear()
         
-        plans_list = db.get_all_eng_plans(user_id)
+        plans_list = await db.get_all_eng_plans(user_id)
         plans = {p['day_of_week']: p['exercises'] for p in plans_list}
         day_names_full = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
         today_weekday = datetime.now().weekday()
@@ -833,9 +837,9 @@ async def eng_delete_day_handler(callback: CallbackQuery):
     day_names = ["понедельник", "вторник", "среду", "четверг", "пятницу", "субботу", "воскресенье"]
     day_name = day_names[day_of_week]
     
-    db.delete_eng_plan(user_id, day_of_week)
+    await db.delete_eng_plan(user_id, day_of_week)
     
-    plans_list = db.get_all_eng_plans(user_id)
+    plans_list = await db.get_all_eng_plans(user_id)
     plans = {p['day_of_week']: p['exercises'] for p in plans_list}
     day_names_full = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
     today_weekday = datetime.now().weekday()
@@ -870,7 +874,7 @@ async def eng_done_handler(callback: CallbackQuery, state: FSMContext):
     day_of_week = int(callback.data.split("_")[-1])
     today = datetime.now().strftime("%Y-%m-%d")
     
-    plan = db.get_eng_plan(user_id, day_of_week)
+    plan = await db.get_eng_plan(user_id, day_of_week)
     if not plan:
         await callback.message.answer("Нет плана на этот день.")
         return
@@ -918,14 +922,14 @@ async def eng_report_exercise_callback(callback: CallbackQuery, state: FSMContex
     
     completed = callback.data == "eng_report_yes"
     results.append((idx, exercises[idx], completed))
-    db.mark_eng_exercise_completed(user_id, report_date, day_of_week, idx, exercises[idx], completed)
+    await db.mark_eng_exercise_completed(user_id, report_date, day_of_week, idx, exercises[idx], completed)
     
     if idx + 1 >= len(exercises):
         completed_count = sum(1 for _, _, c in results if c)
         await state.clear()
         day_names_full = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
         text = f"Отчёт за {day_names_full[day_of_week]} сохранён: {completed_count}/{len(exercises)} выполнено.\n\n"
-        plans_list = db.get_all_eng_plans(user_id)
+        plans_list = await db.get_all_eng_plans(user_id)
         plans = {p['day_of_week']: p['exercises'] for p in plans_list}
         for i, name in enumerate(day_names_full):
             marker = "[+]" if i in plans and plans[i] else "[-]"
@@ -957,14 +961,14 @@ async def eng_skip_handler(callback: CallbackQuery):
     day_of_week = int(callback.data.split("_")[-1])
     today = datetime.now().strftime("%Y-%m-%d")
     
-    plan = db.get_eng_plan(user_id, day_of_week)
+    plan = await db.get_eng_plan(user_id, day_of_week)
     exercises = [ex.strip() for ex in (plan or "").split('\n') if ex.strip()]
     
     for idx, ex in enumerate(exercises):
-        db.mark_eng_exercise_completed(user_id, today, day_of_week, idx, ex, False)
+        await db.mark_eng_exercise_completed(user_id, today, day_of_week, idx, ex, False)
     
     day_names_full = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
-    plans_list = db.get_all_eng_plans(user_id)
+    plans_list = await db.get_all_eng_plans(user_id)
     plans = {p['day_of_week']: p['exercises'] for p in plans_list}
     text = f"Отчёт за {day_names_full[day_of_week]}: всё пропущено.\n\nПлан ENG на неделю:\n\n"
     for i, name in enumerate(day_names_full):
@@ -1032,7 +1036,7 @@ async def process_vocab_translation(message: Message, state: FSMContext):
     
     if word and explanation and translation:
         try:
-            db.add_vocabulary_word(user_id, word, explanation, translation)
+            await db.add_vocabulary_word(user_id, word, explanation, translation)
             await message.answer(f"Слово '{word}' добавлено в словарь!")
             
             # Показываем меню "Учить слова" после успешного добавления
@@ -1088,7 +1092,7 @@ async def vocab_start_handler(callback: CallbackQuery):
     await callback.answer()
     user_id = callback.from_user.id
     
-    words = db.get_words_for_review(user_id)
+    words = await db.get_words_for_review(user_id)
     
     if not words:
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -1124,7 +1128,7 @@ async def vocab_flip_handler(callback: CallbackQuery):
     user_id = callback.from_user.id
     
     word_id = int(callback.data.split("_")[-1])
-    word = db.get_vocabulary_word_by_id(user_id, word_id)
+    word = await db.get_vocabulary_word_by_id(user_id, word_id)
     
     if not word:
         await callback.message.edit_text("Слово не найдено.")
@@ -1151,10 +1155,10 @@ async def vocab_correct_handler(callback: CallbackQuery):
     user_id = callback.from_user.id
     
     word_id = int(callback.data.split("_")[-1])
-    db.update_word_review(user_id, word_id, success=True)
+    await db.update_word_review(user_id, word_id, success=True)
     
     # Показываем следующее слово
-    words = db.get_words_for_review(user_id)
+    words = await db.get_words_for_review(user_id)
     
     if not words:
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -1187,10 +1191,10 @@ async def vocab_incorrect_handler(callback: CallbackQuery):
     user_id = callback.from_user.id
     
     word_id = int(callback.data.split("_")[-1])
-    db.update_word_review(user_id, word_id, success=False)
+    await db.update_word_review(user_id, word_id, success=False)
     
     # Показываем следующее слово (это слово будет показано чаще из-за низкого ease_factor)
-    words = db.get_words_for_review(user_id)
+    words = await db.get_words_for_review(user_id)
     
     if not words:
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -1225,7 +1229,7 @@ async def vocab_skip_handler(callback: CallbackQuery):
     word_id = int(callback.data.split("_")[-1])
     
     # Показываем следующее слово
-    words = db.get_words_for_review(user_id)
+    words = await db.get_words_for_review(user_id)
     
     # Фильтруем текущее слово
     words = [w for w in words if w['id'] != word_id]
@@ -1277,10 +1281,10 @@ async def vocab_delete_page_handler(callback: CallbackQuery):
 async def show_vocab_delete_page(callback: CallbackQuery, page: int = 0):
     """Показать страницу со словами для удаления"""
     user_id = callback.from_user.id
-    words = db.get_all_vocabulary_words(user_id)
+    total_words = await db.count_vocabulary_words(user_id)
     words_per_page = 10
     
-    if not words:
+    if not total_words:
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="Назад", callback_data="eng_vocabulary")]
         ])
@@ -1290,16 +1294,15 @@ async def show_vocab_delete_page(callback: CallbackQuery, page: int = 0):
             await callback.message.edit_text("Словарь пуст. Нечего удалять.", reply_markup=keyboard)
         return
     
-    total_pages = (len(words) + words_per_page - 1) // words_per_page
+    total_pages = (total_words + words_per_page - 1) // words_per_page
     if page < 0:
         page = 0
     if page >= total_pages:
         page = total_pages - 1
     
-    # Получаем слова для текущей страницы
+    # Получаем из базы только слова текущей страницы
     start_idx = page * words_per_page
-    end_idx = start_idx + words_per_page
-    page_words = words[start_idx:end_idx]
+    page_words = await db.get_vocabulary_words_page(user_id, words_per_page, start_idx)
     
     # Формируем текст с информацией о странице
     text = f"Выбери слово для удаления:\nСтраница {page + 1} из {total_pages}\n\n"
@@ -1354,34 +1357,28 @@ async def vocab_delete_word_handler(callback: CallbackQuery):
     user_id = callback.from_user.id
     
     word_id = int(callback.data.split("_")[-1])
-    word = db.get_vocabulary_word_by_id(user_id, word_id)
+    word = await db.get_vocabulary_word_by_id(user_id, word_id)
     
     if not word:
         await callback.message.edit_text("Слово не найдено.")
         return
     
-    # Определяем текущую страницу для возврата
-    # Получаем все слова и находим индекс удаленного
-    all_words = db.get_all_vocabulary_words(user_id)
-    word_index = None
-    for i, w in enumerate(all_words):
-        if w['id'] == word_id:
-            word_index = i
-            break
+    # Определяем текущую страницу для возврата по позиции удаляемого слова
+    word_index = await db.get_vocabulary_word_position(user_id, word_id)
     
     current_page = 0
     if word_index is not None:
         current_page = word_index // 10
     
     # Удаляем слово
-    success = db.delete_vocabulary_word(user_id, word_id)
+    success = await db.delete_vocabulary_word(user_id, word_id)
     
     if success:
         # После удаления возвращаемся на ту же страницу (или предыдущую, если удалили последнее слово)
         # Проверяем, остались ли слова на текущей странице
-        remaining_words = db.get_all_vocabulary_words(user_id)
+        remaining_words = await db.count_vocabulary_words(user_id)
         words_per_page = 10
-        total_pages = (len(remaining_words) + words_per_page - 1) // words_per_page if remaining_words else 0
+        total_pages = (remaining_words + words_per_page - 1) // words_per_page
         
         # Если страница стала пустой, переходим на предыдущую
         if current_page >= total_pages and total_pages > 0:
@@ -1434,12 +1431,8 @@ async def vocab_delete_all_handler(callback: CallbackQuery):
     await callback.answer()
     user_id = callback.from_user.id
     
-    words = db.get_all_vocabulary_words(user_id)
-    count = len(words)
-    
-    # Удаляем все слова
-    for word in words:
-        db.delete_vocabulary_word(user_id, word['id'])
+    # Удаляем все слова одним запросом
+    count = await db.delete_all_vocabulary_words(user_id)
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="Назад", callback_data="eng_vocabulary")]
@@ -1461,7 +1454,7 @@ async def vocab_export_handler(callback: CallbackQuery):
     user_id = callback.from_user.id
     
     try:
-        csv_content = db.export_vocabulary_to_csv(user_id)
+        csv_content = await db.export_vocabulary_to_csv(user_id)
         
         # Отправляем файл
         from io import BytesIO
@@ -1527,7 +1520,7 @@ async def process_vocab_file(message: Message, state: FSMContext):
         
         # Импортируем слова
         user_id = message.from_user.id
-        count = db.import_vocabulary_from_csv(user_id, csv_content)
+        count = await db.import_vocabulary_from_csv(user_id, csv_content)
         
         if count > 0:
             await message.answer(f"Загружено {count} слов в словарь!")
@@ -1553,14 +1546,12 @@ async def anal_stats_handler(callback: CallbackQuery):
     user_id = callback.from_user.id
     await callback.message.answer("Генерирую графики статистики...")
     
-    sessions = db.get_detailed_sessions(user_id, days=14)
-    if not sessions:
-        await callback.message.answer("Недостаточно данных для анализа.", reply_markup=get_main_keyboard())
-        return
-    
     try:
-        stats_buf = generate_stats_charts(sessions)
-        photo_file = BufferedInputFile(stats_buf.read(), filename="stats.png")
+        stats_png = await user_stats_png(user_id)
+        if stats_png is None:
+            await callback.message.answer("Недостаточно данных для анализа.", reply_markup=get_main_keyboard())
+            return
+        photo_file = BufferedInputFile(stats_png, filename="stats.png")
         await callback.message.answer_photo(
             photo=photo_file,
             caption="Статистика: сессии по дням, средняя длительность, процент завершённых"
@@ -1675,7 +1666,7 @@ async def process_task_description(message: Message, state: FSMContext):
     if description == "-":
         description = None
     
-    task_id = db.add_focus_task(user_id, task_name, description)
+    task_id = await db.add_focus_task(user_id, task_name, description)
     # Отправляем фото с кнопками управления задачами
     try:
         photo = FSInputFile("images/focus.jpg")
@@ -1694,7 +1685,7 @@ async def focus_start_session_handler(callback: CallbackQuery, state: FSMContext
     """Обработчик начала сессии - показываем список задач"""
     await callback.answer()
     user_id = callback.from_user.id
-    tasks = db.get_all_focus_tasks(user_id)
+    tasks = await db.get_all_focus_tasks(user_id)
     
     if not tasks:
         # Пытаемся отредактировать фото с кнопками управления задачами
@@ -1752,7 +1743,7 @@ async def focus_task_selected_handler(callback: CallbackQuery, state: FSMContext
     await callback.answer()
     user_id = callback.from_user.id
     task_id = int(callback.data.split("_")[-1])
-    task = db.get_focus_task_by_id(user_id, task_id)
+    task = await db.get_focus_task_by_id(user_id, task_id)
     
     if not task:
         await callback.message.answer("Задача не найдена.", reply_markup=get_main_keyboard())
@@ -1972,7 +1963,7 @@ async def focus_edit_tasks_handler(callback: CallbackQuery, state: FSMContext):
     """Обработчик редактирования задач"""
     await callback.answer()
     user_id = callback.from_user.id
-    tasks = db.get_all_focus_tasks(user_id)
+    tasks = await db.get_all_focus_tasks(user_id)
     
     if not tasks:
         # Пытаемся отредактировать фото с кнопками управления задачами
@@ -2028,7 +2019,7 @@ async def focus_edit_task_handler(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
     user_id = callback.from_user.id
     task_id = int(callback.data.split("_")[-1])
-    task = db.get_focus_task_by_id(user_id, task_id)
+    task = await db.get_focus_task_by_id(user_id, task_id)
     
     if not task:
         await callback.message.answer("Задача не найдена.", reply_markup=get_main_keyboard())
@@ -2051,9 +2042,9 @@ async def process_task_edit(message: Message, state: FSMContext):
     new_name = message.text.strip() if message.text else ""
     
     if task_id and new_name:
-        task = db.get_focus_task_by_id(user_id, task_id)
+        task = await db.get_focus_task_by_id(user_id, task_id)
         if task:
-            db.update_focus_task(user_id, task_id, new_name, task.get('description'))
+            await db.update_focus_task(user_id, task_id, new_name, task.get('description'))
             # Отправляем фото с кнопками управления задачами
             try:
                 photo = FSInputFile("images/focus.jpg")
@@ -2093,7 +2084,7 @@ async def focus_delete_tasks_handler(callback: CallbackQuery, state: FSMContext)
     """Обработчик удаления задач"""
     await callback.answer()
     user_id = callback.from_user.id
-    tasks = db.get_all_focus_tasks(user_id)
+    tasks = await db.get_all_focus_tasks(user_id)
     
     if not tasks:
         # Пытаемся отредактировать фото с кнопками управления задачами
@@ -2149,10 +2140,10 @@ async def focus_delete_task_handler(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
     user_id = callback.from_user.id
     task_id = int(callback.data.split("_")[-1])
-    task = db.get_focus_task_by_id(user_id, task_id)
+    task = await db.get_focus_task_by_id(user_id, task_id)
     
     if task:
-        db.delete_focus_task(user_id, task_id)
+        await db.delete_focus_task(user_id, task_id)
         # Пытаемся отредактировать фото с кнопками управления задачами
         try:
             photo = FSInputFile("images/focus.jpg")
@@ -2237,7 +2228,7 @@ async def focus_delete_stats_confirm_handler(callback: CallbackQuery):
     user_id = callback.from_user.id
     
     # Удаляем все статистические данные для этого пользователя
-    success = db.delete_all_stats(user_id)
+    success = await db.delete_all_stats(user_id)
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
     ])
@@ -2282,7 +2273,7 @@ async def workout_training_handler(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     
     # Получаем все планы пользователя
-    plans_list = db.get_all_workout_plans(user_id)
+    plans_list = await db.get_all_workout_plans(user_id)
     # Преобразуем в словарь {day_of_week: exercises}
     plans = {p['day_of_week']: p['exercises'] for p in plans_list}
     
@@ -2351,7 +2342,7 @@ async def workout_day_handler(callback: CallbackQuery, state: FSMContext):
     today_weekday = datetime.now().weekday()
     is_today = day_of_week == today_weekday
     
-    plan = db.get_workout_plan(user_id, day_of_week)
+    plan = await db.get_workout_plan(user_id, day_of_week)
     has_plan = bool(plan)
     
     if has_plan:
@@ -2423,11 +2414,11 @@ async def process_workout_single_day(message: Message, state: FSMContext):
     
     exercises = message.text.strip() if message.text else ""
     if exercises:
-        db.set_workout_plan(user_id, day_of_week, exercises)
+        await db.set_workout_plan(user_id, day_of_week, exercises)
         await state.clear()
         
         # Возвращаемся к таблице дней с картинкой
-        plans_list = db.get_all_workout_plans(user_id)
+        plans_list = await db.get_all_workout_plans(user_id)
         plans = {p['day_of_week']: p['exercises'] for p in plans_list}
         
         day_names_full = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
@@ -2472,10 +2463,10 @@ async def workout_delete_day_handler(callback: CallbackQuery):
     day_name = day_names[day_of_week]
     
     # Удаляем план (устанавливаем пустую строку)
-    db.delete_workout_plan(user_id, day_of_week)
+    await db.delete_workout_plan(user_id, day_of_week)
     
     # Возвращаемся к таблице дней
-    plans_list = db.get_all_workout_plans(user_id)
+    plans_list = await db.get_all_workout_plans(user_id)
     plans = {p['day_of_week']: p['exercises'] for p in plans_list}
     
     day_names_full = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
@@ -2516,7 +2507,7 @@ async def process_workout_monday(message: Message, state: FSMContext):
     user_id = message.from_user.id
     exercises = message.text.strip() if message.text else ""
     if exercises:
-        db.set_workout_plan(user_id, 0, exercises)
+        await db.set_workout_plan(user_id, 0, exercises)
         await message.answer("План на понедельник сохранен.\n\nКакие упражнения на вторник?", reply_markup=get_back_to_workout_keyboard())
         await state.set_state(WorkoutStates.waiting_plan_tuesday)
     else:
@@ -2529,7 +2520,7 @@ async def process_workout_tuesday(message: Message, state: FSMContext):
     user_id = message.from_user.id
     exercises = message.text.strip() if message.text else ""
     if exercises:
-        db.set_workout_plan(user_id, 1, exercises)
+        await db.set_workout_plan(user_id, 1, exercises)
         await message.answer("План на вторник сохранен.\n\nКакие упражнения на среду?", reply_markup=get_back_to_workout_keyboard())
         await state.set_state(WorkoutStates.waiting_plan_wednesday)
     else:
@@ -2542,7 +2533,7 @@ async def process_workout_wednesday(message: Message, state: FSMContext):
     user_id = message.from_user.id
     exercises = message.text.strip() if message.text else ""
     if exercises:
-        db.set_workout_plan(user_id, 2, exercises)
+        await db.set_workout_plan(user_id, 2, exercises)
         await message.answer("План на среду сохранен.\n\nКакие упражнения на четверг?", reply_markup=get_back_to_workout_keyboard())
         await state.set_state(WorkoutStates.waiting_plan_thursday)
     else:
@@ -2555,7 +2546,7 @@ async def process_workout_thursday(message: Message, state: FSMContext):
     user_id = message.from_user.id
     exercises = message.text.strip() if message.text else ""
     if exercises:
-        db.set_workout_plan(user_id, 3, exercises)
+        await db.set_workout_plan(user_id, 3, exercises)
         await message.answer("План на четверг сохранен.\n\nКакие упражнения на пятницу?", reply_markup=get_back_to_workout_keyboard())
         await state.set_state(WorkoutStates.waiting_plan_friday)
     else:
@@ -2568,7 +2559,7 @@ async def process_workout_friday(message: Message, state: FSMContext):
     user_id = message.from_user.id
     exercises = message.text.strip() if message.text else ""
     if exercises:
-        db.set_workout_plan(user_id, 4, exercises)
+        await db.set_workout_plan(user_id, 4, exercises)
         await message.answer("План на пятницу сохранен.\n\nКакие упражнения на субботу?", reply_markup=get_back_to_workout_keyboard())
         await state.set_state(WorkoutStates.waiting_plan_saturday)
     else:
@@ -2581,7 +2572,7 @@ async def process_workout_saturday(message: Message, state: FSMContext):
     user_id = message.from_user.id
     exercises = message.text.strip() if message.text else ""
     if exercises:
-        db.set_workout_plan(user_id, 5, exercises)
+        await db.set_workout_plan(user_id, 5, exercises)
         await message.answer("План на субботу сохранен.\n\nКакие упражнения на воскресенье?", reply_markup=get_back_to_workout_keyboard())
         await state.set_state(WorkoutStates.waiting_plan_sunday)
     else:
@@ -2594,7 +2585,7 @@ async def process_workout_sunday(message: Message, state: FSMContext):
     user_id = message.from_user.id
     exercises = message.text.strip() if message.text else ""
     if exercises:
-        db.set_workout_plan(user_id, 6, exercises)
+        await db.set_workout_plan(user_id, 6, exercises)
         await message.answer("План на воскресенье сохранен.\n\nПлан тренировок на неделю готов.")
         
         # Возвращаем на страницу WORKOUT
@@ -2627,7 +2618,7 @@ async def workout_done_handler(callback: CallbackQuery, state: FSMContext):
     day_of_week = int(callback.data.split("_")[-1])
     today = datetime.now().date().isoformat()
     
-    plan = db.get_workout_plan(user_id, day_of_week)
+    plan = await db.get_workout_plan(user_id, day_of_week)
     if not plan:
         await callback.message.answer("Нет плана на этот день.")
         return
@@ -2675,13 +2666,13 @@ async def workout_report_exercise_callback(callback: CallbackQuery, state: FSMCo
     
     completed = callback.data == "workout_report_yes"
     results.append((idx, exercises[idx], completed))
-    db.mark_workout_exercise_completed(user_id, report_date, day_of_week, idx, exercises[idx], completed)
+    await db.mark_workout_exercise_completed(user_id, report_date, day_of_week, idx, exercises[idx], completed)
     
     if idx + 1 >= len(exercises):
         completed_count = sum(1 for _, _, c in results if c)
-        db.mark_workout_completed(user_id, report_date, day_of_week, completed_count > 0)
+        await db.mark_workout_completed(user_id, report_date, day_of_week, completed_count > 0)
         await state.clear()
-        plans_list = db.get_all_workout_plans(user_id)
+        plans_list = await db.get_all_workout_plans(user_id)
         plans = {p['day_of_week']: p['exercises'] for p in plans_list}
         day_names_full = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
         text = f"Отчёт за {day_names_full[day_of_week]} сохранён: {completed_count}/{len(exercises)} выполнено.\n\nПлан тренировок на неделю:\n\n"
@@ -2727,15 +2718,15 @@ async def workout_skip_handler(callback: CallbackQuery):
     day_of_week = int(callback.data.split("_")[-1])
     today = datetime.now().date().isoformat()
     
-    plan = db.get_workout_plan(user_id, day_of_week)
+    plan = await db.get_workout_plan(user_id, day_of_week)
     exercises = [ex.strip() for ex in (plan or "").split('\n') if ex.strip()]
     
     for idx, ex in enumerate(exercises):
-        db.mark_workout_exercise_completed(user_id, today, day_of_week, idx, ex, False)
-    db.mark_workout_completed(user_id, today, day_of_week, False)
+        await db.mark_workout_exercise_completed(user_id, today, day_of_week, idx, ex, False)
+    await db.mark_workout_completed(user_id, today, day_of_week, False)
     
     # Возвращаемся к таблице дней
-    plans_list = db.get_all_workout_plans(user_id)
+    plans_list = await db.get_all_workout_plans(user_id)
     plans = {p['day_of_week']: p['exercises'] for p in plans_list}
     
     day_names_full = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
@@ -2774,28 +2765,29 @@ async def workout_analysis_handler(callback: CallbackQuery):
     """Обработчик WORKOUT → Анализ нагрузки"""
     await callback.answer()
     user_id = callback.from_user.id
-    # Получаем данные за последние 14 дней
-    completions = db.get_workout_completions(user_id, 14)
+    # Дневные итоги за последние 14 дней (не больше 14 строк)
+    daily = await db.get_daily_stats(user_id, 14)
+    workout_days = [day for day in daily if day['workout_done'] or day['workout_skipped']]
     
-    if not completions:
+    if not workout_days:
         try:
             await callback.message.edit_text("Недостаточно данных для анализа. Выполни несколько тренировок.")
         except:
             await callback.message.answer("Недостаточно данных для анализа. Выполни несколько тренировок.")
         return
     
-    # Анализируем двухнедельные циклы
+    # Анализируем двухнедельные циклы: день засчитан, если выполнено хотя бы одно упражнение
     from collections import defaultdict
     by_week = defaultdict(lambda: {"completed": 0, "skipped": 0, "days": []})
     
-    for comp in completions:
-        date_obj = datetime.fromisoformat(comp['date'])
+    for day in workout_days:
+        date_obj = datetime.fromisoformat(day['date'])
         week_num = date_obj.isocalendar()[1]  # Номер недели года
-        if comp['completed']:
+        if day['workout_done']:
             by_week[week_num]["completed"] += 1
         else:
             by_week[week_num]["skipped"] += 1
-        by_week[week_num]["days"].append(comp['day_of_week'])
+        by_week[week_num]["days"].append(date_obj.weekday())
     
     # Формируем рекомендации
     text = "Анализ нагрузки за последние 2 недели:\n\n"
@@ -2893,7 +2885,7 @@ async def process_focus_description(message: Message, state: FSMContext):
     status = "completed" if focus_status == "✅" else ("dropped" if focus_status == "❌" else "completed")
     
     # Сохраняем детальную сессию
-    db.add_detailed_session(
+    await db.add_detailed_session(
         user_id=user_id,
         domain=task_name,  # Используем название задачи как domain
         task_type="custom",  # Тип задачи - кастомная
@@ -2905,7 +2897,7 @@ async def process_focus_description(message: Message, state: FSMContext):
     )
     
     # Также сохраняем в старую таблицу для совместимости
-    db.add_focus_session(
+    await db.add_focus_session(
         user_id=user_id,
         direction=task_name,
         duration=actual_minutes,
@@ -2953,7 +2945,7 @@ async def dump_list(callback: CallbackQuery, state: FSMContext):
     """Обработка кнопки списка записей"""
     await callback.answer()
     user_id = callback.from_user.id
-    dumps = db.get_all_brain_dumps(user_id, limit=20)
+    dumps = await db.get_all_brain_dumps(user_id, limit=20)
     
     if not dumps:
         await callback.message.edit_text("Записей пока нет.", reply_markup=get_back_to_dump_keyboard())
@@ -2987,7 +2979,7 @@ async def dump_view(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
     user_id = callback.from_user.id
     dump_id = int(callback.data.split("_")[-1])
-    dump = db.get_brain_dump_by_id(user_id, dump_id)
+    dump = await db.get_brain_dump_by_id(user_id, dump_id)
     
     if not dump:
         await callback.message.edit_text("Запись не найдена.", reply_markup=get_back_to_dump_keyboard())
@@ -3014,7 +3006,7 @@ async def dump_edit_start(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
     user_id = callback.from_user.id
     dump_id = int(callback.data.split("_")[-1])
-    dump = db.get_brain_dump_by_id(user_id, dump_id)
+    dump = await db.get_brain_dump_by_id(user_id, dump_id)
     
     if dump:
         await callback.message.edit_text(f"Редактируй запись:\n\n{dump['content']}")
@@ -3029,7 +3021,7 @@ async def dump_delete(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     dump_id = int(callback.data.split("_")[-1])
     
-    if db.delete_brain_dump(user_id, dump_id):
+    if await db.delete_brain_dump(user_id, dump_id):
         # После удаления возвращаемся к списку записей
         await dump_list(callback, state)
     else:
@@ -3044,7 +3036,7 @@ async def process_dump(message: Message, state: FSMContext):
     content = message.text.strip() if message.text else ""
     
     if content:
-        db.add_brain_dump(user_id, content)
+        await db.add_brain_dump(user_id, content)
         
         # Предлагаем выбрать одну вещь
         keyboard = InlineKeyboardMarkup(inline_keyboard=[[
@@ -3071,7 +3063,7 @@ async def process_dump_edit(message: Message, state: FSMContext):
     new_content = message.text.strip() if message.text else ""
     
     if dump_id and new_content:
-        if db.update_brain_dump(user_id, dump_id, new_content):
+        if await db.update_brain_dump(user_id, dump_id, new_content):
             # Возвращаемся к просмотру записи
             keyboard = InlineKeyboardMarkup(inline_keyboard=[[
                 InlineKeyboardButton(text="Редактировать", callback_data=f"dump_edit_{dump_id}"),
@@ -3079,7 +3071,7 @@ async def process_dump_edit(message: Message, state: FSMContext):
             ], [
                 InlineKeyboardButton(text="Назад к списку", callback_data="dump_list")
             ]])
-            dump = db.get_brain_dump_by_id(user_id, dump_id)
+            dump = await db.get_brain_dump_by_id(user_id, dump_id)
             if dump:
                 date_time = dump["created_at"][:16].replace("T", " ")
                 text = f"📝 Запись #{dump_id}\n📅 {date_time}\n\n{dump['content']}"
@@ -3180,14 +3172,12 @@ async def cmd_productivity(message_or_callback, state: FSMContext):
     
     await message.answer("Генерирую тепловую карту...")
     
-    sessions = db.get_combined_sessions_for_heatmap(user_id, days=14)
-    if not sessions:
-        await message.answer("Недостаточно данных для анализа.", reply_markup=get_main_keyboard())
-        return
-    
     try:
-        heatmap_buf = generate_productivity_heatmap(sessions)
-        photo_file = BufferedInputFile(heatmap_buf.read(), filename="productivity.png")
+        heatmap_png = await user_heatmap_png(user_id)
+        if heatmap_png is None:
+            await message.answer("Недостаточно данных для анализа.", reply_markup=get_main_keyboard())
+            return
+        photo_file = BufferedInputFile(heatmap_png, filename="productivity.png")
         await message.answer_photo(
             photo=photo_file,
             caption="Тепловая карта продуктивности (успешность по часам и дням недели)"
@@ -3202,14 +3192,12 @@ async def cmd_stats(message: Message):
     user_id = message.from_user.id
     await message.answer("Генерирую графики статистики...")
     
-    sessions = db.get_detailed_sessions(user_id, days=14)
-    if not sessions:
-        await message.answer("Недостаточно данных для анализа.", reply_markup=get_main_keyboard())
-        return
-    
     try:
-        stats_buf = generate_stats_charts(sessions)
-        photo_file = BufferedInputFile(stats_buf.read(), filename="stats.png")
+        stats_png = await user_stats_png(user_id)
+        if stats_png is None:
+            await message.answer("Недостаточно данных для анализа.", reply_markup=get_main_keyboard())
+            return
+        photo_file = BufferedInputFile(stats_png, filename="stats.png")
         await message.answer_photo(
             photo=photo_file,
             caption="Статистика: сессии по дням, средняя длительность, процент завершённых"
@@ -3218,6 +3206,46 @@ async def cmd_stats(message: Message):
         await message.answer(f"Ошибка при генерации графика: {e}", reply_markup=get_main_keyboard())
 
 
+@dp.message(Command("timezone"))
+async def cmd_timezone(message: Message):
+    """Часовой пояс для push-уведомлений: /timezone Europe/Moscow, /timezone reset — пояс сервера"""
+    user_id = message.from_user.id
+    parts = (message.text or "").split(maxsplit=1)
+    
+    if len(parts) < 2:
+        timezone = await db.get_user_timezone(user_id)
+        current = f"по поясу {timezone}" if timezone else "по времени сервера"
+        await message.answer(
+            f"Уведомления приходят в {NOTIFICATION_HOUR}:00 {current}.\n"
+            "Сменить пояс: /timezone Europe/Moscow (название из базы IANA), "
+            "вернуть время сервера: /timezone reset",
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    name = parts[1].strip()
+    if name.lower() == "reset":
+        await db.set_user_timezone(user_id, None)
+        await message.answer(
+            f"Уведомления будут приходить в {NOTIFICATION_HOUR}:00 по времени сервера.",
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    try:
+        timezone = resolve_timezone(name)
+    except ValueError as e:
+        await message.answer(f"{e}. Пример: /timezone Europe/Moscow", reply_markup=get_main_keyboard())
+        return
+    
+    await db.set_user_timezone(user_id, timezone)
+    await message.answer(
+        f"Часовой пояс: {timezone} (сейчас там {local_now(timezone):%H:%M}). "
+        f"Уведомления будут приходить в {NOTIFICATION_HOUR}:00 по этому времени.",
+        reply_markup=get_main_keyboard()
+    )
+
+
 # Поиск информации
 @dp.message(Command("search"))
 @dp.callback_query(F.data == "cmd_search")
@@ -3272,10 +3300,10 @@ async def process_search(message: Message, state: FSMContext):
 
 
 # Трекинг сна
-def _sleep_menu_keyboard(user_id: int, show_continue: bool = True) -> InlineKeyboardMarkup:
+async def _sleep_menu_keyboard(user_id: int, show_continue: bool = True) -> InlineKeyboardMarkup:
     """Клавиатура меню сна. При show_continue и наличии завершённого сна сегодня добавляет кнопку «Продолжить сон»."""
     row1 = [InlineKeyboardButton(text="Лёг спать", callback_data="sleep_start")]
-    if show_continue and db.has_completed_sleep_today(user_id):
+    if show_continue and await db.has_completed_sleep_today(user_id):
         row1.append(InlineKeyboardButton(text="Продолжить сон", callback_data="sleep_continue"))
     keyboard_rows = [
         row1,
@@ -3300,7 +3328,7 @@ async def cmd_sleep(message_or_callback, state: FSMContext):
         user_id = message.from_user.id
     
     # Проверяем, есть ли незавершенная запись
-    latest_sleep = db.get_latest_sleep_record(user_id)
+    latest_sleep = await db.get_latest_sleep_record(user_id)
     
     if latest_sleep:
         # Есть незавершенная запись - предлагаем завершить
@@ -3315,7 +3343,7 @@ async def cmd_sleep(message_or_callback, state: FSMContext):
         await message.answer("Есть незавершенная запись сна. Проснулся?", reply_markup=keyboard)
     else:
         # Нет записи - предлагаем начать (с кнопкой «Продолжить сон», если уже был сон сегодня)
-        await message.answer("Трекинг сна:", reply_markup=_sleep_menu_keyboard(user_id))
+        await message.answer("Трекинг сна:", reply_markup=await _sleep_menu_keyboard(user_id))
 
 
 @dp.callback_query(F.data == "sleep_start")
@@ -3323,7 +3351,7 @@ async def sleep_start(callback: CallbackQuery):
     """Начало сна"""
     await callback.answer()
     user_id = callback.from_user.id
-    record_id = db.add_sleep_start(user_id)
+    record_id = await db.add_sleep_start(user_id)
     
     # Возвращаем в меню "Сон" с кнопками управления
     sleep_keyboard = InlineKeyboardMarkup(inline_keyboard=[[
@@ -3364,7 +3392,7 @@ async def sleep_continue(callback: CallbackQuery):
     
     # Время начала сна = текущее время + 30 минут (время засыпания)
     sleep_start_time = datetime.now() + timedelta(minutes=30)
-    record_id = db.add_sleep_start(user_id, sleep_start_time=sleep_start_time)
+    record_id = await db.add_sleep_start(user_id, sleep_start_time=sleep_start_time)
     
     # Возвращаем в меню "Сон" с кнопками управления
     sleep_keyboard = InlineKeyboardMarkup(inline_keyboard=[[
@@ -3397,13 +3425,13 @@ async def sleep_cancel_handler(callback: CallbackQuery):
     user_id = callback.from_user.id
     
     # Удаляем незавершенную запись сна
-    db.delete_latest_sleep_record(user_id)
+    await db.delete_latest_sleep_record(user_id)
     
     # Возвращаем в меню "Сон"
     try:
-        await callback.message.edit_text("Трекинг сна:", reply_markup=_sleep_menu_keyboard(user_id))
+        await callback.message.edit_text("Трекинг сна:", reply_markup=await _sleep_menu_keyboard(user_id))
     except:
-        await callback.message.answer("Трекинг сна:", reply_markup=_sleep_menu_keyboard(user_id))
+        await callback.message.answer("Трекинг сна:", reply_markup=await _sleep_menu_keyboard(user_id))
 
 
 @dp.callback_query(F.data == "sleep_wake")
@@ -3411,14 +3439,14 @@ async def sleep_wake(callback: CallbackQuery):
     """Пробуждение"""
     await callback.answer()
     user_id = callback.from_user.id
-    latest_sleep = db.get_latest_sleep_record(user_id)
+    latest_sleep = await db.get_latest_sleep_record(user_id)
     
     if latest_sleep:
-        duration_minutes = db.complete_sleep(user_id, latest_sleep['id'])
+        duration_minutes = await db.complete_sleep(user_id, latest_sleep['id'])
         duration_hours = (duration_minutes or 0) / 60
         
         # Возвращаем в меню "Сон" (с кнопкой «Продолжить сон», т.к. уже есть завершённый сон сегодня)
-        keyboard = _sleep_menu_keyboard(user_id)
+        keyboard = await _sleep_menu_keyboard(user_id)
         try:
             await callback.message.edit_text(
                 f"Сон зафиксирован.\n\n"
@@ -3451,8 +3479,7 @@ async def sleep_chart(callback: CallbackQuery):
     user_id = callback.from_user.id
     await callback.message.answer("Генерирую график сна...")
     
-    sleep_records = db.get_sleep_records(user_id, days=7)
-    avg_sleep = db.get_average_sleep(user_id, days=7)
+    avg_sleep = await db.get_average_sleep(user_id, days=7)
     
     # Клавиатура с кнопкой "Назад"
     back_keyboard = InlineKeyboardMarkup(inline_keyboard=[[
@@ -3460,7 +3487,7 @@ async def sleep_chart(callback: CallbackQuery):
     ]])
     
     try:
-        chart_buf = generate_sleep_chart(sleep_records)
+        chart_png = await user_sleep_png(user_id)
         caption = f"График сна за неделю"
         if avg_sleep:
             avg_hours = avg_sleep / 60
@@ -3468,7 +3495,7 @@ async def sleep_chart(callback: CallbackQuery):
             if avg_hours < 6:
                 caption += "\n⚠️ Мало сна! Рекомендуется 7-8 часов."
         
-        photo_file = BufferedInputFile(chart_buf.read(), filename="sleep_chart.png")
+        photo_file = BufferedInputFile(chart_png, filename="sleep_chart.png")
         await callback.message.answer_photo(photo=photo_file, caption=caption, reply_markup=back_keyboard)
     except Exception as e:
         await callback.message.answer(f"Ошибка: {e}", reply_markup=back_keyboard)
@@ -3506,29 +3533,29 @@ async def sleep_delete_yes(callback: CallbackQuery):
     await callback.answer()
     user_id = callback.from_user.id
     
-    success = db.delete_all_sleep_records(user_id)
+    success = await db.delete_all_sleep_records(user_id)
     
     if success:
         try:
             await callback.message.edit_text(
                 "✅ Все данные о сне удалены.",
-                reply_markup=_sleep_menu_keyboard(user_id)
+                reply_markup=await _sleep_menu_keyboard(user_id)
             )
         except:
             await callback.message.answer(
                 "✅ Все данные о сне удалены.",
-                reply_markup=_sleep_menu_keyboard(user_id)
+                reply_markup=await _sleep_menu_keyboard(user_id)
             )
     else:
         try:
             await callback.message.edit_text(
                 "❌ Ошибка при удалении данных.",
-                reply_markup=_sleep_menu_keyboard(user_id)
+                reply_markup=await _sleep_menu_keyboard(user_id)
             )
         except:
             await callback.message.answer(
                 "❌ Ошибка при удалении данных.",
-                reply_markup=_sleep_menu_keyboard()
+                reply_markup=await _sleep_menu_keyboard(user_id)
             )
 
 
@@ -3562,17 +3589,17 @@ async def process_export(callback: CallbackQuery):
     
     try:
         if export_type == "sessions":
-            sessions = db.get_detailed_sessions(user_id, days=365)
-            csv_data = export_sessions_to_csv(sessions)
+            sessions = await db.get_detailed_sessions(user_id, days=365)
+            csv_data = await asyncio.to_thread(export_sessions_to_csv, sessions)
             filename = "sessions.csv"
         elif export_type == "english":
-            phrases = db.get_all_english_phrases(user_id)
+            phrases = await db.get_all_english_phrases(user_id)
             reviews = []  # Можно добавить получение reviews
-            csv_data = export_english_to_csv(phrases, reviews)
+            csv_data = await asyncio.to_thread(export_english_to_csv, phrases, reviews)
             filename = "english_progress.csv"
         elif export_type == "sleep":
-            sleep_records = db.get_sleep_records(user_id, days=365)
-            csv_data = export_sleep_to_csv(sleep_records)
+            sleep_records = await db.get_sleep_records(user_id, days=365)
+            csv_data = await asyncio.to_thread(export_sleep_to_csv, sleep_records)
             filename = "sleep.csv"
         else:
             await callback.message.answer("Неизвестный тип экспорта.")
@@ -3769,104 +3796,80 @@ async def setup_webhook():
         raise
 
 
-async def notification_scheduler():
-    """Фоновая задача для автоматических уведомлений (для всех пользователей)"""
-    while True:
-        try:
-            await asyncio.sleep(60)  # Проверяем каждую минуту
-            
-            now = datetime.now()
-            current_hour = now.hour
-            current_minute = now.minute
-            current_weekday = now.weekday()  # 0=понедельник, 6=воскресенье
-            
-            # Получаем всех пользователей из БД
-            all_users = db.get_all_users()
-            if not all_users:
-                continue  # Нет пользователей
-            
-            # Проверяем, что сейчас 20:00
-            if current_hour == 20 and current_minute == 0:
-                for user_id in all_users:
-                    try:
-                        # Уведомление о тепловой карте каждые 14 дней (на 14-й день и далее каждые 14 дней)
-                        days_since_first = db.get_days_since_first_session(user_id)
-                        if days_since_first is not None and days_since_first >= 14 and days_since_first % 14 == 0:
-                            last_notification = db.get_last_heatmap_notification_date(user_id)
-                            today = datetime.now().strftime("%Y-%m-%d")
-                            
-                            if last_notification != today:
-                                # Генерируем тепловую карту и отправляем (FOCUS + WORKOUT + ENG)
-                                sessions = db.get_combined_sessions_for_heatmap(user_id, days=14)
-                                if sessions:
-                                    try:
-                                        heatmap_buf = generate_productivity_heatmap(sessions)
-                                        photo_file = BufferedInputFile(heatmap_buf.read(), filename="productivity.png")
-                                        
-                                        await bot.send_photo(
-                                            chat_id=user_id,
-                                            photo=photo_file,
-                                            caption="Твоя тепловая карта готова. Взгляни!"
-                                        )
-                                        db.mark_heatmap_notification_sent(user_id)
-                                        print(f"Отправлено уведомление о тепловой карте пользователю {user_id}")
-                                    except Exception as e:
-                                        print(f"Ошибка при отправке уведомления о тепловой карте пользователю {user_id}: {e}")
-                        
-                        # Уведомление о графике сна каждое воскресенье
-                        if current_weekday == 6:  # Воскресенье
-                            last_notification = db.get_last_sleep_chart_notification_date(user_id)
-                            today = datetime.now().strftime("%Y-%m-%d")
-                            
-                            if last_notification != today:
-                                # Генерируем график сна и отправляем
-                                sleep_records = db.get_sleep_records(user_id, days=7)
-                                if sleep_records:
-                                    try:
-                                        chart_buf = generate_sleep_chart(sleep_records)
-                                        photo_file = BufferedInputFile(chart_buf.read(), filename="sleep_chart.png")
-                                        
-                                        await bot.send_photo(
-                                            chat_id=user_id,
-                                            photo=photo_file,
-                                            caption="Сделал твой график сна. Взгляни!"
-                                        )
-                                        db.mark_sleep_chart_notification_sent(user_id)
-                                        print(f"Отправлено уведомление о графике сна пользователю {user_id}")
-                                    except Exception as e:
-                                        print(f"Ошибка при отправке уведомления о графике сна пользователю {user_id}: {e}")
-                    except Exception as user_error:
-                        print(f"Ошибка при обработке пользователя {user_id}: {user_error}")
-        except Exception as e:
-            print(f"Ошибка в notification_scheduler: {e}")
-            await asyncio.sleep(60)
+async def send_scheduled_notification(kind: str, user_id: int) -> bool:
+    """
+    Отправка уведомления — задачи из очереди scheduled_jobs (scheduler.py).
+    
+    Кому пора — уже решил Database.enqueue_due_notifications: срок, отсутствие
+    уведомления сегодня и наличие данных за период проверены одним запросом.
+    Раунд выполняется параллельно, поэтому запрос к Telegram идёт через
+    notification_fanout.deliver — с общим лимитом и лимитом на чат.
+    Исключение отсюда — неудачная попытка: после временного сбоя задача
+    повторится позже, а если бот заблокирован (UndeliverableError) — нет. Отметку
+    «отправлено» ставит планировщик — с днём уведомления в поясе пользователя.
+    
+    Returns:
+        True, если уведомление отправлено
+    """
+    if kind == HEATMAP:
+        # Тепловая карта каждые 14 дней (FOCUS + WORKOUT + ENG)
+        png = await user_heatmap_png(user_id)
+        filename, caption = "productivity.png", "Твоя тепловая карта готова. Взгляни!"
+    elif kind == SLEEP_CHART:
+        # График сна каждое воскресенье
+        png = await user_sleep_png(user_id, allow_empty=False)
+        filename, caption = "sleep_chart.png", "Сделал твой график сна. Взгляни!"
+    else:
+        return False
+    if not png:
+        return False
+    
+    photo_file = BufferedInputFile(png, filename=filename)
+    await notification_fanout.deliver(
+        user_id,
+        lambda: bot.send_photo(chat_id=user_id, photo=photo_file, caption=caption)
+    )
+    if kind == HEATMAP:
+        print(f"Отправлено уведомление о тепловой карте пользователю {user_id}")
+    else:
+        print(f"Отправлено уведомление о графике сна пользователю {user_id}")
+    return True
+
+
+# Планировщик спит до ближайшего срока; сроки обновляются по записям в базу,
+# а сами уведомления проходят через очередь scheduled_jobs и переживают перезапуск
+notification_fanout = NotificationFanout(concurrency=int(os.getenv("NOTIFY_CONCURRENCY", "16")))
+notification_scheduler = NotificationScheduler(db, send_scheduled_notification, notification_fanout)
+db.database.add_write_listener(notification_scheduler.on_write)
+
+
+async def init_irregular_verbs():
+    """Досеивает недостающие глаголы и строит индекс verb_index (один раз при старте)"""
+    global verb_index
+    try:
+        added = await db.seed_irregular_verbs(IRREGULAR_VERBS)
+        if added:
+            print(f"Загружено {added} неправильных глаголов")
+        verb_index = VerbIndex.from_rows(await db.get_all_irregular_verbs())
+        print(f"Индекс неправильных глаголов: {len(verb_index)}")
+    except Exception as e:
+        print(f"Ошибка при инициализации глаголов: {e}")
 
 
 @app.on_event("startup")
 async def on_startup():
     """Действия при запуске приложения (только для webhook режима)"""
     print("Бот «Напарник» v2.0 запускается...")
+    print(f"Настройки SQLite: {await db.get_effective_settings()}")
     
-    # Инициализация неправильных глаголов
-    try:
-        verbs = db.get_all_irregular_verbs()
-        if len(verbs) < 50:  # Если глаголов мало, загружаем
-            print("Инициализация базы неправильных глаголов...")
-            count = 0
-            for form1, form2, form3, translation, example2, example3 in IRREGULAR_VERBS:
-                try:
-                    db.add_irregular_verb(form1, form2, form3, translation, example2, example3)
-                    count += 1
-                except:
-                    pass  # Глагол уже существует
-            print(f"Загружено {count} неправильных глаголов")
-    except Exception as e:
-        print(f"Ошибка при инициализации глаголов: {e}")
+    await init_irregular_verbs()
+    # Воркеры рендера импортируют matplotlib в фоне — бот отвечает, не дожидаясь их
+    renderer.start_background()
     
     await setup_webhook()
     
     # Запускаем фоновую задачу для уведомлений
-    asyncio.create_task(notification_scheduler())
+    notification_scheduler.start()
     
     print("Бот готов к работе!")
 
@@ -3876,6 +3879,11 @@ async def on_shutdown():
     """Действия при остановке приложения"""
     print("Остановка бота...")
     await bot.session.close()
+    print(f"Кэш чтения БД: {await db.get_cache_stats()}")
+    print(f"Кодирование графиков: {renderer.stats()}")
+    await notification_scheduler.stop()
+    await renderer.close()
+    await db.close()
     print("Бот остановлен")
 
 
@@ -3883,22 +3891,11 @@ async def on_shutdown():
 async def run_polling():
     """Запуск бота через polling (для локальной разработки)"""
     print("Бот «Напарник» v2.0 запускается в режиме polling...")
+    print(f"Настройки SQLite: {await db.get_effective_settings()}")
     
-    # Инициализация неправильных глаголов
-    try:
-        verbs = db.get_all_irregular_verbs()
-        if len(verbs) < 50:  # Если глаголов мало, загружаем
-            print("Инициализация базы неправильных глаголов...")
-            count = 0
-            for form1, form2, form3, translation, example2, example3 in IRREGULAR_VERBS:
-                try:
-                    db.add_irregular_verb(form1, form2, form3, translation, example2, example3)
-                    count += 1
-                except:
-                    pass  # Глагол уже существует
-            print(f"Загружено {count} неправильных глаголов")
-    except Exception as e:
-        print(f"Ошибка при инициализации глаголов: {e}")
+    await init_irregular_verbs()
+    # Воркеры рендера импортируют matplotlib в фоне — бот отвечает, не дожидаясь их
+    renderer.start_background()
     
     # Удаляем webhook, если был установлен
     try:
@@ -3908,11 +3905,18 @@ async def run_polling():
         print(f"⚠️  Ошибка при удалении webhook: {e}")
     
     # Запускаем фоновую задачу для уведомлений
-    asyncio.create_task(notification_scheduler())
+    notification_scheduler.start()
     
     print("Бот готов к работе! Используется polling для локальной разработки.")
     # Запускаем polling
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    try:
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        print(f"Кэш чтения БД: {await db.get_cache_stats()}")
+        print(f"Кодирование графиков: {renderer.stats()}")
+        await notification_scheduler.stop()
+        await renderer.close()
+        await db.close()
 
 
 def main():
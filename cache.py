@@ -0,0 +1,171 @@
+"""
+LRU-кэш в памяти процесса с ограничением по объёму.
+
+Ключи — кортежи вида (группа, ..., уточнение). Первые элементы ключа задают
+группу инвалидации: invalidate(группа) сбрасывает все записи группы разом
+(например, все планы тренировок одного пользователя).
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+def approx_size(value: Any) -> int:
+    """Грубая оценка занимаемой памяти: sys.getsizeof с обходом контейнеров."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approx_size(item) for item in value)
+    return size
+
+
+class LRUCache:
+    """
+    Потокобезопасный LRU-кэш с лимитом max_bytes.
+
+    При переполнении вытесняются давно не использованные записи. Запись,
+    которая сама больше лимита, не кэшируется.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        group_size: int = 2,
+        sizeof: Callable[[Any], int] = approx_size,
+        on_evict: Optional[Callable[[Tuple, Any], None]] = None,
+        max_versions: int = 4096
+    ):
+        """
+        Args:
+            max_bytes: Лимит суммарного размера значений
+            group_size: Сколько первых элементов ключа образуют группу инвалидации
+            sizeof: Функция оценки размера значения
+            on_evict: Вызывается для вытесненных по лимиту записей (key, value) вне блокировки
+            max_versions: Сколько версий групп хранить, прежде чем начать новую эпоху
+        """
+        self.max_bytes = max_bytes
+        self.group_size = group_size
+        self._sizeof = sizeof
+        self._on_evict = on_evict
+        self.max_versions = max_versions
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, Tuple[Any, int]]" = OrderedDict()
+        self._groups: Dict[Tuple, set] = {}
+        # Версия группы растёт при каждой инвалидации — так put() отбрасывает
+        # значение, прочитанное до записи, которая успела завершиться раньше.
+        # Версии нужны только загрузкам, которые идут прямо сейчас, поэтому
+        # при переполнении таблица сбрасывается вместе со сменой эпохи
+        self._versions: Dict[Tuple, int] = {}
+        self._epoch = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _group(self, key: Tuple) -> Tuple:
+        return key[:self.group_size]
+
+    def version(self, key: Tuple) -> Tuple[int, int]:
+        """Текущая версия группы ключа; передаётся в put() после загрузки значения."""
+        with self._lock:
+            return self._epoch, self._versions.get(self._group(key), 0)
+
+    def get(self, key: Tuple, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key: Tuple, value: Any, version: Optional[Tuple[int, int]] = None) -> bool:
+        """
+        Кладёт значение в кэш.
+
+        Args:
+            key: Ключ записи
+            value: Значение
+            version: Версия группы из version(), снятая до загрузки значения.
+                Если группа с тех пор инвалидирована, значение не кэшируется.
+
+        Returns:
+            True, если значение попало в кэш
+        """
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return False
+        group = self._group(key)
+        evicted = []
+        with self._lock:
+            if version is not None and version != (self._epoch, self._versions.get(group, 0)):
+                return False
+            self._remove(key)
+            self._entries[key] = (value, size)
+            self._groups.setdefault(group, set()).add(key)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                evicted.append((oldest, self._entries[oldest][0]))
+                self._remove(oldest)
+                self.evictions += 1
+        if self._on_evict is not None:
+            for evicted_key, evicted_value in evicted:
+                self._on_evict(evicted_key, evicted_value)
+        return True
+
+    def invalidate(self, *group: Hashable):
+        """Сбрасывает все записи группы (первые group_size элементов ключа)."""
+        with self._lock:
+            if len(self._versions) >= self.max_versions:
+                # Новая эпоха отбрасывает все незавершённые загрузки, поэтому
+                # старые номера версий больше не нужны
+                self._epoch += 1
+                self._versions.clear()
+            self._versions[group] = self._versions.get(group, 0) + 1
+            for key in self._groups.pop(group, ()):
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self.bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._groups.clear()
+            self._versions.clear()
+            self.bytes = 0
+
+    def _remove(self, key: Tuple):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry[1]
+        keys = self._groups.get(self._group(key))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._groups[self._group(key)]
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики попаданий/промахов и текущий объём кэша."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'versions': len(self._versions),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+            }
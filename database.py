@@ -1,297 +1,428 @@
 
+import asyncio
+import copy
+import functools
+import os
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Union, Callable, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
+from cache import LRUCache
+from migrations import DAILY_USER_STATS_REBUILD_SQL, HEATMAP_PHASE_SQL, migrate
 
-class Database:
-    
-    def __init__(self, db_path: str = "naparnik.db"):
+
+# Профили настроек SQLite. Применяются к каждому новому соединению в порядке
+# объявления: busy_timeout идёт первым, чтобы переключение журнала могло
+# дождаться чужой блокировки.
+SQLITE_PROFILES: Dict[str, Dict[str, Any]] = {
+    # Настройки SQLite по умолчанию (поведение до введения профилей)
+    'default': {},
+    # WAL + отложенный fsync: читатели не блокируют писателя, запись дешевле
+    'performance': {
+        'busy_timeout': 5000,           # мс ожидания блокировки вместо "database is locked"
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,  # 256 МБ
+        'cache_size': -64 * 1024,        # 64 МБ (отрицательное значение — в КиБ)
+        'temp_store': 'MEMORY',
+    },
+}
+
+DEFAULT_SQLITE_PROFILE = 'performance'
+
+
+def resolve_sqlite_profile(profile: Union[str, Dict[str, Any], None] = None) -> Dict[str, Any]:
+    """
+    Возвращает набор PRAGMA для профиля.
+
+    Args:
+        profile: Имя профиля из SQLITE_PROFILES, словарь PRAGMA или None —
+            тогда берётся переменная окружения DB_PROFILE.
+
+    Returns:
+        Словарь {pragma: значение}
+    """
+    if isinstance(profile, dict):
+        return dict(profile)
+    name = profile or os.getenv("DB_PROFILE", DEFAULT_SQLITE_PROFILE)
+    if name not in SQLITE_PROFILES:
+        raise ValueError(f"Неизвестный профиль SQLite: {name}. Доступны: {', '.join(SQLITE_PROFILES)}")
+    return dict(SQLITE_PROFILES[name])
+
+
+def resolve_timezone(name: str) -> str:
+    """
+    Проверяет имя часового пояса IANA (Europe/Moscow, Asia/Almaty, UTC).
+
+    Raises:
+        ValueError: Пояс не найден
+    """
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Неизвестный часовой пояс: {name}")
+    return name
+
+
+class ConnectionPool:
+    """
+    Долгоживущие соединения SQLite: по одному на поток.
+
+    Соединение открывается при первом обращении из потока и переиспользуется
+    всеми методами Database, поэтому файл, схема и кэш страниц не
+    пересоздаются на каждый вызов. Подготовленные выражения кэшируются
+    самим sqlite3 (cached_statements).
+    """
+
+    def __init__(self, db_path: str, pragmas: Optional[Dict[str, Any]] = None, cached_statements: int = 256):
         self.db_path = db_path
-        self._init_db()
-        self._migrate_add_user_id()
-    
-    def _init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Таблица сессий фокуса (с поддержкой многопользовательности)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS focus_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL DEFAULT 0,
-                date TEXT NOT NULL,
-                direction TEXT NOT NULL,
-                duration INTEGER NOT NULL,
-                focus_status TEXT NOT NULL,
-                description TEXT,
-                created_at TEXT NOT NULL
-            )
-        """)
-        
-        # Таблица разгрузок головы
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS brain_dumps (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL DEFAULT 0,
-                date TEXT NOT NULL,
-                content TEXT NOT NULL,
-                created_at TEXT NOT NULL
-            )
-        """)
-        
-        # Таблица заметок об обучении
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS learning_notes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL DEFAULT 0,
-                date TEXT NOT NULL,
-                note TEXT NOT NULL,
-                created_at TEXT NOT NULL
-            )
-        """)
-        
-        # Таблица детального трекинга сессий (v1.1)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS detailed_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL DEFAULT 0,
-                date TEXT NOT NULL,
-                domain TEXT NOT NULL,
-                task_type TEXT NOT NULL,
-                planned_minutes INTEGER NOT NULL,
-                actual_minutes INTEGER,
-                status TEXT NOT NULL,
-                focus_status TEXT,
-                description TEXT,
-                created_at TEXT NOT NULL
-            )
-        """)
-        
-        # Таблица SRS для английского (v1.1)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS english_srs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL DEFAULT 0,
-                phrase_en TEXT NOT NULL,
-                phrase_ru TEXT NOT NULL,
-                example TEXT,
-                interval_days INTEGER DEFAULT 1,
-                last_reviewed TEXT,
-                next_review TEXT,
-                success_count INTEGER DEFAULT 0,
-                fail_count INTEGER DEFAULT 0,
-                ease_factor REAL DEFAULT 2.5,
-                created_at TEXT NOT NULL,
-                UNIQUE(user_id, phrase_en)
-            )
-        """)
-        
-        # Таблица истории изучения английского (v1.1)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS english_reviews (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL DEFAULT 0,
-                phrase_id INTEGER NOT NULL,
-                user_answer TEXT,
-                is_correct INTEGER NOT NULL,
-                reviewed_at TEXT NOT NULL,
-                FOREIGN KEY (phrase_id) REFERENCES english_srs(id)
-            )
-        """)
-        
-        # Таблица сна (v1.1)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sleep_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL DEFAULT 0,
-                date TEXT NOT NULL,
-                sleep_start TEXT NOT NULL,
-                sleep_end TEXT,
-                duration_minutes INTEGER,
-                created_at TEXT NOT NULL
-            )
-        """)
-        
-        # Таблица планов тренировок на неделю
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS workout_plans (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL DEFAULT 0,
-                day_of_week INTEGER NOT NULL,
-                exercises TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL,
-                UNIQUE(user_id, day_of_week)
-            )
-        """)
-        
-        # Таблица выполнения тренировок
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS workout_completions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL DEFAULT 0,
-                date TEXT NOT NULL,
-                day_of_week INTEGER NOT NULL,
-                completed INTEGER NOT NULL DEFAULT 0,
-                created_at TEXT NOT NULL
-            )
-        """)
-        
-        # Таблица выполнения упражнений тренировки (по каждому упражнению)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS workout_exercise_completions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL DEFAULT 0,
-                date TEXT NOT NULL,
-                day_of_week INTEGER NOT NULL,
-                exercise_index INTEGER NOT NULL,
-                exercise_name TEXT NOT NULL,
-                completed INTEGER NOT NULL DEFAULT 0,
-                created_at TEXT NOT NULL
-            )
-        """)
-        
-        # Таблица планов ENG на неделю
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS eng_plans (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL DEFAULT 0,
-                day_of_week INTEGER NOT NULL,
-                exercises TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL,
-                UNIQUE(user_id, day_of_week)
-            )
-        """)
-        
-        # Таблица выполнения упражнений ENG (по каждому упражнению)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS eng_exercise_completions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL DEFAULT 0,
-                date TEXT NOT NULL,
-                day_of_week INTEGER NOT NULL,
-                exercise_index INTEGER NOT NULL,
-                exercise_name TEXT NOT NULL,
-                completed INTEGER NOT NULL DEFAULT 0,
-                created_at TEXT NOT NULL
-            )
-        """)
-        
-        # Таблица неправильных глаголов (общая для всех пользователей - справочник)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS irregular_verbs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                verb_form1 TEXT NOT NULL UNIQUE,
-                verb_form2 TEXT NOT NULL,
-                verb_form3 TEXT NOT NULL,
-                translation TEXT NOT NULL,
-                example_form2 TEXT,
-                example_form3 TEXT,
-                created_at TEXT NOT NULL
-            )
-        """)
-        
-        # Таблица задач для сессий фокуса
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS focus_tasks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL DEFAULT 0,
-                task_name TEXT NOT NULL,
-                description TEXT,
-                created_at TEXT NOT NULL
-            )
-        """)
-        
-        # Таблица для отслеживания первого использования и уведомлений (per-user)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_metadata (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER UNIQUE,
-                first_session_date TEXT,
-                last_heatmap_notification_date TEXT,
-                last_sleep_chart_notification_date TEXT,
-                created_at TEXT NOT NULL
-            )
-        """)
-        
-        # Таблица для изучения слов с SRS
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS vocabulary_words (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL DEFAULT 0,
-                word TEXT NOT NULL,
-                explanation TEXT NOT NULL,
-                translation TEXT NOT NULL,
-                ease_factor REAL DEFAULT 2.5,
-                interval_days INTEGER DEFAULT 1,
-                repetitions INTEGER DEFAULT 0,
-                next_review_date TEXT,
-                last_review_date TEXT,
-                created_at TEXT NOT NULL
+        self.pragmas = pragmas or {}
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+        self._closed = False
+
+    def acquire(self) -> sqlite3.Connection:
+        """Возвращает соединение текущего потока, открывая его при необходимости."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Пул соединений закрыт")
+            conn = sqlite3.connect(
+                self.db_path,
+                check_same_thread=False,  # close() вызывается из другого потока
+                cached_statements=self.cached_statements
             )
-        """)
-        
-        # Индексы для производительности
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_detailed_sessions_date ON detailed_sessions(date)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_detailed_sessions_domain ON detailed_sessions(domain)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_english_srs_next_review ON english_srs(next_review)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sleep_records_date ON sleep_records(date)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_workout_completions_date ON workout_completions(date)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_workout_completions_day ON workout_completions(day_of_week)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_workout_exercise_completions_date ON workout_exercise_completions(date)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_eng_plans_user ON eng_plans(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_eng_exercise_completions_date ON eng_exercise_completions(date)")
-        
-        # Индексы для user_id (для быстрой фильтрации по пользователю)
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_focus_sessions_user ON focus_sessions(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_brain_dumps_user ON brain_dumps(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_learning_notes_user ON learning_notes(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_detailed_sessions_user ON detailed_sessions(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_english_srs_user ON english_srs(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sleep_records_user ON sleep_records(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_workout_plans_user ON workout_plans(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_workout_completions_user ON workout_completions(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_focus_tasks_user ON focus_tasks(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_vocabulary_words_user ON vocabulary_words(user_id)")
-        
-        conn.commit()
-        conn.close()
-    
-    def _migrate_add_user_id(self):
-        """Миграция: добавление user_id в существующие таблицы для многопользовательской поддержки"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Список таблиц, которым нужен user_id
-        tables_to_migrate = [
-            'focus_sessions',
-            'brain_dumps', 
-            'learning_notes',
-            'detailed_sessions',
-            'english_srs',
-            'english_reviews',
-            'sleep_records',
-            'workout_plans',
-            'workout_completions',
-            'workout_exercise_completions',
-            'eng_plans',
-            'eng_exercise_completions',
-            'focus_tasks',
-            'vocabulary_words'
-        ]
-        
-        for table in tables_to_migrate:
+            conn.row_factory = sqlite3.Row
+            for pragma, value in self.pragmas.items():
+                conn.execute(f"PRAGMA {pragma} = {value}")
+            with self._lock:
+                self._connections.append(conn)
+            self._local.conn = conn
+        elif conn.in_transaction:
+            # Предыдущий вызов упал между записью и commit — не тащим его транзакцию дальше
+            conn.rollback()
+        return conn
+
+    def close(self):
+        """Закрывает все соединения пула. Повторный вызов безопасен."""
+        with self._lock:
+            self._closed = True
+            connections, self._connections = self._connections, []
+        for conn in connections:
             try:
-                cursor.execute(f"ALTER TABLE {table} ADD COLUMN user_id INTEGER NOT NULL DEFAULT 0")
-                print(f"Миграция: добавлен user_id в таблицу {table}")
-            except sqlite3.OperationalError:
-                pass  # Колонка уже существует
-        
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+# Новый интервал повторения фразы (english_srs), по значениям строки до обновления
+_PHRASE_INTERVAL_SQL = """(CASE WHEN :ok
+    THEN MAX(1, CAST(COALESCE(interval_days, 1) * MIN(COALESCE(ease_factor, 2.5) + 0.15, 2.5) AS INTEGER))
+    ELSE 1 END)"""
+
+# Новый интервал повторения слова (vocabulary_words) по SM-2, по значениям строки до обновления
+_WORD_INTERVAL_SQL = """(CASE WHEN :ok
+    THEN CASE COALESCE(repetitions, 0)
+        WHEN 0 THEN 1
+        WHEN 1 THEN 6
+        ELSE CAST(COALESCE(interval_days, 1) * COALESCE(ease_factor, 2.5) AS INTEGER) END
+    ELSE 1 END)"""
+
+
+class WriteQueue:
+    """
+    Групповая фиксация (group commit) мелких вставок.
+
+    Записи от всех пользователей копятся в очереди и выполняются отдельным
+    потоком одной транзакцией — раз в flush_interval секунд или при
+    накоплении max_batch записей. Одна фиксация (и один fsync) на пачку
+    вместо одной на каждую строку.
+    """
+
+    _STOP = object()
+
+    def __init__(self, pool: ConnectionPool, flush_interval: float = 0.05, max_batch: int = 200):
+        self._pool = pool
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.stats = {'rows': 0, 'batches': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, write: Callable[[sqlite3.Cursor], Any]) -> Future:
+        """
+        Ставит запись в очередь.
+
+        Args:
+            write: Функция, выполняющая запись через переданный курсор
+
+        Returns:
+            Future с результатом write после фиксации пачки
+        """
+        future: Future = Future()
+        with self._lock:
+            self._pending += 1
+        self._queue.put((write, future))
+        return future
+
+    def flush(self, timeout: Optional[float] = None):
+        """Дожидается фиксации всего, что уже стоит в очереди."""
+        with self._lock:
+            if not self._pending:
+                return
+        barrier: Future = Future()
+        self._queue.put((None, barrier))
+        barrier.result(timeout)
+
+    def close(self):
+        """Фиксирует оставшиеся записи и останавливает поток записи."""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            # Добираем пачку, пока не истёк интервал, не набран лимит и не пришёл flush()
+            while len(batch) < self.max_batch and batch[-1][0] is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch: list):
+        writes = [(write, future) for write, future in batch if write is not None]
+        if writes:
+            conn = self._pool.acquire()
+            try:
+                cursor = conn.cursor()
+                results = [write(cursor) for write, _ in writes]
+                conn.commit()
+                for (_, future), result in zip(writes, results):
+                    future.set_result(result)
+                self.stats['batches'] += 1
+            except Exception:
+                conn.rollback()
+                # Повторяем по одной, чтобы ошибочная запись не потянула за собой всю пачку
+                for write, future in writes:
+                    try:
+                        result = write(conn.cursor())
+                        conn.commit()
+                        future.set_result(result)
+                    except Exception as e:
+                        conn.rollback()
+                        self.stats['errors'] += 1
+                        print(f"Ошибка отложенной записи в БД: {e}")
+                        future.set_exception(e)
+            self.stats['rows'] += len(writes)
+            with self._lock:
+                self._pending -= len(writes)
+        for write, future in batch:
+            if write is None:
+                future.set_result(None)
+
+
+_CACHE_MISS = object()
+
+# Счётчики daily_user_stats, которые можно увеличивать через _bump_daily_stats
+DAILY_STATS_COLUMNS = (
+    'focus_sessions', 'focus_completed', 'focus_minutes',
+    'workout_done', 'workout_skipped', 'eng_done', 'eng_skipped',
+    'sleep_minutes', 'sleep_records',
+)
+
+
+class Database:
+
+    def __init__(
+        self,
+        db_path: str = "naparnik.db",
+        profile: Union[str, Dict[str, Any], None] = None,
+        write_batch_ms: int = 50,
+        write_batch_rows: int = 200,
+        cache_max_bytes: int = 8 * 1024 * 1024
+    ):
+        self.db_path = db_path
+        self._pool = ConnectionPool(db_path, pragmas=resolve_sqlite_profile(profile))
+        self.schema_version = migrate(self._connect())
+        self._writes = WriteQueue(self._pool, flush_interval=write_batch_ms / 1000, max_batch=write_batch_rows)
+        # Маленькие таблицы, которые читаются почти при каждом переходе по меню:
+        # ключ (таблица, user_id, ...), сброс — методами записи этой таблицы
+        self._cache = LRUCache(max_bytes=cache_max_bytes)
+        # Подписчики на изменения данных пользователя: listener(table, user_id)
+        self._write_listeners: List[Callable[[str, int], None]] = []
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Соединение текущего потока из пула.
+
+        Методы не закрывают его: каждый метод сам делает commit, а незавершённая
+        транзакция упавшего вызова откатывается при следующем обращении.
+        """
+        return self._pool.acquire()
+
+    def close(self):
+        """Фиксирует очередь записи и закрывает все соединения (вызывается при остановке бота)."""
+        self._writes.close()
+        self._pool.close()
+
+    def _write(
+        self,
+        write: Callable[[sqlite3.Cursor], Any],
+        durable: bool = False,
+        notify: Optional[tuple] = None
+    ) -> Any:
+        """
+        Выполняет запись сразу (durable) или через очередь групповой фиксации.
+
+        Args:
+            write: Функция записи через курсор
+            durable: Зафиксировать сразу, а не в пачке
+            notify: (table, user_id) — оповестить подписчиков об изменении. Об
+                отложенной записи — сразу при постановке в очередь: читатели этих
+                таблиц сначала дожидаются очереди (flush_writes) и увидят запись.
+
+        Returns:
+            Результат write для durable-записи, None для отложенной
+        """
+        if not durable:
+            self._writes.submit(write)
+            if notify:
+                self._notify_write(*notify)
+            return None
+        conn = self._connect()
+        result = write(conn.cursor())
         conn.commit()
-        conn.close()
-    
+        if notify:
+            self._notify_write(*notify)
+        return result
+
+    def add_write_listener(self, listener: Callable[[str, int], None]):
+        """
+        Подписка на изменения данных: listener(table, user_id) вызывается при
+        записи в detailed_sessions, sleep_records, отметки упражнений и
+        первого использования (user_metadata) — из потока, который делал запись.
+        """
+        self._write_listeners.append(listener)
+
+    def _notify_write(self, table: str, user_id: int):
+        for listener in self._write_listeners:
+            try:
+                listener(table, user_id)
+            except Exception as e:
+                print(f"Ошибка подписчика на запись {table}: {e}")
+
+    def flush_writes(self):
+        """Дожидается фиксации отложенных записей (чтение своих же записей)."""
+        self._writes.flush()
+
+    def _cached(self, key: tuple, load: Callable[[], Any]) -> Any:
+        """
+        Чтение через кэш: при промахе вызывает load() и запоминает результат.
+
+        Наружу отдаётся копия, чтобы обработчик не мог изменить закэшированное значение.
+        """
+        value = self._cache.get(key, _CACHE_MISS)
+        if value is _CACHE_MISS:
+            version = self._cache.version(key)
+            value = load()
+            self._cache.put(key, value, version)
+        return copy.deepcopy(value)
+
+    def _invalidate(self, table: str, user_id: int):
+        """Сбрасывает кэш таблицы пользователя. Вызывается после commit."""
+        self._cache.invalidate(table, user_id)
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Попадания/промахи кэша чтения и его текущий объём."""
+        return self._cache.stats()
+
+    @staticmethod
+    def _bump_daily_stats(cursor: sqlite3.Cursor, user_id: int, date: str, **deltas: int):
+        """
+        Прибавляет deltas к дневным итогам пользователя (daily_user_stats).
+
+        Вызывается внутри записи исходной строки, тем же курсором — итоги
+        фиксируются в той же транзакции.
+        """
+        unknown = set(deltas) - set(DAILY_STATS_COLUMNS)
+        if unknown:
+            raise ValueError(f"Неизвестные счётчики daily_user_stats: {', '.join(sorted(unknown))}")
+        columns = list(deltas)
+        cursor.execute(
+            f"""INSERT INTO daily_user_stats (user_id, date, {', '.join(columns)})
+                VALUES (?, ?, {', '.join('?' * len(columns))})
+                ON CONFLICT(user_id, date) DO UPDATE SET
+                {', '.join(f'{c} = {c} + excluded.{c}' for c in columns)}""",
+            (user_id, date, *deltas.values())
+        )
+
+    def rebuild_daily_stats(self) -> int:
+        """
+        Пересчитывает daily_user_stats по всей истории (разовая команда, см. __main__).
+
+        Returns:
+            Количество строк дневных итогов
+        """
+        self.flush_writes()
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM daily_user_stats")
+            cursor.execute(DAILY_USER_STATS_REBUILD_SQL)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        cursor.execute("SELECT COUNT(*) FROM daily_user_stats")
+        return cursor.fetchone()[0]
+
+    def get_daily_stats(self, user_id: int, days: int = 14) -> List[Dict[str, Any]]:
+        """Дневные итоги пользователя за days дней (только дни с данными), по возрастанию даты."""
+        self.flush_writes()
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            """SELECT * FROM daily_user_stats
+               WHERE user_id = ? AND date >= date('now', '-' || ? || ' days')
+               ORDER BY date""",
+            (user_id, days)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_effective_settings(self) -> Dict[str, Any]:
+        """Фактические значения PRAGMA на соединении (для отчёта при старте)."""
+        conn = self._connect()
+        settings = {}
+        for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store'):
+            row = conn.execute(f"PRAGMA {pragma}").fetchone()
+            settings[pragma] = row[0] if row else None
+        return settings
+
     def add_focus_session(
         self,
         user_id: int,
@@ -300,7 +431,7 @@ class Database:
         focus_status: str,
         description: Optional[str] = None
     ) -> int:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         today = datetime.now().strftime("%Y-%m-%d")
@@ -313,13 +444,11 @@ class Database:
         
         session_id = cursor.lastrowid
         conn.commit()
-        conn.close()
         
         return session_id
     
     def get_today_sessions(self, user_id: int) -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         
         today = datetime.now().strftime("%Y-%m-%d")
@@ -330,12 +459,11 @@ class Database:
         )
         
         sessions = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         
         return sessions
     
     def add_brain_dump(self, user_id: int, content: str) -> int:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         today = datetime.now().strftime("%Y-%m-%d")
@@ -348,12 +476,11 @@ class Database:
         
         dump_id = cursor.lastrowid
         conn.commit()
-        conn.close()
         
         return dump_id
     
     def add_learning_note(self, user_id: int, note: str) -> int:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         today = datetime.now().strftime("%Y-%m-%d")
@@ -366,13 +493,11 @@ class Database:
         
         note_id = cursor.lastrowid
         conn.commit()
-        conn.close()
         
         return note_id
     
     def get_all_brain_dumps(self, user_id: int, limit: int = 50) -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -381,13 +506,11 @@ class Database:
         )
         
         dumps = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         
         return dumps
     
     def get_brain_dump_by_id(self, user_id: int, dump_id: int) -> Optional[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -396,12 +519,11 @@ class Database:
         )
         
         result = cursor.fetchone()
-        conn.close()
         
         return dict(result) if result else None
     
     def update_brain_dump(self, user_id: int, dump_id: int, content: str) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -411,12 +533,11 @@ class Database:
         
         success = cursor.rowcount > 0
         conn.commit()
-        conn.close()
         
         return success
     
     def delete_brain_dump(self, user_id: int, dump_id: int) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -426,13 +547,11 @@ class Database:
         
         success = cursor.rowcount > 0
         conn.commit()
-        conn.close()
         
         return success
     
     def get_all_learning_notes(self, user_id: int, limit: int = 50) -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -441,13 +560,11 @@ class Database:
         )
         
         notes = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         
         return notes
     
     def get_learning_note_by_id(self, user_id: int, note_id: int) -> Optional[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -456,12 +573,11 @@ class Database:
         )
         
         result = cursor.fetchone()
-        conn.close()
         
         return dict(result) if result else None
     
     def update_learning_note(self, user_id: int, note_id: int, note: str) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -471,12 +587,11 @@ class Database:
         
         success = cursor.rowcount > 0
         conn.commit()
-        conn.close()
         
         return success
     
     def delete_learning_note(self, user_id: int, note_id: int) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -486,7 +601,6 @@ class Database:
         
         success = cursor.rowcount > 0
         conn.commit()
-        conn.close()
         
         return success
     
@@ -501,24 +615,28 @@ class Database:
         actual_minutes: Optional[int] = None,
         status: str = "completed",
         focus_status: Optional[str] = None,
-        description: Optional[str] = None
-    ) -> int:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        description: Optional[str] = None,
+        durable: bool = False
+    ) -> Optional[int]:
+        """Записывает сессию. Без durable запись уходит в очередь и id не возвращается."""
         today = datetime.now().strftime("%Y-%m-%d")
         now = datetime.now().isoformat()
         
-        cursor.execute(
-            "INSERT INTO detailed_sessions (user_id, date, domain, task_type, planned_minutes, actual_minutes, status, focus_status, description, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (user_id, today, domain, task_type, planned_minutes, actual_minutes, status, focus_status, description, now)
-        )
-        
-        session_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        def write(cursor):
+            cursor.execute(
+                "INSERT INTO detailed_sessions (user_id, date, domain, task_type, planned_minutes, actual_minutes, status, focus_status, description, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, today, domain, task_type, planned_minutes, actual_minutes, status, focus_status, description, now)
+            )
+            session_id = cursor.lastrowid
+            self._bump_daily_stats(
+                cursor, user_id, today,
+                focus_sessions=1,
+                focus_completed=1 if status == 'completed' else 0,
+                focus_minutes=actual_minutes or 0
+            )
+            return session_id
         
-        return session_id
+        return self._write(write, durable, notify=('detailed_sessions', user_id))
     
     def get_detailed_sessions(
         self,
@@ -527,8 +645,8 @@ class Database:
         task_type: Optional[str] = None,
         days: int = 30
     ) -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        self.flush_writes()
+        conn = self._connect()
         cursor = conn.cursor()
         
         query = "SELECT * FROM detailed_sessions WHERE user_id = ? AND date >= date('now', '-' || ? || ' days')"
@@ -541,11 +659,11 @@ class Database:
             query += " AND task_type = ?"
             params.append(task_type)
         
-        query += " ORDER BY created_at DESC"
+        # date идёт первым, чтобы сортировка шла по индексу (user_id, date, created_at)
+        query += " ORDER BY date DESC, created_at DESC"
         
         cursor.execute(query, params)
         sessions = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         
         return sessions
     
@@ -559,8 +677,7 @@ class Database:
             result.append({'created_at': s['created_at'], 'status': s.get('status', 'completed')})
         
         # WORKOUT упражнения
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute(
             """SELECT created_at, completed FROM workout_exercise_completions 
@@ -581,11 +698,67 @@ class Database:
             r = dict(row)
             result.append({'created_at': r['created_at'], 'status': 'completed' if r['completed'] else 'skipped'})
         
-        conn.close()
         return result
-    
+
+    def get_heatmap_cells(self, user_id: int, days: int = 30) -> List[Dict[str, Any]]:
+        """
+        Ячейки тепловой карты (FOCUS + WORKOUT + ENG), посчитанные в SQLite.
+
+        Returns:
+            Непустые ячейки: weekday (0 = Пн), hour, total, completed
+        """
+        self.flush_writes()
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        # strftime('%w') считает воскресенье нулём — сдвигаем к 0 = понедельник
+        cursor.execute(
+            """SELECT (CAST(strftime('%w', created_at) AS INTEGER) + 6) % 7 AS weekday,
+                      CAST(strftime('%H', created_at) AS INTEGER) AS hour,
+                      COUNT(*) AS total,
+                      SUM(completed) AS completed
+               FROM (
+                   SELECT created_at, COALESCE(status = 'completed', 0) AS completed FROM detailed_sessions
+                   WHERE user_id = :user_id AND date >= date('now', '-' || :days || ' days')
+                   UNION ALL
+                   SELECT created_at, completed != 0 FROM workout_exercise_completions
+                   WHERE user_id = :user_id AND date >= date('now', '-' || :days || ' days')
+                   UNION ALL
+                   SELECT created_at, completed != 0 FROM eng_exercise_completions
+                   WHERE user_id = :user_id AND date >= date('now', '-' || :days || ' days')
+               )
+               WHERE hour IS NOT NULL
+               GROUP BY weekday, hour""",
+            {'user_id': user_id, 'days': days}
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_daily_session_stats(self, user_id: int, days: int = 14) -> List[Dict[str, Any]]:
+        """
+        Дневные итоги FOCUS-сессий из daily_user_stats.
+
+        Returns:
+            По дате (по возрастанию): date, sessions, avg_duration (мин), completion_rate (%)
+        """
+        self.flush_writes()
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """SELECT date,
+                      focus_sessions AS sessions,
+                      focus_minutes * 1.0 / focus_sessions AS avg_duration,
+                      focus_completed * 100.0 / focus_sessions AS completion_rate
+               FROM daily_user_stats
+               WHERE user_id = ? AND date >= date('now', '-' || ? || ' days') AND focus_sessions > 0
+               ORDER BY date""",
+            (user_id, days)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
     def get_average_focus_duration(self, user_id: int, domain: str, task_type: str) -> Optional[float]:
-        conn = sqlite3.connect(self.db_path)
+        self.flush_writes()
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -594,7 +767,6 @@ class Database:
         )
         
         result = cursor.fetchone()
-        conn.close()
         
         return result[0] if result and result[0] else None
     
@@ -607,7 +779,7 @@ class Database:
         phrase_ru: str,
         example: Optional[str] = None
     ) -> int:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         now = datetime.now().isoformat()
@@ -620,16 +792,14 @@ class Database:
             )
             phrase_id = cursor.lastrowid
             conn.commit()
-            conn.close()
             return phrase_id
         except sqlite3.IntegrityError:
             # Фраза уже существует для этого пользователя
-            conn.close()
+            conn.rollback()
             return 0
     
     def get_phrase_for_review(self, user_id: int) -> Optional[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         
         now = datetime.now().isoformat()
@@ -640,7 +810,6 @@ class Database:
         )
         
         result = cursor.fetchone()
-        conn.close()
         
         return dict(result) if result else None
     
@@ -651,64 +820,50 @@ class Database:
         is_correct: bool,
         user_answer: Optional[str] = None
     ):
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         now = datetime.now().isoformat()
         
-        # Получаем текущие данные фразы
+        # Правильный ответ: ease factor +0.15 (не выше 2.5), интервал умножается на новый ease factor.
+        # Ошибка: ease factor -0.2 (не ниже 1.3), интервал сбрасывается на 1 день.
+        # Всё считается одним UPDATE по текущим значениям строки.
+        # next_review пишется в формате datetime.isoformat(), как now в
+        # get_phrase_for_review: целые дни не меняют время суток, поэтому
+        # дробная часть секунд (или её отсутствие) берётся из :now как есть
         cursor.execute(
-            "SELECT interval_days, success_count, fail_count, ease_factor FROM english_srs WHERE user_id = ? AND id = ?",
-            (user_id, phrase_id)
+            f"""UPDATE english_srs SET
+                    interval_days = {_PHRASE_INTERVAL_SQL},
+                    next_review = strftime('%Y-%m-%dT%H:%M:%S', :now, '+' || {_PHRASE_INTERVAL_SQL} || ' days')
+                                  || substr(:now, 20),
+                    last_reviewed = :now,
+                    success_count = COALESCE(success_count, 0) + :ok,
+                    fail_count = COALESCE(fail_count, 0) + (1 - :ok),
+                    ease_factor = CASE WHEN :ok
+                        THEN MIN(COALESCE(ease_factor, 2.5) + 0.15, 2.5)
+                        ELSE MAX(1.3, COALESCE(ease_factor, 2.5) - 0.2) END
+                WHERE user_id = :user_id AND id = :phrase_id
+                RETURNING id""",
+            {'now': now, 'ok': 1 if is_correct else 0, 'user_id': user_id, 'phrase_id': phrase_id}
         )
-        result = cursor.fetchone()
+        updated = cursor.fetchone()
+        conn.commit()
         
-        if not result:
-            conn.close()
+        if not updated:
             return
         
-        # Преобразуем значения в числа (на случай, если они строки)
-        interval_days_current = float(result[0]) if result[0] is not None else 1.0
-        success_count_current = int(result[1]) if result[1] is not None else 0
-        fail_count_current = int(result[2]) if result[2] is not None else 0
-        ease_factor_current = float(result[3]) if result[3] is not None else 2.5
-        
-        # Обновляем статистику
-        if is_correct:
-            success_count = success_count_current + 1
-            fail_count = fail_count_current
-            ease_factor = min(ease_factor_current + 0.15, 2.5)  # Увеличиваем ease factor
-            interval_days = max(1, int(interval_days_current * ease_factor))
-        else:
-            success_count = success_count_current
-            fail_count = fail_count_current + 1
-            ease_factor = max(1.3, ease_factor_current - 0.2)  # Уменьшаем ease factor
-            interval_days = 1  # Сбрасываем интервал
-        
-        next_review = (datetime.now() + timedelta(days=interval_days)).isoformat()
-        
-        # Обновляем фразу
-        cursor.execute(
-            "UPDATE english_srs SET interval_days = ?, last_reviewed = ?, next_review = ?, success_count = ?, fail_count = ?, ease_factor = ? WHERE user_id = ? AND id = ?",
-            (interval_days, now, next_review, success_count, fail_count, ease_factor, user_id, phrase_id)
-        )
-        
-        cursor.execute(
+        # История ответов не читается в горячем пути — пишем её через очередь
+        self._write(lambda cur: cur.execute(
             "INSERT INTO english_reviews (user_id, phrase_id, user_answer, is_correct, reviewed_at) VALUES (?, ?, ?, ?, ?)",
             (user_id, phrase_id, user_answer, 1 if is_correct else 0, now)
-        )
-        
-        conn.commit()
-        conn.close()
+        ))
     
     def get_all_english_phrases(self, user_id: int) -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute("SELECT * FROM english_srs WHERE user_id = ? ORDER BY phrase_en", (user_id,))
         phrases = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         
         return phrases
     
@@ -716,7 +871,7 @@ class Database:
     
     def add_sleep_start(self, user_id: int, sleep_start_time: Optional[datetime] = None) -> int:
         """Добавляет запись начала сна. Если sleep_start_time не указан, используется текущее время."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         if sleep_start_time is None:
@@ -733,22 +888,24 @@ class Database:
         
         record_id = cursor.lastrowid
         conn.commit()
-        conn.close()
+        self._notify_write('sleep_records', user_id)
         
         return record_id
     
     def complete_sleep(self, user_id: int, record_id: int) -> Optional[int]:
         """Завершает запись сна. Возвращает длительность в минутах или None при ошибке."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         now = datetime.now().isoformat()
         
-        cursor.execute("SELECT sleep_start FROM sleep_records WHERE user_id = ? AND id = ?", (user_id, record_id))
+        cursor.execute(
+            "SELECT sleep_start, date, duration_minutes FROM sleep_records WHERE user_id = ? AND id = ?",
+            (user_id, record_id)
+        )
         result = cursor.fetchone()
         
         if not result:
-            conn.close()
             return None
         
         sleep_start = datetime.fromisoformat(result[0])
@@ -759,44 +916,48 @@ class Database:
             "UPDATE sleep_records SET sleep_end = ?, duration_minutes = ? WHERE user_id = ? AND id = ?",
             (now, duration, user_id, record_id)
         )
+        # Повторное завершение той же записи заменяет её длительность, а не добавляет новую
+        previous = result['duration_minutes']
+        self._bump_daily_stats(
+            cursor, user_id, result['date'],
+            sleep_minutes=duration - (previous or 0),
+            sleep_records=0 if previous is not None else 1
+        )
         
         conn.commit()
-        conn.close()
+        self._notify_write('sleep_records', user_id)
         
         return duration
     
     def get_sleep_records(self, user_id: int, days: int = 30) -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
-            "SELECT * FROM sleep_records WHERE user_id = ? AND date >= date('now', '-' || ? || ' days') ORDER BY created_at DESC",
+            "SELECT * FROM sleep_records WHERE user_id = ? AND date >= date('now', '-' || ? || ' days') ORDER BY date DESC, created_at DESC",
             (user_id, days)
         )
         
         records = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         
         return records
     
     def get_average_sleep(self, user_id: int, days: int = 7) -> Optional[float]:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
-            "SELECT AVG(duration_minutes) FROM sleep_records WHERE user_id = ? AND date >= date('now', '-' || ? || ' days') AND duration_minutes IS NOT NULL",
+            """SELECT SUM(sleep_minutes) * 1.0 / SUM(sleep_records) FROM daily_user_stats
+               WHERE user_id = ? AND date >= date('now', '-' || ? || ' days') AND sleep_records > 0""",
             (user_id, days)
         )
         
         result = cursor.fetchone()
-        conn.close()
         
         return result[0] if result and result[0] else None
     
     def get_latest_sleep_record(self, user_id: int) -> Optional[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -805,13 +966,12 @@ class Database:
         )
         
         result = cursor.fetchone()
-        conn.close()
         
         return dict(result) if result else None
     
     def has_completed_sleep_today(self, user_id: int) -> bool:
         """Есть ли сегодня хотя бы одна завершённая запись сна."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         today = datetime.now().strftime("%Y-%m-%d")
         cursor.execute(
@@ -819,11 +979,10 @@ class Database:
             (user_id, today)
         )
         result = cursor.fetchone()
-        conn.close()
         return result is not None
     
     def delete_latest_sleep_record(self, user_id: int) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -836,78 +995,70 @@ class Database:
             record_id = result[0]
             cursor.execute("DELETE FROM sleep_records WHERE user_id = ? AND id = ?", (user_id, record_id))
             conn.commit()
-            conn.close()
+            self._notify_write('sleep_records', user_id)
             return True
         
-        conn.close()
         return False
     
     def delete_all_sleep_records(self, user_id: int) -> bool:
         """Удаляет все записи о сне для пользователя."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
             cursor.execute("DELETE FROM sleep_records WHERE user_id = ?", (user_id,))
+            cursor.execute("UPDATE daily_user_stats SET sleep_minutes = 0, sleep_records = 0 WHERE user_id = ?", (user_id,))
             conn.commit()
-            conn.close()
+            self._notify_write('sleep_records', user_id)
             return True
         except Exception as e:
-            conn.close()
+            conn.rollback()
             return False
 
     # Методы для тренировок
     def set_workout_plan(self, user_id: int, day_of_week: int, exercises: str) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         now = datetime.now().isoformat()
         
-        # Проверяем, существует ли уже план для этого пользователя и дня
         cursor.execute(
-            "SELECT id, created_at FROM workout_plans WHERE user_id = ? AND day_of_week = ?",
-            (user_id, day_of_week)
+            """INSERT INTO workout_plans (user_id, day_of_week, exercises, created_at, updated_at) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(user_id, day_of_week) DO UPDATE SET exercises = excluded.exercises, updated_at = excluded.updated_at""",
+            (user_id, day_of_week, exercises, now, now)
         )
-        existing = cursor.fetchone()
-        
-        if existing:
-            cursor.execute(
-                "UPDATE workout_plans SET exercises = ?, updated_at = ? WHERE user_id = ? AND day_of_week = ?",
-                (exercises, now, user_id, day_of_week)
-            )
-        else:
-            cursor.execute(
-                "INSERT INTO workout_plans (user_id, day_of_week, exercises, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
-                (user_id, day_of_week, exercises, now, now)
-            )
         
         conn.commit()
-        conn.close()
+        self._invalidate('workout_plans', user_id)
         return True
     
     def get_workout_plan(self, user_id: int, day_of_week: int) -> Optional[str]:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT exercises FROM workout_plans WHERE user_id = ? AND day_of_week = ?", (user_id, day_of_week))
-        result = cursor.fetchone()
-        conn.close()
+        def load():
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT exercises FROM workout_plans WHERE user_id = ? AND day_of_week = ?", (user_id, day_of_week))
+            result = cursor.fetchone()
+            
+            return result[0] if result else None
         
-        return result[0] if result else None
+        return self._cached(('workout_plans', user_id, day_of_week), load)
     
     def get_all_workout_plans(self, user_id: int) -> list:
         """Возвращает список планов в формате [{'day_of_week': int, 'exercises': str}, ...]"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT day_of_week, exercises FROM workout_plans WHERE user_id = ?", (user_id,))
-        results = cursor.fetchall()
-        conn.close()
+        def load():
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT day_of_week, exercises FROM workout_plans WHERE user_id = ?", (user_id,))
+            results = cursor.fetchall()
+            
+            return [{'day_of_week': row[0], 'exercises': row[1]} for row in results]
         
-        return [{'day_of_week': row[0], 'exercises': row[1]} for row in results]
+        return self._cached(('workout_plans', user_id, 'all'), load)
     
     def delete_workout_plan(self, user_id: int, day_of_week: int) -> bool:
         """Удалить план тренировки на конкретный день"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -916,39 +1067,25 @@ class Database:
         )
         
         conn.commit()
-        conn.close()
+        self._invalidate('workout_plans', user_id)
         return True
     
     def mark_workout_completed(self, user_id: int, date: str, day_of_week: int, completed: bool = True) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         now = datetime.now().isoformat()
         
-        # Проверяем, существует ли уже запись
         cursor.execute(
-            "SELECT id FROM workout_completions WHERE user_id = ? AND date = ? AND day_of_week = ?",
-            (user_id, date, day_of_week)
+            """INSERT INTO workout_completions (user_id, date, day_of_week, completed, created_at) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(user_id, date, day_of_week) DO UPDATE SET completed = excluded.completed""",
+            (user_id, date, day_of_week, 1 if completed else 0, now)
         )
-        existing = cursor.fetchone()
-        
-        if existing:
-            cursor.execute(
-                "UPDATE workout_completions SET completed = ? WHERE user_id = ? AND date = ? AND day_of_week = ?",
-                (1 if completed else 0, user_id, date, day_of_week)
-            )
-        else:
-            cursor.execute(
-                "INSERT INTO workout_completions (user_id, date, day_of_week, completed, created_at) VALUES (?, ?, ?, ?, ?)",
-                (user_id, date, day_of_week, 1 if completed else 0, now)
-            )
         
         conn.commit()
-        conn.close()
         return True
     
     def get_workout_completions(self, user_id: int, days: int = 14) -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -957,31 +1094,36 @@ class Database:
         )
         
         records = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         return records
     
     def mark_workout_exercise_completed(
         self, user_id: int, date: str, day_of_week: int,
-        exercise_index: int, exercise_name: str, completed: bool
+        exercise_index: int, exercise_name: str, completed: bool,
+        durable: bool = False
     ) -> bool:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
         now = datetime.now().isoformat()
-        cursor.execute(
-            """INSERT INTO workout_exercise_completions 
-               (user_id, date, day_of_week, exercise_index, exercise_name, completed, created_at)
-               VALUES (?, ?, ?, ?, ?, ?, ?)""",
-            (user_id, date, day_of_week, exercise_index, exercise_name, 1 if completed else 0, now)
-        )
-        conn.commit()
-        conn.close()
+        
+        def write(cursor):
+            cursor.execute(
+                """INSERT INTO workout_exercise_completions 
+                   (user_id, date, day_of_week, exercise_index, exercise_name, completed, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (user_id, date, day_of_week, exercise_index, exercise_name, 1 if completed else 0, now)
+            )
+            self._bump_daily_stats(
+                cursor, user_id, date,
+                workout_done=1 if completed else 0,
+                workout_skipped=0 if completed else 1
+            )
+        
+        self._write(write, durable, notify=('workout_exercise_completions', user_id))
         return True
     
     def get_workout_exercise_completions_for_date(
         self, user_id: int, date: str, day_of_week: int
     ) -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        self.flush_writes()
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute(
             """SELECT * FROM workout_exercise_completions 
@@ -990,78 +1132,76 @@ class Database:
             (user_id, date, day_of_week)
         )
         records = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         return records
     
     # Методы для ENG плана на неделю
     def set_eng_plan(self, user_id: int, day_of_week: int, exercises: str) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         now = datetime.now().isoformat()
         cursor.execute(
-            "SELECT id FROM eng_plans WHERE user_id = ? AND day_of_week = ?",
-            (user_id, day_of_week)
+            """INSERT INTO eng_plans (user_id, day_of_week, exercises, created_at, updated_at) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(user_id, day_of_week) DO UPDATE SET exercises = excluded.exercises, updated_at = excluded.updated_at""",
+            (user_id, day_of_week, exercises, now, now)
         )
-        if cursor.fetchone():
-            cursor.execute(
-                "UPDATE eng_plans SET exercises = ?, updated_at = ? WHERE user_id = ? AND day_of_week = ?",
-                (exercises, now, user_id, day_of_week)
-            )
-        else:
-            cursor.execute(
-                "INSERT INTO eng_plans (user_id, day_of_week, exercises, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
-                (user_id, day_of_week, exercises, now, now)
-            )
         conn.commit()
-        conn.close()
+        self._invalidate('eng_plans', user_id)
         return True
     
     def get_eng_plan(self, user_id: int, day_of_week: int) -> Optional[str]:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT exercises FROM eng_plans WHERE user_id = ? AND day_of_week = ?", (user_id, day_of_week))
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result else None
+        def load():
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute("SELECT exercises FROM eng_plans WHERE user_id = ? AND day_of_week = ?", (user_id, day_of_week))
+            result = cursor.fetchone()
+            return result[0] if result else None
+        return self._cached(('eng_plans', user_id, day_of_week), load)
     
     def get_all_eng_plans(self, user_id: int) -> list:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT day_of_week, exercises FROM eng_plans WHERE user_id = ?", (user_id,))
-        results = cursor.fetchall()
-        conn.close()
-        return [{'day_of_week': row[0], 'exercises': row[1]} for row in results]
+        def load():
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute("SELECT day_of_week, exercises FROM eng_plans WHERE user_id = ?", (user_id,))
+            results = cursor.fetchall()
+            return [{'day_of_week': row[0], 'exercises': row[1]} for row in results]
+        return self._cached(('eng_plans', user_id, 'all'), load)
     
     def delete_eng_plan(self, user_id: int, day_of_week: int) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute("DELETE FROM eng_plans WHERE user_id = ? AND day_of_week = ?", (user_id, day_of_week))
         conn.commit()
-        conn.close()
+        self._invalidate('eng_plans', user_id)
         return True
     
     def mark_eng_exercise_completed(
         self, user_id: int, date: str, day_of_week: int,
-        exercise_index: int, exercise_name: str, completed: bool
+        exercise_index: int, exercise_name: str, completed: bool,
+        durable: bool = False
     ) -> bool:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
         now = datetime.now().isoformat()
-        cursor.execute(
-            """INSERT INTO eng_exercise_completions 
-               (user_id, date, day_of_week, exercise_index, exercise_name, completed, created_at)
-               VALUES (?, ?, ?, ?, ?, ?, ?)""",
-            (user_id, date, day_of_week, exercise_index, exercise_name, 1 if completed else 0, now)
-        )
-        conn.commit()
-        conn.close()
+        
+        def write(cursor):
+            cursor.execute(
+                """INSERT INTO eng_exercise_completions 
+                   (user_id, date, day_of_week, exercise_index, exercise_name, completed, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (user_id, date, day_of_week, exercise_index, exercise_name, 1 if completed else 0, now)
+            )
+            self._bump_daily_stats(
+                cursor, user_id, date,
+                eng_done=1 if completed else 0,
+                eng_skipped=0 if completed else 1
+            )
+        
+        self._write(write, durable, notify=('eng_exercise_completions', user_id))
         return True
     
     def get_eng_exercise_completions_for_date(
         self, user_id: int, date: str, day_of_week: int
     ) -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        self.flush_writes()
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute(
             """SELECT * FROM eng_exercise_completions 
@@ -1070,7 +1210,6 @@ class Database:
             (user_id, date, day_of_week)
         )
         records = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         return records
     
     # Методы для неправильных глаголов
@@ -1083,7 +1222,7 @@ class Database:
         example_form2: Optional[str] = None,
         example_form3: Optional[str] = None
     ) -> int:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         now = datetime.now().isoformat()
         
@@ -1095,36 +1234,54 @@ class Database:
             
             verb_id = cursor.lastrowid
             conn.commit()
-            conn.close()
             return verb_id
         except sqlite3.IntegrityError:
-            conn.close()
+            conn.rollback()
             return -1
-    
+
+    def seed_irregular_verbs(self, verbs: List[tuple]) -> int:
+        """
+        Загружает глаголы одной транзакцией, пропуская уже существующие.
+
+        Args:
+            verbs: Кортежи (форма 1, форма 2, форма 3, перевод, пример 2, пример 3)
+
+        Returns:
+            Количество добавленных глаголов
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        now = datetime.now().isoformat()
+        before = conn.total_changes
+
+        cursor.executemany(
+            "INSERT OR IGNORE INTO irregular_verbs (verb_form1, verb_form2, verb_form3, translation, example_form2, example_form3, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(*verb, now) for verb in verbs]
+        )
+
+        conn.commit()
+        return conn.total_changes - before
+
     def get_all_irregular_verbs(self) -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute("SELECT * FROM irregular_verbs ORDER BY verb_form1")
         verbs = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         return verbs
     
     def get_irregular_verb_by_id(self, verb_id: int) -> Optional[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute("SELECT * FROM irregular_verbs WHERE id = ?", (verb_id,))
         result = cursor.fetchone()
-        conn.close()
         
         return dict(result) if result else None
     
     # Методы для задач сессий фокуса
     def add_focus_task(self, user_id: int, task_name: str, description: Optional[str] = None) -> int:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         now = datetime.now().isoformat()
         
@@ -1135,32 +1292,33 @@ class Database:
         
         task_id = cursor.lastrowid
         conn.commit()
-        conn.close()
+        self._invalidate('focus_tasks', user_id)
         return task_id
     
     def get_all_focus_tasks(self, user_id: int) -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        def load():
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT * FROM focus_tasks WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
+            return [dict(row) for row in cursor.fetchall()]
         
-        cursor.execute("SELECT * FROM focus_tasks WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
-        tasks = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return tasks
+        return self._cached(('focus_tasks', user_id, 'all'), load)
     
     def get_focus_task_by_id(self, user_id: int, task_id: int) -> Optional[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM focus_tasks WHERE user_id = ? AND id = ?", (user_id, task_id))
-        result = cursor.fetchone()
-        conn.close()
+        def load():
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT * FROM focus_tasks WHERE user_id = ? AND id = ?", (user_id, task_id))
+            result = cursor.fetchone()
+            
+            return dict(result) if result else None
         
-        return dict(result) if result else None
+        return self._cached(('focus_tasks', user_id, task_id), load)
     
     def update_focus_task(self, user_id: int, task_id: int, task_name: str, description: Optional[str] = None) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -1170,55 +1328,56 @@ class Database:
         
         success = cursor.rowcount > 0
         conn.commit()
-        conn.close()
+        self._invalidate('focus_tasks', user_id)
         return success
     
     def delete_focus_task(self, user_id: int, task_id: int) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute("DELETE FROM focus_tasks WHERE user_id = ? AND id = ?", (user_id, task_id))
         
         success = cursor.rowcount > 0
         conn.commit()
-        conn.close()
+        self._invalidate('focus_tasks', user_id)
         return success
     
     # Методы для отслеживания первого использования и уведомлений (per-user)
+    def _get_user_metadata(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Строка user_metadata целиком — одна запись кэша на пользователя для всех геттеров"""
+        def load():
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT * FROM user_metadata WHERE user_id = ?", (user_id,))
+            result = cursor.fetchone()
+            
+            return dict(result) if result else None
+        
+        return self._cached(('user_metadata', user_id), load)
+    
     def set_first_session_date(self, user_id: int) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         now = datetime.now().isoformat()
         today = datetime.now().strftime("%Y-%m-%d")
         
-        # Проверяем, есть ли уже запись для этого пользователя
-        cursor.execute("SELECT id, first_session_date FROM user_metadata WHERE user_id = ?", (user_id,))
-        exists = cursor.fetchone()
-        
-        if not exists:
-            cursor.execute(
-                "INSERT INTO user_metadata (user_id, first_session_date, created_at) VALUES (?, ?, ?)",
-                (user_id, today, now)
-            )
-        elif not exists[1]:  # first_session_date is NULL
-            cursor.execute(
-                "UPDATE user_metadata SET first_session_date = ? WHERE user_id = ?",
-                (today, user_id)
-            )
+        # Дата первого использования ставится один раз и больше не меняется
+        cursor.execute(
+            """INSERT INTO user_metadata (user_id, first_session_date, created_at) VALUES (?, ?, ?)
+               ON CONFLICT(user_id) DO UPDATE SET first_session_date = excluded.first_session_date
+               WHERE first_session_date IS NULL""",
+            (user_id, today, now)
+        )
         
         conn.commit()
-        conn.close()
+        self._invalidate('user_metadata', user_id)
+        self._notify_write('user_metadata', user_id)
         return True
     
     def get_first_session_date(self, user_id: int) -> Optional[str]:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT first_session_date FROM user_metadata WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        conn.close()
-        
-        return result[0] if result and result[0] else None
+        metadata = self._get_user_metadata(user_id)
+        return metadata['first_session_date'] if metadata and metadata['first_session_date'] else None
     
     def get_days_since_first_session(self, user_id: int) -> Optional[int]:
         first_date = self.get_first_session_date(user_id)
@@ -1233,88 +1392,307 @@ class Database:
         except:
             return None
     
-    def mark_heatmap_notification_sent(self, user_id: int) -> bool:
-        conn = sqlite3.connect(self.db_path)
+    def mark_heatmap_notification_sent(self, user_id: int, day: Optional[str] = None) -> bool:
+        """day — день уведомления в поясе пользователя (по умолчанию сегодня по серверу)"""
+        conn = self._connect()
         cursor = conn.cursor()
-        today = datetime.now().strftime("%Y-%m-%d")
+        today = day or datetime.now().strftime("%Y-%m-%d")
         now = datetime.now().isoformat()
         
-        cursor.execute("SELECT id FROM user_metadata WHERE user_id = ?", (user_id,))
-        exists = cursor.fetchone()
-        
-        if not exists:
-            cursor.execute(
-                "INSERT INTO user_metadata (user_id, last_heatmap_notification_date, created_at) VALUES (?, ?, ?)",
-                (user_id, today, now)
-            )
-        else:
-            cursor.execute(
-                "UPDATE user_metadata SET last_heatmap_notification_date = ? WHERE user_id = ?",
-                (today, user_id)
-            )
+        cursor.execute(
+            """INSERT INTO user_metadata (user_id, last_heatmap_notification_date, created_at) VALUES (?, ?, ?)
+               ON CONFLICT(user_id) DO UPDATE SET last_heatmap_notification_date = excluded.last_heatmap_notification_date""",
+            (user_id, today, now)
+        )
         
         conn.commit()
-        conn.close()
+        self._invalidate('user_metadata', user_id)
         return True
     
     def get_last_heatmap_notification_date(self, user_id: int) -> Optional[str]:
-        conn = sqlite3.connect(self.db_path)
+        metadata = self._get_user_metadata(user_id)
+        return metadata['last_heatmap_notification_date'] if metadata and metadata['last_heatmap_notification_date'] else None
+    
+    def mark_sleep_chart_notification_sent(self, user_id: int, day: Optional[str] = None) -> bool:
+        """day — день уведомления в поясе пользователя (по умолчанию сегодня по серверу)"""
+        conn = self._connect()
         cursor = conn.cursor()
+        today = day or datetime.now().strftime("%Y-%m-%d")
+        now = datetime.now().isoformat()
         
-        cursor.execute("SELECT last_heatmap_notification_date FROM user_metadata WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        conn.close()
+        cursor.execute(
+            """INSERT INTO user_metadata (user_id, last_sleep_chart_notification_date, created_at) VALUES (?, ?, ?)
+               ON CONFLICT(user_id) DO UPDATE SET last_sleep_chart_notification_date = excluded.last_sleep_chart_notification_date""",
+            (user_id, today, now)
+        )
         
-        return result[0] if result and result[0] else None
+        conn.commit()
+        self._invalidate('user_metadata', user_id)
+        return True
     
-    def mark_sleep_chart_notification_sent(self, user_id: int) -> bool:
-        conn = sqlite3.connect(self.db_path)
+    def get_last_sleep_chart_notification_date(self, user_id: int) -> Optional[str]:
+        metadata = self._get_user_metadata(user_id)
+        return metadata['last_sleep_chart_notification_date'] if metadata and metadata['last_sleep_chart_notification_date'] else None
+    
+    def set_user_timezone(self, user_id: int, timezone: Optional[str]) -> bool:
+        """
+        Часовой пояс уведомлений (имя IANA); None — пояс сервера.
+        
+        Raises:
+            ValueError: Неизвестный часовой пояс
+        """
+        if timezone is not None:
+            timezone = resolve_timezone(timezone)
+        conn = self._connect()
         cursor = conn.cursor()
-        today = datetime.now().strftime("%Y-%m-%d")
         now = datetime.now().isoformat()
         
-        cursor.execute("SELECT id FROM user_metadata WHERE user_id = ?", (user_id,))
-        exists = cursor.fetchone()
+        cursor.execute(
+            """INSERT INTO user_metadata (user_id, timezone, created_at) VALUES (?, ?, ?)
+               ON CONFLICT(user_id) DO UPDATE SET timezone = excluded.timezone""",
+            (user_id, timezone, now)
+        )
+        
+        conn.commit()
+        self._invalidate('user_metadata', user_id)
+        self._notify_write('user_metadata', user_id)
+        return True
+    
+    def get_user_timezone(self, user_id: int) -> Optional[str]:
+        metadata = self._get_user_metadata(user_id)
+        return metadata['timezone'] if metadata and metadata['timezone'] else None
+    
+    def get_user_timezones(self) -> Dict[int, str]:
+        """user_id -> часовой пояс для пользователей со своим поясом (остальные — пояс сервера)"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT user_id, timezone FROM user_metadata WHERE timezone IS NOT NULL")
+        
+        return {row[0]: row[1] for row in cursor.fetchall()}
+    
+    def get_first_session_dates(self) -> List[Tuple[int, str]]:
+        """(user_id, first_session_date) всех пользователей — для загрузки планировщика уведомлений при старте"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT user_id, first_session_date FROM user_metadata WHERE first_session_date IS NOT NULL")
+        
+        return [(row[0], row[1]) for row in cursor.fetchall()]
+    
+    def get_recent_sleep_users(self, days: int = 7) -> List[int]:
+        """Пользователи с записями сна за последние days дней (по дневным итогам)"""
+        self.flush_writes()
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            """SELECT DISTINCT user_id FROM daily_user_stats
+               WHERE date >= date('now', '-' || ? || ' days') AND sleep_records > 0""",
+            (days,)
+        )
+        
+        return [row[0] for row in cursor.fetchall()]
+    
+    @staticmethod
+    def _due_notifications_query(day: str, timezone: Optional[str]) -> Tuple[str, tuple]:
+        """SQL и параметры выбора (user_id, kind) уведомлений дня day для пользователей пояса timezone."""
+        is_sunday = int(datetime.fromisoformat(day).weekday() == 6)
+        sql = f"""SELECT m.user_id, 'heatmap' AS kind FROM user_metadata m
+                WHERE {HEATMAP_PHASE_SQL} = CAST(julianday(?) AS INTEGER) % 14
+                  AND m.first_session_date <= date(?, '-14 days')
+                  AND m.last_heatmap_notification_date IS NOT ?
+                  AND m.timezone IS ?
+                  AND EXISTS (
+                      SELECT 1 FROM daily_user_stats d
+                      WHERE d.user_id = m.user_id AND d.date >= date(?, '-14 days')
+                        AND (d.focus_sessions > 0 OR d.workout_done > 0 OR d.workout_skipped > 0
+                             OR d.eng_done > 0 OR d.eng_skipped > 0)
+                  )
+                UNION ALL
+                SELECT m.user_id, 'sleep_chart' FROM user_metadata m
+                WHERE ? AND m.last_sleep_chart_notification_date IS NOT ?
+                  AND m.timezone IS ?
+                  AND m.user_id IN (
+                      SELECT d.user_id FROM daily_user_stats d
+                      WHERE d.sleep_records > 0 AND d.date >= date(?, '-7 days')
+                  )"""
+        return sql, (day, day, day, timezone, day, is_sunday, day, timezone, day)
+    
+    def get_due_notifications(
+        self,
+        day: Optional[str] = None,
+        batch_size: int = 1000,
+        timezone: Optional[str] = None
+    ) -> List[List[Tuple[int, str]]]:
+        """
+        Все уведомления пояса timezone, которые пора отправить в день day, — одним запросом.
+        
+        Тепловая карта: 14-й, 28-й, ... день от первого использования и хоть
+        одна сессия или упражнение за 14 дней. График сна: воскресенье и хоть
+        одна запись сна за 7 дней. Уже получившие уведомление в этот день
+        пропускаются. Обе части идут по индексам (фаза первого дня в
+        user_metadata и частичный индекс сна в daily_user_stats), без прохода
+        по всем пользователям.
+        
+        Args:
+            day: Дата YYYY-MM-DD (по умолчанию сегодня)
+            batch_size: Размер пачки при чтении результата (fetchmany)
+            timezone: Часовой пояс пользователей (None — пользователи с поясом сервера)
+        
+        Returns:
+            Пачки пар (user_id, 'heatmap' | 'sleep_chart')
+        """
+        day = day or datetime.now().strftime("%Y-%m-%d")
+        self.flush_writes()
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute(*self._due_notifications_query(day, timezone))
+        
+        batches = []
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            batches.append([(row[0], row[1]) for row in rows])
+        
+        return batches
+    
+    # Очередь уведомлений (outbox): scheduled_jobs
+    def enqueue_due_notifications(self, day: Optional[str] = None, timezone: Optional[str] = None) -> int:
+        """
+        Ставит в scheduled_jobs уведомления дня day для пояса timezone (тот же
+        выбор, что get_due_notifications). Повторный вызов за тот же день ничего
+        не добавляет: задача уникальна по (user_id, kind, due_date).
+        
+        Returns:
+            Сколько задач добавлено
+        """
+        day = day or datetime.now().strftime("%Y-%m-%d")
+        now = datetime.now().isoformat(timespec='seconds')
+        self.flush_writes()
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        sql, params = self._due_notifications_query(day, timezone)
+        cursor.execute(
+            f"""INSERT OR IGNORE INTO scheduled_jobs (user_id, kind, due_date, run_at, created_at)
+                SELECT user_id, kind, ?, ?, ? FROM ({sql})""",
+            (day, now, now) + params
+        )
+        
+        conn.commit()
+        return cursor.rowcount
+    
+    def claim_scheduled_jobs(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Забирает до limit готовых задач: pending -> running одним UPDATE ... RETURNING,
+        поэтому одну задачу не возьмут два исполнителя.
+        
+        Returns:
+            Задачи: id, user_id, kind, due_date, attempts (уже с этой попыткой)
+        """
+        now = datetime.now().isoformat(timespec='seconds')
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            """UPDATE scheduled_jobs SET status = 'running', attempts = attempts + 1, claimed_at = ?
+               WHERE id IN (
+                   SELECT id FROM scheduled_jobs
+                   WHERE status = 'pending' AND run_at <= ?
+                   ORDER BY run_at LIMIT ?
+               )
+               RETURNING id, user_id, kind, due_date, attempts""",
+            (now, now, limit)
+        )
+        rows = cursor.fetchall()
+        
+        conn.commit()
+        return [dict(row) for row in rows]
+    
+    def complete_scheduled_job(self, job_id: int) -> bool:
+        conn = self._connect()
+        cursor = conn.cursor()
         
-        if not exists:
+        cursor.execute(
+            "UPDATE scheduled_jobs SET status = 'done', last_error = NULL WHERE id = ?",
+            (job_id,)
+        )
+        
+        conn.commit()
+        return cursor.rowcount > 0
+    
+    def fail_scheduled_job(self, job_id: int, error: str, retry_at: Optional[datetime] = None) -> bool:
+        """
+        Отмечает неудачную попытку: задача вернётся в очередь к retry_at или,
+        если retry_at не задан (попытки кончились), останется в статусе failed.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        if retry_at is not None:
             cursor.execute(
-                "INSERT INTO user_metadata (user_id, last_sleep_chart_notification_date, created_at) VALUES (?, ?, ?)",
-                (user_id, today, now)
+                "UPDATE scheduled_jobs SET status = 'pending', run_at = ?, last_error = ? WHERE id = ?",
+                (retry_at.isoformat(timespec='seconds'), error, job_id)
             )
         else:
             cursor.execute(
-                "UPDATE user_metadata SET last_sleep_chart_notification_date = ? WHERE user_id = ?",
-                (today, user_id)
+                "UPDATE scheduled_jobs SET status = 'failed', last_error = ? WHERE id = ?",
+                (error, job_id)
             )
         
         conn.commit()
-        conn.close()
-        return True
+        return cursor.rowcount > 0
     
-    def get_last_sleep_chart_notification_date(self, user_id: int) -> Optional[str]:
-        conn = sqlite3.connect(self.db_path)
+    def recover_stale_jobs(self, lease_seconds: int = 600) -> int:
+        """
+        Возвращает в очередь задачи, взятые больше lease_seconds назад и так и
+        не завершённые: исполнитель упал или процесс перезапустили посреди рассылки.
+        
+        Returns:
+            Сколько задач возвращено
+        """
+        cutoff = (datetime.now() - timedelta(seconds=lease_seconds)).isoformat(timespec='seconds')
+        conn = self._connect()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT last_sleep_chart_notification_date FROM user_metadata WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        conn.close()
+        cursor.execute(
+            "UPDATE scheduled_jobs SET status = 'pending' WHERE status = 'running' AND claimed_at < ?",
+            (cutoff,)
+        )
         
-        return result[0] if result and result[0] else None
+        conn.commit()
+        return cursor.rowcount
+    
+    def get_next_scheduled_job_time(self) -> Optional[datetime]:
+        """Время ближайшей задачи в очереди (pending), None — очередь пуста."""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT MIN(run_at) FROM scheduled_jobs WHERE status = 'pending'")
+        
+        row = cursor.fetchone()
+        return datetime.fromisoformat(row[0]) if row and row[0] else None
     
-    def get_all_users(self) -> List[int]:
-        """Получает список всех user_id из user_metadata"""
-        conn = sqlite3.connect(self.db_path)
+    def prune_scheduled_jobs(self, days: int = 30) -> int:
+        """Удаляет завершённые и провалившиеся задачи старше days дней."""
+        conn = self._connect()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT DISTINCT user_id FROM user_metadata WHERE user_id IS NOT NULL")
-        results = cursor.fetchall()
-        conn.close()
+        cursor.execute(
+            """DELETE FROM scheduled_jobs
+               WHERE status IN ('done', 'failed') AND due_date < date('now', '-' || ? || ' days')""",
+            (days,)
+        )
         
-        return [row[0] for row in results]
+        conn.commit()
+        return cursor.rowcount
     
     # Методы для изучения слов с SRS
     def add_vocabulary_word(self, user_id: int, word: str, explanation: str, translation: str) -> int:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         now = datetime.now().isoformat()
         today = datetime.now().strftime("%Y-%m-%d")
@@ -1326,34 +1704,28 @@ class Database:
         
         word_id = cursor.lastrowid
         conn.commit()
-        conn.close()
         return word_id
     
     def get_all_vocabulary_words(self, user_id: int) -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT * FROM vocabulary_words WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
+        cursor.execute("SELECT * FROM vocabulary_words WHERE user_id = ? ORDER BY created_at DESC, id DESC", (user_id,))
         rows = cursor.fetchall()
-        conn.close()
         
         return [dict(row) for row in rows]
     
     def get_vocabulary_word_by_id(self, user_id: int, word_id: int) -> Optional[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute("SELECT * FROM vocabulary_words WHERE user_id = ? AND id = ?", (user_id, word_id))
         row = cursor.fetchone()
-        conn.close()
         
         return dict(row) if row else None
     
     def get_words_for_review(self, user_id: int) -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         today = datetime.now().strftime("%Y-%m-%d")
         
@@ -1365,66 +1737,134 @@ class Database:
         )
         
         rows = cursor.fetchall()
-        conn.close()
         
         return [dict(row) for row in rows]
     
     def update_word_review(self, user_id: int, word_id: int, success: bool) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         now = datetime.now().isoformat()
-        today = datetime.now()
-        
-        # Получаем текущие данные слова
-        word_data = self.get_vocabulary_word_by_id(user_id, word_id)
-        if not word_data:
-            conn.close()
-            return False
-        
-        ease_factor = float(word_data.get('ease_factor', 2.5))
-        interval_days = int(word_data.get('interval_days', 1))
-        repetitions = int(word_data.get('repetitions', 0))
-        
-        if success:
-            # Успешное повторение - увеличиваем интервал и ease_factor
-            if repetitions == 0:
-                interval_days = 1
-            elif repetitions == 1:
-                interval_days = 6
-            else:
-                interval_days = int(interval_days * ease_factor)
-            
-            ease_factor = max(1.3, ease_factor + 0.1 - (5 - 3) * 0.08)
-            repetitions += 1
-        else:
-            # Ошибка - сбрасываем интервал и уменьшаем ease_factor
-            interval_days = 1
-            repetitions = 0
-            ease_factor = max(1.3, ease_factor - 0.2)
-        
-        next_review = (today + timedelta(days=interval_days)).strftime("%Y-%m-%d")
+        today = datetime.now().strftime("%Y-%m-%d")
         
+        # SM-2 с оценкой 3: при успехе интервал 1 → 6 → interval * ease_factor,
+        # ease_factor += 0.1 - (5 - 3) * 0.08; при ошибке интервал 1, повторения 0,
+        # ease_factor -= 0.2. Ease factor не опускается ниже 1.3.
         cursor.execute(
-            "UPDATE vocabulary_words SET ease_factor = ?, interval_days = ?, repetitions = ?, next_review_date = ?, last_review_date = ? WHERE user_id = ? AND id = ?",
-            (ease_factor, interval_days, repetitions, next_review, now, user_id, word_id)
+            f"""UPDATE vocabulary_words SET
+                    interval_days = {_WORD_INTERVAL_SQL},
+                    next_review_date = date(:today, '+' || {_WORD_INTERVAL_SQL} || ' days'),
+                    ease_factor = CASE WHEN :ok
+                        THEN MAX(1.3, COALESCE(ease_factor, 2.5) + 0.1 - (5 - 3) * 0.08)
+                        ELSE MAX(1.3, COALESCE(ease_factor, 2.5) - 0.2) END,
+                    repetitions = CASE WHEN :ok THEN COALESCE(repetitions, 0) + 1 ELSE 0 END,
+                    last_review_date = :now
+                WHERE user_id = :user_id AND id = :word_id""",
+            {'today': today, 'now': now, 'ok': 1 if success else 0, 'user_id': user_id, 'word_id': word_id}
         )
         
         update_success = cursor.rowcount > 0
         conn.commit()
-        conn.close()
         return update_success
     
     def delete_vocabulary_word(self, user_id: int, word_id: int) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute("DELETE FROM vocabulary_words WHERE user_id = ? AND id = ?", (user_id, word_id))
         
         success = cursor.rowcount > 0
         conn.commit()
-        conn.close()
         return success
-    
+
+    def delete_vocabulary_words(self, user_id: int, word_ids: List[int]) -> int:
+        """Удаляет слова по списку id одной транзакцией. Возвращает число удалённых"""
+        word_ids = list(word_ids)
+        if not word_ids:
+            return 0
+        conn = self._connect()
+        cursor = conn.cursor()
+        deleted = 0
+
+        try:
+            # Пачками, чтобы не упереться в лимит параметров SQLite (999 в старых сборках)
+            for start in range(0, len(word_ids), 500):
+                chunk = word_ids[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                cursor.execute(
+                    f"DELETE FROM vocabulary_words WHERE user_id = ? AND id IN ({placeholders})",
+                    (user_id, *chunk)
+                )
+                deleted += cursor.rowcount
+            conn.commit()
+            return deleted
+        except Exception as e:
+            conn.rollback()
+            print(f"Ошибка при удалении слов: {e}")
+            return 0
+
+    def delete_all_vocabulary_words(
+        self,
+        user_id: int,
+        created_before: Optional[str] = None,
+        min_repetitions: Optional[int] = None
+    ) -> int:
+        """
+        Удаляет все слова пользователя одним DELETE. Возвращает число удалённых.
+
+        Фильтры сужают удаление: created_before — только слова, добавленные раньше
+        этой даты (ISO), min_repetitions — только выученные (repetitions >= N).
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        query = "DELETE FROM vocabulary_words WHERE user_id = ?"
+        params = [user_id]
+        if created_before:
+            query += " AND created_at < ?"
+            params.append(created_before)
+        if min_repetitions is not None:
+            query += " AND repetitions >= ?"
+            params.append(min_repetitions)
+
+        cursor.execute(query, params)
+        deleted = cursor.rowcount
+        conn.commit()
+        return deleted
+
+    def count_vocabulary_words(self, user_id: int) -> int:
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT COUNT(*) FROM vocabulary_words WHERE user_id = ?", (user_id,))
+        return cursor.fetchone()[0]
+
+    def get_vocabulary_words_page(self, user_id: int, limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+        """Страница словаря в том же порядке, что и get_all_vocabulary_words"""
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            "SELECT * FROM vocabulary_words WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+            (user_id, limit, offset)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_vocabulary_word_position(self, user_id: int, word_id: int) -> Optional[int]:
+        """Позиция слова (с 0) в порядке get_vocabulary_words_page, None если слова нет"""
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """SELECT (
+                   SELECT COUNT(*) FROM vocabulary_words AS v
+                   WHERE v.user_id = w.user_id
+                     AND (v.created_at > w.created_at OR (v.created_at = w.created_at AND v.id > w.id))
+               ) FROM vocabulary_words AS w WHERE w.user_id = ? AND w.id = ?""",
+            (user_id, word_id)
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+
     def export_vocabulary_to_csv(self, user_id: int) -> str:
         import csv
         import io
@@ -1492,7 +1932,8 @@ class Database:
     
     def delete_all_stats(self, user_id: int) -> bool:
         """Удаляет всю статистику для конкретного пользователя"""
-        conn = sqlite3.connect(self.db_path)
+        self.flush_writes()
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -1507,12 +1948,78 @@ class Database:
             cursor.execute("DELETE FROM brain_dumps WHERE user_id = ?", (user_id,))
             cursor.execute("DELETE FROM learning_notes WHERE user_id = ?", (user_id,))
             cursor.execute("DELETE FROM focus_tasks WHERE user_id = ?", (user_id,))
+            cursor.execute("DELETE FROM daily_user_stats WHERE user_id = ?", (user_id,))
             
             conn.commit()
-            conn.close()
+            for table in ('workout_plans', 'eng_plans', 'focus_tasks'):
+                self._invalidate(table, user_id)
+            for table in ('detailed_sessions', 'sleep_records', 'workout_exercise_completions', 'eng_exercise_completions'):
+                self._notify_write(table, user_id)
             return True
         except Exception as e:
             conn.rollback()
-            conn.close()
             print(f"Ошибка при удалении статистики: {e}")
-            return False
\ No newline at end of file
+            return False
+
+
+class AsyncDatabase:
+    """
+    Неблокирующий фасад над Database для обработчиков aiogram.
+
+    Любой метод Database доступен как корутина: вызов уходит в отдельный
+    пул потоков, поэтому медленный запрос или ожидание блокировки не
+    останавливают event loop. Очередь ограничена: при max_pending
+    незавершённых вызовах новые ждут свободного места, а не копятся в памяти.
+    """
+
+    def __init__(self, database: Database, max_workers: int = 4, max_pending: int = 256):
+        self.database = database
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        self._slots = asyncio.Semaphore(max_pending)
+
+    async def run(self, func, *args, **kwargs):
+        """Выполняет func(*args, **kwargs) в пуле потоков базы."""
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.database, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        return call
+
+    async def close(self):
+        """Дожидается текущих запросов и закрывает соединения."""
+        await asyncio.to_thread(self._executor.shutdown, wait=True)
+        self.database.close()
+
+
+if __name__ == "__main__":
+    # Разовые служебные команды:
+    #   python database.py --backfill-daily-stats [--db naparnik.db]
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Служебные команды базы «Напарника»")
+    parser.add_argument("--db", default="naparnik.db", help="Путь к файлу базы")
+    parser.add_argument(
+        "--backfill-daily-stats", action="store_true",
+        help="Пересчитать daily_user_stats по всей истории сессий, упражнений и сна"
+    )
+    args = parser.parse_args()
+
+    if not args.backfill_daily_stats:
+        parser.print_help()
+    else:
+        database = Database(args.db)
+        try:
+            started = time.perf_counter()
+            rows = database.rebuild_daily_stats()
+            print(f"daily_user_stats: {rows} строк за {time.perf_counter() - started:.2f} с")
+        finally:
+            database.close()
@@ -0,0 +1,239 @@
+"""
+Параллельная рассылка уведомлений с ограничением частоты запросов к Telegram.
+
+Задачи (нарисовать график и отправить) выполняются пулом из concurrency
+корутин, а сами вызовы Bot API проходят через deliver():
+    - общий token bucket — не больше rate сообщений в секунду (лимит
+      Telegram для рассылок — около 30 в секунду на бота);
+    - лимит на чат — не чаще одного сообщения в per_chat_interval секунд;
+    - TelegramRetryAfter (429) ставит на паузу всю рассылку на retry_after
+      секунд и повторяет вызов; сетевые ошибки и 5xx повторяются с
+      экспоненциальной задержкой;
+    - бот заблокирован (403) или запрос отклонён (400: чат не найден и
+      т. п.) — не повторяется:
+      deliver() бросает UndeliverableError, а run() считает такие задачи
+      отдельно (blocked), а не ошибками доставки.
+
+Ход рассылки печатается раз в progress_interval секунд, итог возвращает run().
+"""
+
+import asyncio
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, Iterable, Optional, Tuple, Union
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+
+# Временные сбои Telegram: тот же запрос позже может пройти
+RETRYABLE_ERRORS = (TelegramRetryAfter, TelegramNetworkError, TelegramServerError)
+
+
+class UndeliverableError(Exception):
+    """Сообщение в этот чат не доставить: бот заблокирован или чат не найден. Повторять бессмысленно."""
+
+    def __init__(self, chat_id: int, error: Exception):
+        super().__init__(f"чат {chat_id}: {error}")
+        self.chat_id = chat_id
+
+
+class TokenBucket:
+    """
+    Маркерная корзина: rate маркеров в секунду, не больше capacity впрок.
+
+    Ждущие обслуживаются по очереди (asyncio.Lock честный), поэтому всплеск
+    задач не превращается во всплеск запросов. pause() останавливает выдачу
+    маркеров целиком — так обрабатывается RetryAfter от Telegram.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated: Optional[float] = None
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        loop = asyncio.get_running_loop()
+        self._paused_until = max(self._paused_until, loop.time() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self._updated is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class NotificationFanout:
+    """Пул корутин для рассылки с общим и поштучным (на чат) ограничением частоты."""
+
+    def __init__(
+        self,
+        concurrency: int = 16,
+        rate: float = 25.0,
+        burst: float = 5.0,
+        per_chat_interval: float = 1.0,
+        max_retries: int = 3,
+        progress_interval: float = 10.0
+    ):
+        """
+        Args:
+            concurrency: Сколько задач выполняется одновременно (рендер + отправка)
+            rate: Сообщений в секунду на всего бота
+            burst: Сколько сообщений можно отправить подряд без ожидания
+                (rate + burst не должны превышать лимит Telegram за секунду)
+            per_chat_interval: Минимальный интервал между сообщениями в один чат, секунды
+            max_retries: Повторов одного вызова после RetryAfter или сетевой ошибки
+            progress_interval: Как часто печатать ход рассылки, секунды
+        """
+        self.concurrency = concurrency
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        self._bucket = TokenBucket(rate, burst)
+        self._chat_next: Dict[int, float] = {}
+        self.retries = 0
+        self.blocked = 0
+
+    async def _wait_for_chat(self, chat_id: int):
+        """Резервирует слот чата и ждёт его: параллельные вызовы в один чат встают в очередь."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = slot + self.per_chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def deliver(self, chat_id: int, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполняет вызов Bot API в рамках лимитов, повторяя его после RetryAfter и сбоев сети.
+
+        Args:
+            chat_id: Чат, в который уходит сообщение
+            call: Функция без аргументов, возвращающая корутину запроса
+                (вызывается заново на каждый повтор)
+
+        Raises:
+            UndeliverableError: Бот заблокирован пользователем или чат не найден
+        """
+        attempt = 0
+        while True:
+            await self._wait_for_chat(chat_id)
+            await self._bucket.acquire()
+            try:
+                return await call()
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                self.blocked += 1
+                raise UndeliverableError(chat_id, e) from e
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                print(f"Рассылка: Telegram просит подождать {e.retry_after} с (чат {chat_id})")
+                self._bucket.pause(e.retry_after)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                print(f"Рассылка: повтор запроса в чат {chat_id} после ошибки: {e}")
+                await asyncio.sleep(2 ** attempt)
+            attempt += 1
+            self.retries += 1
+
+    async def run(
+        self,
+        jobs: Union[Iterable[Tuple[int, Callable[[], Awaitable[Any]]]], AsyncIterable[Tuple[int, Callable[[], Awaitable[Any]]]]],
+        total: Optional[int] = None,
+        label: str = "Рассылка"
+    ) -> Dict[str, Any]:
+        """
+        Выполняет задачи с ограниченной параллельностью.
+
+        Args:
+            jobs: Пары (chat_id, функция задачи), обычный или асинхронный
+                итератор — он читается по мере освобождения исполнителей; задача
+                возвращает истину, если сообщение отправлено, и ложь, если
+                отправлять было нечего
+            total: Число задач для отчёта о ходе (если известно заранее)
+            label: Подпись в сообщениях о ходе
+
+        Returns:
+            Итог: total, sent, skipped, blocked (чат недоступен), failed,
+            retries, elapsed_s
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        retries_before = self.retries
+        counts = {'sent': 0, 'skipped': 0, 'blocked': 0, 'failed': 0}
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        def summary() -> Dict[str, Any]:
+            done = sum(counts.values())
+            return {
+                'total': total if total is not None else done,
+                **counts,
+                'retries': self.retries - retries_before,
+                'elapsed_s': round(loop.time() - started, 1),
+            }
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                chat_id, job = item
+                try:
+                    counts['sent' if await job() else 'skipped'] += 1
+                except UndeliverableError as e:
+                    counts['blocked'] += 1
+                    print(f"{label}: не доставлено, {e}")
+                except Exception as e:
+                    counts['failed'] += 1
+                    print(f"{label}: ошибка для чата {chat_id}: {e}")
+
+        async def report():
+            while True:
+                await asyncio.sleep(self.progress_interval)
+                s = summary()
+                done = s['sent'] + s['skipped'] + s['blocked'] + s['failed']
+                progress = f"{done}/{total}" if total is not None else str(done)
+                print(f"{label}: {progress}, отправлено {s['sent']}, недоступно {s['blocked']}, ошибок {s['failed']}, "
+                      f"повторов {s['retries']}, {s['elapsed_s']:.0f} с")
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        reporter = asyncio.create_task(report())
+        try:
+            if hasattr(jobs, '__aiter__'):
+                async for item in jobs:
+                    await queue.put(item)
+            else:
+                for item in jobs:
+                    await queue.put(item)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            reporter.cancel()
+            for task in workers:
+                task.cancel()
+            # Слоты чатов нужны только внутри рассылки
+            now = loop.time()
+            self._chat_next = {chat: t for chat, t in self._chat_next.items() if t > now}
+
+        result = summary()
+        print(f"{label}: готово — {result}")
+        return result
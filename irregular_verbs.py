@@ -1,8 +1,75 @@
 """
 200 самых употребляемых неправильных глаголов английского языка.
 Формат: (форма 1, форма 2, форма 3, перевод, пример со 2 формой, пример с 3 формой)
+
+VerbIndex — неизменяемый индекс глаголов в памяти: строится один раз при
+старте из таблицы irregular_verbs, после чего показ глаголов не ходит в SQLite.
 """
 
+import random
+from typing import Any, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+
+class IrregularVerb(NamedTuple):
+    id: int
+    verb_form1: str
+    verb_form2: str
+    verb_form3: str
+    translation: str
+    example_form2: Optional[str] = None
+    example_form3: Optional[str] = None
+
+
+class VerbIndex:
+    """Глаголы в кортеже + словари поиска по id и по любой из трёх форм."""
+
+    __slots__ = ('_verbs', '_by_id', '_by_form')
+
+    def __init__(self, verbs: Iterable[IrregularVerb] = ()):
+        self._verbs: Tuple[IrregularVerb, ...] = tuple(verbs)
+        self._by_id: Dict[int, IrregularVerb] = {verb.id: verb for verb in self._verbs}
+        by_form: Dict[str, list] = {}
+        for verb in self._verbs:
+            # "was/were", "got/gotten" — каждый вариант ищется отдельно
+            forms = {
+                variant.strip().lower()
+                for form in (verb.verb_form1, verb.verb_form2, verb.verb_form3)
+                for variant in form.split("/")
+            }
+            for form in forms:
+                by_form.setdefault(form, []).append(verb)
+        self._by_form: Dict[str, Tuple[IrregularVerb, ...]] = {
+            form: tuple(items) for form, items in by_form.items()
+        }
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> "VerbIndex":
+        """Строит индекс из строк Database.get_all_irregular_verbs()"""
+        return cls(
+            IrregularVerb(*(row.get(field) for field in IrregularVerb._fields))
+            for row in rows
+        )
+
+    def __len__(self) -> int:
+        return len(self._verbs)
+
+    def __iter__(self) -> Iterator[IrregularVerb]:
+        return iter(self._verbs)
+
+    def get(self, verb_id: int) -> Optional[IrregularVerb]:
+        return self._by_id.get(verb_id)
+
+    def find(self, form: str) -> Tuple[IrregularVerb, ...]:
+        """Глаголы, у которых одна из форм совпадает с form (без учёта регистра)"""
+        return self._by_form.get(form.strip().lower(), ())
+
+    def random(self, rng: random.Random = random) -> Optional[IrregularVerb]:
+        """Случайный глагол за O(1), None если индекс пуст"""
+        if not self._verbs:
+            return None
+        return self._verbs[rng.randrange(len(self._verbs))]
+
+
 IRREGULAR_VERBS = [
     ("be", "was/were", "been", "быть", "I was at home yesterday.", "I have been there before."),
     ("have", "had", "had", "иметь", "I had a car last year.", "I have had this book for a week."),
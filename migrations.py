@@ -0,0 +1,501 @@
+"""
+Версионированные миграции схемы SQLite.
+
+Текущая версия схемы хранится в PRAGMA user_version. При старте
+применяются только миграции с номером больше сохранённого, все вместе в
+одной транзакции, поэтому тёплый старт — это одно чтение PRAGMA.
+
+Новые изменения схемы (таблицы, колонки, индексы) добавляются только
+новой миграцией со следующим номером; уже выпущенные миграции не
+редактируются.
+"""
+
+import sqlite3
+from typing import Callable, Dict, List
+
+
+# Номер версии -> функция, получающая курсор внутри общей транзакции
+MIGRATIONS: Dict[int, Callable[[sqlite3.Cursor], None]] = {}
+
+
+def migration(version: int):
+    """Регистрирует функцию как миграцию схемы с номером version."""
+    def register(func: Callable[[sqlite3.Cursor], None]):
+        if version in MIGRATIONS:
+            raise ValueError(f"Миграция {version} уже зарегистрирована")
+        MIGRATIONS[version] = func
+        return func
+    return register
+
+
+def latest_version() -> int:
+    """Номер последней известной миграции."""
+    return max(MIGRATIONS) if MIGRATIONS else 0
+
+
+def _column_names(cursor: sqlite3.Cursor, table: str) -> List[str]:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Применяет недостающие миграции.
+
+    Args:
+        conn: Соединение с базой
+
+    Returns:
+        Версия схемы после миграции
+    """
+    target = latest_version()
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    if current >= target:
+        return current
+
+    cursor = conn.cursor()
+    # IMMEDIATE: второй процесс, стартующий одновременно, дождётся нас и
+    # увидит уже обновлённую версию
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        current = cursor.execute("PRAGMA user_version").fetchone()[0]
+        for version in sorted(v for v in MIGRATIONS if v > current):
+            MIGRATIONS[version](cursor)
+            print(f"Миграция схемы: применена версия {version}")
+            current = version
+        cursor.execute(f"PRAGMA user_version = {current}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return current
+
+
+@migration(1)
+def _baseline_schema(cursor: sqlite3.Cursor):
+    """Исходная схема v2.0 (бывшие _init_db и _migrate_add_user_id)."""
+    # Таблица сессий фокуса (с поддержкой многопользовательности)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS focus_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            date TEXT NOT NULL,
+            direction TEXT NOT NULL,
+            duration INTEGER NOT NULL,
+            focus_status TEXT NOT NULL,
+            description TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+
+    # Таблица разгрузок головы
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS brain_dumps (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            date TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    """)
+
+    # Таблица заметок об обучении
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS learning_notes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            date TEXT NOT NULL,
+            note TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    """)
+
+    # Таблица детального трекинга сессий (v1.1)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS detailed_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            date TEXT NOT NULL,
+            domain TEXT NOT NULL,
+            task_type TEXT NOT NULL,
+            planned_minutes INTEGER NOT NULL,
+            actual_minutes INTEGER,
+            status TEXT NOT NULL,
+            focus_status TEXT,
+            description TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+
+    # Таблица SRS для английского (v1.1)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS english_srs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            phrase_en TEXT NOT NULL,
+            phrase_ru TEXT NOT NULL,
+            example TEXT,
+            interval_days INTEGER DEFAULT 1,
+            last_reviewed TEXT,
+            next_review TEXT,
+            success_count INTEGER DEFAULT 0,
+            fail_count INTEGER DEFAULT 0,
+            ease_factor REAL DEFAULT 2.5,
+            created_at TEXT NOT NULL,
+            UNIQUE(user_id, phrase_en)
+        )
+    """)
+
+    # Таблица истории изучения английского (v1.1)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS english_reviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            phrase_id INTEGER NOT NULL,
+            user_answer TEXT,
+            is_correct INTEGER NOT NULL,
+            reviewed_at TEXT NOT NULL,
+            FOREIGN KEY (phrase_id) REFERENCES english_srs(id)
+        )
+    """)
+
+    # Таблица сна (v1.1)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sleep_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            date TEXT NOT NULL,
+            sleep_start TEXT NOT NULL,
+            sleep_end TEXT,
+            duration_minutes INTEGER,
+            created_at TEXT NOT NULL
+        )
+    """)
+
+    # Таблица планов тренировок на неделю
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS workout_plans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            day_of_week INTEGER NOT NULL,
+            exercises TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            UNIQUE(user_id, day_of_week)
+        )
+    """)
+
+    # Таблица выполнения тренировок
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS workout_completions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            date TEXT NOT NULL,
+            day_of_week INTEGER NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+    """)
+
+    # Таблица выполнения упражнений тренировки (по каждому упражнению)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS workout_exercise_completions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            date TEXT NOT NULL,
+            day_of_week INTEGER NOT NULL,
+            exercise_index INTEGER NOT NULL,
+            exercise_name TEXT NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+    """)
+
+    # Таблица планов ENG на неделю
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS eng_plans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            day_of_week INTEGER NOT NULL,
+            exercises TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            UNIQUE(user_id, day_of_week)
+        )
+    """)
+
+    # Таблица выполнения упражнений ENG (по каждому упражнению)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS eng_exercise_completions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            date TEXT NOT NULL,
+            day_of_week INTEGER NOT NULL,
+            exercise_index INTEGER NOT NULL,
+            exercise_name TEXT NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+    """)
+
+    # Таблица неправильных глаголов (общая для всех пользователей - справочник)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS irregular_verbs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            verb_form1 TEXT NOT NULL UNIQUE,
+            verb_form2 TEXT NOT NULL,
+            verb_form3 TEXT NOT NULL,
+            translation TEXT NOT NULL,
+            example_form2 TEXT,
+            example_form3 TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+
+    # Таблица задач для сессий фокуса
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS focus_tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            task_name TEXT NOT NULL,
+            description TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+
+    # Таблица для отслеживания первого использования и уведомлений (per-user)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_metadata (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER UNIQUE,
+            first_session_date TEXT,
+            last_heatmap_notification_date TEXT,
+            last_sleep_chart_notification_date TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+
+    # Таблица для изучения слов с SRS
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS vocabulary_words (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            word TEXT NOT NULL,
+            explanation TEXT NOT NULL,
+            translation TEXT NOT NULL,
+            ease_factor REAL DEFAULT 2.5,
+            interval_days INTEGER DEFAULT 1,
+            repetitions INTEGER DEFAULT 0,
+            next_review_date TEXT,
+            last_review_date TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+
+    # Базы, созданные до многопользовательской версии, не имеют user_id
+    for table in (
+        'focus_sessions', 'brain_dumps', 'learning_notes', 'detailed_sessions',
+        'english_srs', 'english_reviews', 'sleep_records', 'workout_plans',
+        'workout_completions', 'workout_exercise_completions', 'eng_plans',
+        'eng_exercise_completions', 'focus_tasks', 'vocabulary_words'
+    ):
+        if 'user_id' not in _column_names(cursor, table):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN user_id INTEGER NOT NULL DEFAULT 0")
+
+    # Индексы для производительности
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detailed_sessions_date ON detailed_sessions(date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detailed_sessions_domain ON detailed_sessions(domain)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_english_srs_next_review ON english_srs(next_review)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sleep_records_date ON sleep_records(date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_workout_completions_date ON workout_completions(date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_workout_completions_day ON workout_completions(day_of_week)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_workout_exercise_completions_date ON workout_exercise_completions(date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_eng_plans_user ON eng_plans(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_eng_exercise_completions_date ON eng_exercise_completions(date)")
+
+    # Индексы для user_id (для быстрой фильтрации по пользователю)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_focus_sessions_user ON focus_sessions(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_brain_dumps_user ON brain_dumps(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_learning_notes_user ON learning_notes(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detailed_sessions_user ON detailed_sessions(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_english_srs_user ON english_srs(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sleep_records_user ON sleep_records(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_workout_plans_user ON workout_plans(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_workout_completions_user ON workout_completions(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_focus_tasks_user ON focus_tasks(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_vocabulary_words_user ON vocabulary_words(user_id)")
+
+
+@migration(2)
+def _composite_indexes(cursor: sqlite3.Cursor):
+    """
+    Составные индексы под форму горячих запросов: user_id + диапазон/сортировка.
+
+    Одноколоночные индексы, ставшие префиксом составных (или не
+    используемые ни одним запросом), удаляются, чтобы не платить за них
+    на каждой вставке.
+    """
+    for name in (
+        'idx_detailed_sessions_date', 'idx_detailed_sessions_domain', 'idx_detailed_sessions_user',
+        'idx_english_srs_next_review', 'idx_english_srs_user',
+        'idx_sleep_records_date', 'idx_sleep_records_user',
+        'idx_workout_completions_date', 'idx_workout_completions_day', 'idx_workout_completions_user',
+        'idx_workout_exercise_completions_date', 'idx_eng_exercise_completions_date',
+        'idx_eng_plans_user', 'idx_workout_plans_user',  # покрыты UNIQUE(user_id, day_of_week)
+        'idx_focus_sessions_user', 'idx_brain_dumps_user', 'idx_learning_notes_user',
+        'idx_focus_tasks_user', 'idx_vocabulary_words_user'
+    ):
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+    # Списки "за сегодня" / "последние N" по пользователю
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_focus_sessions_user_date ON focus_sessions(user_id, date, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_brain_dumps_user_created ON brain_dumps(user_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_learning_notes_user_created ON learning_notes(user_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_focus_tasks_user_created ON focus_tasks(user_id, created_at)")
+
+    # detailed_sessions / sleep_records: WHERE user_id = ? AND date >= ? ORDER BY date DESC, created_at DESC
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detailed_sessions_user_date ON detailed_sessions(user_id, date, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sleep_records_user_date ON sleep_records(user_id, date, created_at)")
+    # Незавершённый сон: частичный индекс содержит только открытые записи
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sleep_records_open ON sleep_records(user_id, created_at) WHERE sleep_end IS NULL")
+
+    # Отметки выполнения: WHERE user_id = ? AND date = ? AND day_of_week = ? ORDER BY exercise_index
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_workout_completions_user_date ON workout_completions(user_id, date, day_of_week)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_workout_exercise_completions_user_date ON workout_exercise_completions(user_id, date, day_of_week, exercise_index)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_eng_exercise_completions_user_date ON eng_exercise_completions(user_id, date, day_of_week, exercise_index)")
+
+    # SRS: очередь повторения по пользователю
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_english_srs_user_review ON english_srs(user_id, next_review)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_vocabulary_words_user_created ON vocabulary_words(user_id, created_at)")
+    # Выражение совпадает с ORDER BY в Database.get_words_for_review — так сортировка берётся из индекса
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vocabulary_words_review_queue ON vocabulary_words(
+            user_id,
+            (CASE WHEN repetitions = 0 THEN 1 WHEN ease_factor < 2.0 THEN 2 ELSE 3 END),
+            next_review_date
+        )
+    """)
+
+
+@migration(3)
+def _workout_completions_unique(cursor: sqlite3.Cursor):
+    """Одна отметка тренировки на (user_id, date, day_of_week) — цель для ON CONFLICT."""
+    # Дубликаты могли появиться при гонке SELECT → INSERT; остаётся самая ранняя запись,
+    # её же раньше обновлял mark_workout_completed
+    cursor.execute("""
+        DELETE FROM workout_completions WHERE id NOT IN (
+            SELECT MIN(id) FROM workout_completions GROUP BY user_id, date, day_of_week
+        )
+    """)
+    cursor.execute("DROP INDEX IF EXISTS idx_workout_completions_user_date")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_workout_completions_user_date ON workout_completions(user_id, date, day_of_week)")
+
+
+# Пересчёт daily_user_stats из исходных таблиц. Используется миграцией 4 и
+# Database.rebuild_daily_stats; при изменении формулы нужна новая миграция.
+DAILY_USER_STATS_REBUILD_SQL = """
+    INSERT INTO daily_user_stats (
+        user_id, date, focus_sessions, focus_completed, focus_minutes,
+        workout_done, workout_skipped, eng_done, eng_skipped, sleep_minutes, sleep_records
+    )
+    SELECT user_id, date, SUM(fs), SUM(fc), SUM(fm), SUM(wd), SUM(ws), SUM(ed), SUM(es), SUM(sm), SUM(sr)
+    FROM (
+        SELECT user_id, date, 1 AS fs, COALESCE(status = 'completed', 0) AS fc, COALESCE(actual_minutes, 0) AS fm,
+               0 AS wd, 0 AS ws, 0 AS ed, 0 AS es, 0 AS sm, 0 AS sr
+        FROM detailed_sessions
+        UNION ALL
+        SELECT user_id, date, 0, 0, 0, completed != 0, completed = 0, 0, 0, 0, 0
+        FROM workout_exercise_completions
+        UNION ALL
+        SELECT user_id, date, 0, 0, 0, 0, 0, completed != 0, completed = 0, 0, 0
+        FROM eng_exercise_completions
+        UNION ALL
+        SELECT user_id, date, 0, 0, 0, 0, 0, 0, 0, duration_minutes, 1
+        FROM sleep_records WHERE duration_minutes IS NOT NULL
+    )
+    WHERE date IS NOT NULL
+    GROUP BY user_id, date
+"""
+
+
+@migration(4)
+def _daily_user_stats(cursor: sqlite3.Cursor):
+    """Дневные итоги пользователя: графики и анализ за N дней читают не больше N строк."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS daily_user_stats (
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            focus_sessions INTEGER NOT NULL DEFAULT 0,
+            focus_completed INTEGER NOT NULL DEFAULT 0,
+            focus_minutes INTEGER NOT NULL DEFAULT 0,
+            workout_done INTEGER NOT NULL DEFAULT 0,
+            workout_skipped INTEGER NOT NULL DEFAULT 0,
+            eng_done INTEGER NOT NULL DEFAULT 0,
+            eng_skipped INTEGER NOT NULL DEFAULT 0,
+            sleep_minutes INTEGER NOT NULL DEFAULT 0,
+            sleep_records INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, date)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("DELETE FROM daily_user_stats")
+    cursor.execute(DAILY_USER_STATS_REBUILD_SQL)
+
+
+# Фаза 14-дневного цикла тепловой карты: день D — срок, если фаза D равна
+# фазе первого дня. Выражение должно совпадать с индексом буквально —
+# Database.get_due_notifications подставляет эту же строку.
+HEATMAP_PHASE_SQL = "CAST(julianday(first_session_date) AS INTEGER) % 14"
+
+
+@migration(5)
+def _due_notification_indexes(cursor: sqlite3.Cursor):
+    """Индексы выбора пользователей, которым сегодня пора отправить уведомление."""
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_user_metadata_heatmap_phase
+        ON user_metadata(({HEATMAP_PHASE_SQL}), first_session_date)
+        WHERE first_session_date IS NOT NULL
+    """)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_daily_user_stats_sleep ON daily_user_stats(date, user_id) WHERE sleep_records > 0"
+    )
+
+
+@migration(6)
+def _scheduled_jobs(cursor: sqlite3.Cursor):
+    """Очередь уведомлений (outbox): срок переживает перезапуск, повтор — с задержкой."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scheduled_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            due_date TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_at TEXT NOT NULL,
+            claimed_at TEXT,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            UNIQUE (user_id, kind, due_date)
+        )
+    """)
+    # status + run_at: выборка готовых задач (pending) и зависших (running)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scheduled_jobs_status ON scheduled_jobs(status, run_at)")
+
+
+@migration(7)
+def _user_timezone(cursor: sqlite3.Cursor):
+    """Часовой пояс пользователя (имя IANA) для уведомлений; NULL — пояс сервера."""
+    if 'timezone' not in _column_names(cursor, 'user_metadata'):
+        cursor.execute("ALTER TABLE user_metadata ADD COLUMN timezone TEXT")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_metadata_timezone ON user_metadata(timezone) WHERE timezone IS NOT NULL"
+    )
+
+
+@migration(8)
+def _phrase_next_review_isoformat(cursor: sqlite3.Cursor):
+    """next_review с миллисекундами (strftime %f) — к формату datetime.isoformat() с микросекундами."""
+    cursor.execute("""
+        UPDATE english_srs SET next_review = next_review || '000'
+        WHERE length(next_review) = 23 AND substr(next_review, 20, 1) = '.'
+    """)
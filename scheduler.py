@@ -0,0 +1,391 @@
+"""
+Планировщик push-уведомлений на очереди с приоритетом по времени.
+
+Вместо опроса всех пользователей раз в минуту планировщик держит кучу
+(heapq) с ближайшим сроком каждого уведомления каждого пользователя и спит
+до самого раннего срока. Пока ничего не подошло, он не делает запросов к
+базе. Подошедшие записи снимаются с кучи и перепланируются за O(log n).
+
+Куча решает, когда запускать раунд рассылки, а кому отправлять — один
+индексированный запрос Database.enqueue_due_notifications: он же отсеивает
+уже уведомлённых сегодня и пользователей без данных за период и кладёт
+задачи в таблицу scheduled_jobs (outbox). Дальше задачи живут в базе:
+    - исполнитель забирает их атомарно (pending -> running);
+    - попытка, сорвавшаяся из-за временного сбоя (RetryAfter, сеть, 5xx
+      Telegram, таймаут), возвращает задачу в очередь с растущей задержкой,
+      после MAX_JOB_ATTEMPTS она остаётся в статусе failed; остальные
+      ошибки (бот заблокирован, чат не найден, ошибка рендера) сразу
+      переводят задачу в failed;
+    - задачи, взятые упавшим процессом, возвращаются в очередь;
+    - при старте ставятся уведомления, пропущенные, пока бот не работал
+      (сегодня после 20:00 и вчера — в каждом поясе), — повторно никто не
+      получит: задача уникальна по (user_id, вид, день).
+Сама рассылка идёт параллельно с лимитами Telegram (fanout.py).
+
+Уведомления приходят в 20:00 по часовому поясу пользователя
+(user_metadata.timezone, /timezone; без пояса — по поясу сервера). У всех
+пользователей одного пояса срок совпадает, поэтому раунд — это корзина
+(пояс, день): один запрос ставит её задачи в очередь, и рассылка идёт
+корзинами по мере того, как 20:00 наступает в разных поясах, а не одной
+волной на всех.
+
+Сроки меняются по событиям базы (Database.add_write_listener):
+    user_metadata  — set_first_session_date: появился первый день, от него
+                     считаются тепловые карты (каждые 14 дней в 20:00);
+                     set_user_timezone: сроки пользователя пересчитываются;
+    sleep_records  — complete_sleep: есть сон за неделю, график сна — в
+                     ближайшее воскресенье в 20:00.
+"""
+
+import asyncio
+import functools
+import heapq
+import itertools
+from datetime import date, datetime, time, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+from database import resolve_timezone
+from fanout import RETRYABLE_ERRORS, NotificationFanout
+
+HEATMAP = 'heatmap'
+SLEEP_CHART = 'sleep_chart'
+
+NOTIFICATION_HOUR = 20
+HEATMAP_PERIOD_DAYS = 14
+SLEEP_CHART_WEEKDAY = 6  # воскресенье
+SLEEP_LOOKBACK_DAYS = 7
+
+# Очередь scheduled_jobs
+RETRYABLE_JOB_ERRORS = RETRYABLE_ERRORS + (asyncio.TimeoutError,)
+JOB_CLAIM_BATCH = 100
+MAX_JOB_ATTEMPTS = 5
+JOB_RETRY_BASE_SECONDS = 60  # 1, 2, 4, 8 минут между попытками
+JOB_LEASE_SECONDS = 600  # задача в running дольше — исполнитель завис или упал
+CATCH_UP_DAYS = 1
+JOB_RETENTION_DAYS = 30
+
+# Потолок одного сна: переход на летнее время или «спящая» VM сдвигают часы,
+# поэтому срок раз в час сверяется с datetime.now() (без запросов к базе)
+MAX_SLEEP_SECONDS = 3600
+
+
+def local_now(timezone: Optional[str] = None) -> datetime:
+    """Текущее время в поясе timezone; без пояса — наивное время сервера."""
+    return datetime.now(ZoneInfo(timezone) if timezone else None)
+
+
+def local_time(timestamp: float, timezone: Optional[str] = None) -> datetime:
+    return datetime.fromtimestamp(timestamp, ZoneInfo(timezone) if timezone else None)
+
+
+def next_heatmap_due(first_session_date: str, after: datetime) -> datetime:
+    """
+    Ближайшая тепловая карта после after: 20:00 на 14-й, 28-й, ... день
+    от первого использования, в поясе after.
+    """
+    first = date.fromisoformat(first_session_date)
+    days = max((after.date() - first).days, HEATMAP_PERIOD_DAYS)
+    day = first + timedelta(days=-(-days // HEATMAP_PERIOD_DAYS) * HEATMAP_PERIOD_DAYS)
+    due = datetime.combine(day, time(NOTIFICATION_HOUR), tzinfo=after.tzinfo)
+    if due <= after:
+        due += timedelta(days=HEATMAP_PERIOD_DAYS)
+    return due
+
+
+def next_sleep_chart_due(after: datetime) -> datetime:
+    """Ближайшее воскресенье, 20:00 в поясе after, позже after."""
+    due = after.replace(hour=NOTIFICATION_HOUR, minute=0, second=0, microsecond=0)
+    due += timedelta(days=(SLEEP_CHART_WEEKDAY - after.weekday()) % 7)
+    if due <= after:
+        due += timedelta(days=7)
+    return due
+
+
+class NotificationScheduler:
+    """
+    Куча сроков (время, user_id, вид уведомления) и цикл, который спит до ближайшего.
+
+    Для каждой пары (user_id, вид) действителен только последний срок из
+    self._due; устаревшие записи кучи пропускаются при извлечении (ленивое
+    удаление), а когда их накапливается больше, чем живых, куча пересобирается.
+    """
+
+    def __init__(self, db, send: Callable[[str, int], Awaitable[bool]], fanout: Optional[NotificationFanout] = None):
+        """
+        Args:
+            db: AsyncDatabase
+            send: Корутина send(kind, user_id) — рисует и отправляет уведомление,
+                возвращает True, если оно ушло
+            fanout: Параллельная рассылка раунда (по умолчанию с лимитами Telegram)
+        """
+        self.db = db
+        self.send = send
+        self.fanout = fanout or NotificationFanout()
+        self._heap: List[Tuple[float, int, int, str]] = []
+        self._due: Dict[Tuple[int, str], float] = {}
+        self._first_dates: Dict[int, str] = {}
+        self._timezones: Dict[int, str] = {}  # только пользователи со своим поясом
+        self._counter = itertools.count()  # порядок при равных сроках, без сравнения kind
+        self._pending_users: set = set()
+        self._jobs_at: Optional[float] = None  # ближайшая задача в scheduled_jobs
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def schedule(self, user_id: int, kind: str, due: datetime):
+        """Ставит (или переносит) срок уведомления; будит цикл, если срок стал ближайшим."""
+        timestamp = due.timestamp()
+        key = (user_id, kind)
+        if self._due.get(key) == timestamp:
+            return
+        self._due[key] = timestamp
+        heapq.heappush(self._heap, (timestamp, next(self._counter), user_id, kind))
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._compact()
+        if self._wakeup is not None and self._heap[0][0] == timestamp:
+            self._wakeup.set()
+
+    def cancel(self, user_id: int, kind: str):
+        self._due.pop((user_id, kind), None)
+
+    def _compact(self):
+        """Пересобирает кучу только из действительных записей."""
+        self._heap = [entry for entry in self._heap if self._due.get((entry[2], entry[3])) == entry[0]]
+        heapq.heapify(self._heap)
+
+    def _peek(self) -> Optional[float]:
+        """Срок ближайшей действительной записи (устаревшие снимаются с вершины)."""
+        while self._heap:
+            timestamp, _, user_id, kind = self._heap[0]
+            if self._due.get((user_id, kind)) == timestamp:
+                return timestamp
+            heapq.heappop(self._heap)
+        return None
+
+    def _now(self, user_id: int) -> datetime:
+        return local_now(self._timezones.get(user_id))
+    
+    def _schedule_heatmap(self, user_id: int, first_session_date: str, after: datetime):
+        self._first_dates[user_id] = first_session_date
+        try:
+            self.schedule(user_id, HEATMAP, next_heatmap_due(first_session_date, after))
+        except ValueError:
+            print(f"Планировщик: некорректная дата первого использования у пользователя {user_id}: "
+                  f"{first_session_date!r}")
+
+    async def load(self):
+        """Начальное заполнение при старте — единственный проход по всем пользователям."""
+        for user_id, timezone in (await self.db.get_user_timezones()).items():
+            await self._set_timezone(user_id, timezone)
+        for user_id, first_session_date in await self.db.get_first_session_dates():
+            self._schedule_heatmap(user_id, first_session_date, self._now(user_id))
+        for user_id in await self.db.get_recent_sleep_users(SLEEP_LOOKBACK_DAYS):
+            self.schedule(user_id, SLEEP_CHART, next_sleep_chart_due(self._now(user_id)))
+        print(f"Планировщик уведомлений: {len(self)} запланировано, "
+              f"часовых поясов {len(self._timezone_buckets())}")
+        await self._catch_up()
+    
+    async def _set_timezone(self, user_id: int, timezone: Optional[str]):
+        """
+        Запоминает пояс пользователя. Пояс, который больше не находится (убран
+        из tzdata или записан в базу в обход set_user_timezone), сбрасывается
+        в базе на NULL: иначе пользователь не попал бы ни в одну корзину.
+        """
+        if timezone:
+            try:
+                self._timezones[user_id] = resolve_timezone(timezone)
+                return
+            except ValueError as e:
+                print(f"Планировщик: {e} у пользователя {user_id}, сброшен на пояс сервера")
+                await self.db.set_user_timezone(user_id, None)
+        self._timezones.pop(user_id, None)
+    
+    def _timezone_buckets(self) -> Set[Optional[str]]:
+        """Пояса, в которых есть пользователи; None — пояс сервера."""
+        return set(self._timezones.values()) | {None}
+    
+    async def _catch_up(self):
+        """Восстановление очереди после перезапуска и постановка пропущенных дней."""
+        # Бот работает в одном экземпляре: всё, что осталось в running, взял
+        # прошлый процесс, и ждать истечения аренды незачем
+        recovered = await self.db.recover_stale_jobs(0)
+        added = 0
+        for timezone in self._timezone_buckets():
+            now = local_now(timezone)
+            for offset in range(CATCH_UP_DAYS, -1, -1):
+                day = now.date() - timedelta(days=offset)
+                if datetime.combine(day, time(NOTIFICATION_HOUR), tzinfo=now.tzinfo) <= now:
+                    added += await self.db.enqueue_due_notifications(day.isoformat(), timezone)
+        pruned = await self.db.prune_scheduled_jobs(JOB_RETENTION_DAYS)
+        await self._refresh_jobs_at()
+        print(f"Очередь уведомлений: возвращено {recovered}, пропущенных добавлено {added}, "
+              f"удалено старых {pruned}")
+    
+    async def _refresh_jobs_at(self):
+        next_at = await self.db.get_next_scheduled_job_time()
+        self._jobs_at = next_at.timestamp() if next_at else None
+    
+    def on_write(self, table: str, user_id: int):
+        """
+        Подписчик Database.add_write_listener. Вызывается из потока базы —
+        сама работа переносится в event loop планировщика.
+        """
+        if self._loop is None or table not in ('user_metadata', 'sleep_records'):
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._handle_write, table, user_id)
+        except RuntimeError:
+            pass  # loop уже закрыт — бот останавливается
+
+    def _handle_write(self, table: str, user_id: int):
+        if table == 'sleep_records':
+            self.schedule(user_id, SLEEP_CHART, next_sleep_chart_due(self._now(user_id)))
+        else:
+            # Первый день и пояс дочитает цикл: запрос к базе — не в колбэке
+            self._pending_users.add(user_id)
+            self._wakeup.set()
+
+    async def _load_pending(self):
+        users, self._pending_users = self._pending_users, set()
+        for user_id in users:
+            await self._set_timezone(user_id, await self.db.get_user_timezone(user_id))
+            now = self._now(user_id)
+            first_session_date = await self.db.get_first_session_date(user_id)
+            if first_session_date:
+                self._schedule_heatmap(user_id, first_session_date, now)
+            if (user_id, SLEEP_CHART) in self._due:
+                self.schedule(user_id, SLEEP_CHART, next_sleep_chart_due(now))
+
+    async def _enqueue_round(self, entries: List[Tuple[int, str, float]]):
+        """
+        Раунд: записи кучи, срок которых подошёл, превращаются в задачи scheduled_jobs
+        по корзинам (пояс, день) — один запрос на корзину.
+        """
+        buckets = set()
+        for user_id, kind, _ in entries:
+            self.cancel(user_id, kind)
+        for user_id, kind, timestamp in entries:
+            timezone = self._timezones.get(user_id)
+            buckets.add((timezone, local_time(timestamp, timezone).date().isoformat()))
+        added = 0
+        for timezone, day in buckets:
+            added += await self.db.enqueue_due_notifications(day, timezone)
+        print(f"Планировщик уведомлений: раунд из {len(entries)} срок(ов), "
+              f"корзин {len(buckets)}, в очередь {added}")
+        # Тепловая карта повторяется каждые 14 дней; график сна снова
+        # планирует следующая запись сна (complete_sleep)
+        for user_id, kind, timestamp in entries:
+            if kind == HEATMAP and user_id in self._first_dates:
+                due = local_time(timestamp, self._timezones.get(user_id))
+                self._schedule_heatmap(user_id, self._first_dates[user_id], due)
+    
+    async def _claimed_jobs(self):
+        """Задачи очереди пачками по JOB_CLAIM_BATCH — следующая пачка берётся, когда освободятся исполнители."""
+        while True:
+            jobs = await self.db.claim_scheduled_jobs(JOB_CLAIM_BATCH)
+            if not jobs:
+                return
+            for job in jobs:
+                yield job['user_id'], functools.partial(self._run_job, job)
+    
+    async def _drain(self):
+        """Выполняет все готовые задачи scheduled_jobs."""
+        await self.db.recover_stale_jobs(JOB_LEASE_SECONDS)
+        await self.fanout.run(self._claimed_jobs(), label="Уведомления")
+        await self._refresh_jobs_at()
+    
+    async def _already_sent(self, job: dict) -> bool:
+        """Уведомление за этот день уже ушло — например, процесс упал между отправкой и отметкой задачи."""
+        if job['kind'] == HEATMAP:
+            last = await self.db.get_last_heatmap_notification_date(job['user_id'])
+        else:
+            last = await self.db.get_last_sleep_chart_notification_date(job['user_id'])
+        return bool(last) and last >= job['due_date']
+    
+    async def _mark_sent(self, job: dict):
+        """Отметка «уведомление за день due_date отправлено» — день в поясе пользователя."""
+        if job['kind'] == HEATMAP:
+            await self.db.mark_heatmap_notification_sent(job['user_id'], job['due_date'])
+        else:
+            await self.db.mark_sleep_chart_notification_sent(job['user_id'], job['due_date'])
+    
+    async def _run_job(self, job: dict) -> bool:
+        """
+        Одна задача: отправка и отметка в scheduled_jobs. Временный сбой —
+        повтор с задержкой, остальные ошибки — сразу failed.
+        """
+        try:
+            sent = not await self._already_sent(job) and await self.send(job['kind'], job['user_id'])
+            if sent:
+                await self._mark_sent(job)
+        except RETRYABLE_JOB_ERRORS as e:
+            retry_at = None
+            if job['attempts'] < MAX_JOB_ATTEMPTS:
+                retry_at = datetime.now() + timedelta(seconds=JOB_RETRY_BASE_SECONDS * 2 ** (job['attempts'] - 1))
+            await self.db.fail_scheduled_job(job['id'], str(e) or type(e).__name__, retry_at)
+            raise
+        except Exception as e:
+            # Повтор не поможет: бот заблокирован (UndeliverableError) или ошибка в рендере
+            await self.db.fail_scheduled_job(job['id'], str(e) or type(e).__name__)
+            raise
+        await self.db.complete_scheduled_job(job['id'])
+        return sent
+    
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await self.load()
+                break
+            except Exception as e:
+                print(f"Ошибка загрузки планировщика уведомлений: {e}")
+                await asyncio.sleep(60)
+        while True:
+            try:
+                await self._tick()
+            except Exception as e:
+                print(f"Ошибка в планировщике уведомлений: {e}")
+                await asyncio.sleep(60)
+
+    async def _tick(self):
+        """Одна итерация: дочитать новых пользователей, затем спать до срока или провести раунд."""
+        self._wakeup.clear()
+        if self._pending_users:
+            await self._load_pending()
+        timestamp = self._peek()
+        now = datetime.now().timestamp()
+        wake = min((t for t in (timestamp, self._jobs_at) if t is not None), default=None)
+        if wake is None or wake > now:
+            timeout = MAX_SLEEP_SECONDS if wake is None else min(wake - now, MAX_SLEEP_SECONDS)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return
+        # Все записи кучи, подошедшие к этому моменту, — одним раундом
+        entries = []
+        while timestamp is not None and timestamp <= now:
+            _, _, user_id, kind = heapq.heappop(self._heap)
+            entries.append((user_id, kind, timestamp))
+            timestamp = self._peek()
+        if entries:
+            await self._enqueue_round(entries)
+        await self._drain()
+    
+    def start(self) -> asyncio.Task:
+        """run() фоновой задачей; ссылка хранится здесь, чтобы задачу не собрал GC."""
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
@@ -1,10 +1,26 @@
 """
 Сервисы для бота Напарник v1.1
+
+analytics (matplotlib, seaborn, pandas) загружается лениво — при первом
+обращении к его функциям (PEP 562). Процесс бота его не импортирует: графики
+рисуются в воркерах services.render, поэтому webhook поднимается без этих
+библиотек в памяти. search откладывает импорт requests/googleapiclient до
+первого поиска.
 """
 
-from .analytics import generate_productivity_heatmap, generate_stats_charts, generate_sleep_chart
+import importlib
+
 from .search import search_info
 from .export import export_sessions_to_csv, export_english_to_csv, export_sleep_to_csv
+from .render import ChartRenderer
+from .chart_cache import ChartCache
+
+# Имя -> подмодуль, из которого оно загружается при первом обращении
+_LAZY = {
+    'generate_productivity_heatmap': 'analytics',
+    'generate_stats_charts': 'analytics',
+    'generate_sleep_chart': 'analytics',
+}
 
 __all__ = [
     'generate_productivity_heatmap',
@@ -13,5 +29,20 @@ __all__ = [
     'search_info',
     'export_sessions_to_csv',
     'export_english_to_csv',
-    'export_sleep_to_csv'
+    'export_sleep_to_csv',
+    'ChartRenderer',
+    'ChartCache'
 ]
+
+
+def __getattr__(name):
+    module_name = _LAZY.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value  # следующие обращения — без __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
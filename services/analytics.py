@@ -1,20 +1,140 @@
 """
 Сервис для аналитики и визуализации данных.
-Генерирует графики через matplotlib.
+
+Здесь — подготовка данных для графиков; рисует их бэкенд, выбранный
+переменной окружения CHART_BACKEND: matplotlib (services.chart_mpl, по
+умолчанию) или Pillow (services.chart_pil). Бэкенд возвращает картинку, в
+PNG/JPEG её переводит services.encode — формат выбирается по типу графика.
 """
 
+import importlib
 import io
+import os
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
-import matplotlib
-matplotlib.use('Agg')  # Для работы без GUI
-import matplotlib.pyplot as plt
-import seaborn as sns
+from typing import List, Dict, Any, Optional
+import numpy as np
 import pandas as pd
 
-sns.set_style("whitegrid")
-plt.rcParams['figure.figsize'] = (10, 6)
-plt.rcParams['font.size'] = 10
+from . import encode
+
+
+WEEKDAY_LABELS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+
+def _parse_sessions(sessions: List[Dict[str, Any]]):
+    """
+    created_at -> datetime64[s] и status -> 1.0/0.0 для всех сессий разом.
+
+    Строки разбираются одним вызовом NumPy; если среди них есть битые,
+    разбор идёт поштучно, а такие сессии отбрасываются (как раньше).
+    """
+    created = [s.get('created_at') for s in sessions]
+    success = np.fromiter((s.get('status') == 'completed' for s in sessions), dtype=np.float64, count=len(sessions))
+    try:
+        timestamps = np.array(created, dtype='datetime64[s]')
+    except (TypeError, ValueError):
+        parsed = []
+        for value in created:
+            try:
+                parsed.append(np.datetime64(datetime.fromisoformat(value).replace(tzinfo=None), 's'))
+            except (TypeError, ValueError):
+                parsed.append(np.datetime64('NaT'))
+        timestamps = np.array(parsed, dtype='datetime64[s]')
+    valid = ~np.isnat(timestamps)  # None разбирается в NaT
+    return timestamps[valid], success[valid]
+
+
+def heatmap_matrix(sessions: List[Dict[str, Any]]):
+    """
+    Матрица успешности 7x24 (день недели x час) из сессий.
+
+    Ячейка = доля сессий со status == 'completed'. Считается векторно:
+    индекс ячейки weekday * 24 + hour и два np.bincount (всего и успешных).
+
+    Returns:
+        (rates, counts) — float-массив 7x24 (0 там, где нет данных) и число сессий в ячейке
+    """
+    timestamps, success = _parse_sessions(sessions)
+
+    days = timestamps.astype('datetime64[D]')
+    hours = (timestamps - days).astype('timedelta64[h]').astype(np.int64)
+    weekdays = (days.astype(np.int64) + 3) % 7  # 1970-01-01 — четверг; 0 = понедельник
+    cells = weekdays * 24 + hours
+
+    counts = np.bincount(cells, minlength=7 * 24)
+    successes = np.bincount(cells, weights=success, minlength=7 * 24)
+    rates = np.divide(successes, counts, out=np.zeros(7 * 24), where=counts > 0)
+    return rates.reshape(7, 24), counts.reshape(7, 24)
+
+
+def heatmap_matrix_from_cells(cells: List[Dict[str, Any]]):
+    """
+    Матрица 7x24 из ячеек, уже посчитанных в базе (Database.get_heatmap_cells).
+
+    Returns:
+        (rates, counts) — как у heatmap_matrix
+    """
+    counts = np.zeros((7, 24))
+    successes = np.zeros((7, 24))
+    for cell in cells:
+        counts[cell['weekday'], cell['hour']] = cell['total']
+        successes[cell['weekday'], cell['hour']] = cell['completed'] or 0
+    rates = np.divide(successes, counts, out=np.zeros((7, 24)), where=counts > 0)
+    return rates, counts
+
+
+CHART_BACKENDS = {
+    'matplotlib': 'chart_mpl',  # качество: оси дат, сглаживание, легенды
+    'pillow': 'chart_pil',      # скорость и память: рисование прямо в буфер
+}
+
+DEFAULT_CHART_BACKEND = 'matplotlib'
+
+_backends = {}
+
+
+def get_backend(name: Optional[str] = None):
+    """
+    Модуль бэкенда графиков (импортируется при первом обращении).
+
+    Args:
+        name: Имя из CHART_BACKENDS или None — тогда берётся переменная
+            окружения CHART_BACKEND.
+
+    Returns:
+        Модуль с функциями heatmap, stats, sleep, empty и warm
+    """
+    name = name or os.getenv("CHART_BACKEND", DEFAULT_CHART_BACKEND)
+    backend = _backends.get(name)
+    if backend is None:
+        if name not in CHART_BACKENDS:
+            raise ValueError(f"Неизвестный бэкенд графиков: {name}. Доступны: {', '.join(CHART_BACKENDS)}")
+        backend = _backends[name] = importlib.import_module(f".{CHART_BACKENDS[name]}", __package__)
+    return backend
+
+
+def warm_backend():
+    """Импорт и прогрев выбранного бэкенда и кодировщика (для инициализатора воркера)."""
+    backend = get_backend()
+    backend.warm()
+    encode.encode(backend.empty('Нет данных для отображения'), 'empty')
+    encode.drain_records()  # прогрев не попадает в статистику
+
+
+def _empty_chart(text: str) -> io.BytesIO:
+    return encode.encode(get_backend().empty(text), 'empty')
+
+
+def render_heatmap_matrix(rates: np.ndarray, counts: np.ndarray) -> io.BytesIO:
+    """
+    Рисует тепловую карту 7x24 выбранным бэкендом.
+
+    Подписи значений ставятся только в ячейки с данными — вместо 168
+    текстовых объектов sns.heatmap(annot=True).
+    """
+    if not counts.any():
+        return _empty_chart('Нет данных для отображения')
+    return encode.encode(get_backend().heatmap(rates, counts), 'heatmap')
 
 
 def generate_productivity_heatmap(sessions: List[Dict[str, Any]]) -> io.BytesIO:
@@ -28,83 +148,23 @@ def generate_productivity_heatmap(sessions: List[Dict[str, Any]]) -> io.BytesIO:
         BytesIO объект с изображением
     """
     if not sessions:
-        # Создаем пустой график
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.text(0.5, 0.5, 'Нет данных для отображения', 
-                ha='center', va='center', fontsize=16)
-        ax.axis('off')
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', dpi=100)
-        plt.close()
-        buf.seek(0)
-        return buf
+        return _empty_chart('Нет данных для отображения')
     
-    # Подготовка данных
-    data = []
-    for session in sessions:
-        try:
-            dt = datetime.fromisoformat(session['created_at'])
-            hour = dt.hour
-            weekday = dt.weekday()  # 0 = Monday, 6 = Sunday
-            is_completed = 1 if session.get('status') == 'completed' else 0
-            data.append({'hour': hour, 'weekday': weekday, 'success': is_completed})
-        except:
-            continue
-    
-    if not data:
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.text(0.5, 0.5, 'Нет данных для отображения', 
-                ha='center', va='center', fontsize=16)
-        ax.axis('off')
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', dpi=100)
-        plt.close()
-        buf.seek(0)
-        return buf
-    
-    df = pd.DataFrame(data)
-    
-    # Создаем сводную таблицу
-    pivot = df.groupby(['weekday', 'hour'])['success'].mean().reset_index()
-    pivot_table = pivot.pivot(index='weekday', columns='hour', values='success')
-    pivot_table = pivot_table.fillna(0)
-    
-    # Всегда показываем все 7 дней и часы 0–23 для избежания FixedLocator/labels mismatch
-    all_weekdays = list(range(7))
-    all_hours = list(range(24))
-    pivot_table = pivot_table.reindex(index=all_weekdays, columns=all_hours, fill_value=0)
-    
-    # Создаем график
-    fig, ax = plt.subplots(figsize=(14, 6))
-    
-    # Тепловая карта
-    sns.heatmap(
-        pivot_table,
-        annot=True,
-        fmt='.2f',
-        cmap='YlOrRd',
-        cbar_kws={'label': 'Успешность'},
-        ax=ax,
-        vmin=0,
-        vmax=1
-    )
-    
-    # Настройка осей
-    weekdays = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
-    ax.set_yticklabels([weekdays[i] for i in range(7)], rotation=0)
-    ax.set_xlabel('Час дня', fontsize=12)
-    ax.set_ylabel('День недели', fontsize=12)
-    ax.set_title('Тепловая карта продуктивности', fontsize=14, fontweight='bold')
-    
-    plt.tight_layout()
-    
-    # Сохраняем в буфер
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight', dpi=100)
-    plt.close()
-    buf.seek(0)
+    rates, counts = heatmap_matrix(sessions)
+    return render_heatmap_matrix(rates, counts)
+
+
+def generate_heatmap_from_cells(cells: List[Dict[str, Any]]) -> io.BytesIO:
+    """
+    Тепловая карта по агрегатам из базы (Database.get_heatmap_cells).
+
+    Args:
+        cells: Ячейки weekday/hour/total/completed
     
-    return buf
+    Returns:
+        BytesIO объект с изображением
+    """
+    return render_heatmap_matrix(*heatmap_matrix_from_cells(cells))
 
 
 def generate_stats_charts(sessions: List[Dict[str, Any]]) -> io.BytesIO:
@@ -118,15 +178,7 @@ def generate_stats_charts(sessions: List[Dict[str, Any]]) -> io.BytesIO:
         BytesIO объект с изображением
     """
     if not sessions:
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.text(0.5, 0.5, 'Нет данных для отображения', 
-                ha='center', va='center', fontsize=16)
-        ax.axis('off')
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', dpi=100)
-        plt.close()
-        buf.seek(0)
-        return buf
+        return _empty_chart('Нет данных для отображения')
     
     # Подготовка данных
     data = []
@@ -145,63 +197,45 @@ def generate_stats_charts(sessions: List[Dict[str, Any]]) -> io.BytesIO:
             continue
     
     if not data:
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.text(0.5, 0.5, 'Нет данных для отображения', 
-                ha='center', va='center', fontsize=16)
-        ax.axis('off')
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', dpi=100)
-        plt.close()
-        buf.seek(0)
-        return buf
+        return _empty_chart('Нет данных для отображения')
     
     df = pd.DataFrame(data)
+    by_date = df.groupby('date')
+    daily = pd.DataFrame({
+        'sessions': by_date.size(),
+        'avg_duration': by_date['duration'].mean(),
+        'completion_rate': by_date['completed'].mean() * 100,
+    }).sort_index()
+    
+    return generate_daily_stats_chart([
+        {'date': date, **row} for date, row in daily.to_dict('index').items()
+    ])
+
+
+def generate_daily_stats_chart(daily: List[Dict[str, Any]]) -> io.BytesIO:
+    """
+    Графики статистики по дневным итогам (Database.get_daily_session_stats).
     
-    # Создаем 3 подграфика — линейные графики для наглядного отображения трендов
-    fig, axes = plt.subplots(3, 1, figsize=(12, 10))
-    
-    # Общий стиль: линия с маркерами, чёткие оси
-    line_style = {'linewidth': 2, 'marker': 'o', 'markersize': 5}
-    
-    # 1. Сессии по дням
-    sessions_by_date = df.groupby('date').size().sort_index()
-    axes[0].plot(sessions_by_date.index, sessions_by_date.values, color='steelblue', **line_style)
-    axes[0].set_title('Количество сессий по дням', fontweight='bold')
-    axes[0].set_xlabel('Дата')
-    axes[0].set_ylabel('Количество сессий')
-    axes[0].tick_params(axis='x', rotation=45)
-    axes[0].grid(True, alpha=0.3)
-    axes[0].set_ylim(bottom=0)
-    
-    # 2. Средняя длительность
-    avg_duration = df.groupby('date')['duration'].mean().sort_index()
-    axes[1].plot(avg_duration.index, avg_duration.values, color='green', **line_style)
-    axes[1].set_title('Средняя длительность сессий (минуты)', fontweight='bold')
-    axes[1].set_xlabel('Дата')
-    axes[1].set_ylabel('Минуты')
-    axes[1].tick_params(axis='x', rotation=45)
-    axes[1].grid(True, alpha=0.3)
-    axes[1].set_ylim(bottom=0)
-    
-    # 3. Процент завершённых
-    completion_rate = (df.groupby('date')['completed'].mean() * 100).sort_index()
-    axes[2].plot(completion_rate.index, completion_rate.values, color='orange', **line_style)
-    axes[2].set_title('Процент завершённых сессий', fontweight='bold')
-    axes[2].set_xlabel('Дата')
-    axes[2].set_ylabel('Процент (%)')
-    axes[2].tick_params(axis='x', rotation=45)
-    axes[2].grid(True, alpha=0.3)
-    axes[2].set_ylim(0, 100)
-    
-    plt.tight_layout()
-    
-    # Сохраняем в буфер
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight', dpi=100)
-    plt.close()
-    buf.seek(0)
+    Args:
+        daily: Строки date/sessions/avg_duration/completion_rate по возрастанию даты
     
-    return buf
+    Returns:
+        BytesIO объект с изображением
+    """
+    if not daily:
+        return _empty_chart('Нет данных для отображения')
+    
+    dates = [
+        day['date'] if not isinstance(day['date'], str) else datetime.fromisoformat(day['date']).date()
+        for day in daily
+    ]
+    image = get_backend().stats(
+        dates,
+        [day['sessions'] for day in daily],
+        [day['avg_duration'] or 0 for day in daily],
+        [day['completion_rate'] or 0 for day in daily]
+    )
+    return encode.encode(image, 'stats')
 
 
 def generate_sleep_chart(sleep_records: List[Dict[str, Any]]) -> io.BytesIO:
@@ -215,15 +249,7 @@ def generate_sleep_chart(sleep_records: List[Dict[str, Any]]) -> io.BytesIO:
         BytesIO объект с изображением
     """
     if not sleep_records:
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.text(0.5, 0.5, 'Нет данных о сне', 
-                ha='center', va='center', fontsize=16)
-        ax.axis('off')
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', dpi=100)
-        plt.close()
-        buf.seek(0)
-        return buf
+        return _empty_chart('Нет данных о сне')
     
     # Подготовка данных
     data = []
@@ -238,40 +264,9 @@ def generate_sleep_chart(sleep_records: List[Dict[str, Any]]) -> io.BytesIO:
                 continue
     
     if not data:
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.text(0.5, 0.5, 'Нет данных о сне', 
-                ha='center', va='center', fontsize=16)
-        ax.axis('off')
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', dpi=100)
-        plt.close()
-        buf.seek(0)
-        return buf
+        return _empty_chart('Нет данных о сне')
     
     df = pd.DataFrame(data)
     df = df.sort_values('date')
     
-    # Создаем линейный график
-    fig, ax = plt.subplots(figsize=(12, 6))
-    
-    ax.plot(df['date'], df['duration'], color='navy', linewidth=2, marker='o', markersize=5)
-    ax.axhline(y=7, color='green', linestyle='--', linewidth=2, label='Рекомендуемый минимум (7ч)')
-    ax.axhline(y=6, color='orange', linestyle='--', linewidth=2, label='Минимум (6ч)')
-    ax.set_ylim(bottom=0)
-    
-    ax.set_title('График сна', fontsize=14, fontweight='bold')
-    ax.set_xlabel('Дата')
-    ax.set_ylabel('Длительность (часы)')
-    ax.tick_params(axis='x', rotation=45)
-    ax.grid(True, alpha=0.3)
-    ax.legend()
-    
-    plt.tight_layout()
-    
-    # Сохраняем в буфер
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight', dpi=100)
-    plt.close()
-    buf.seek(0)
-    
-    return buf
+    return encode.encode(get_backend().sleep(list(df['date']), df['duration'].values), 'sleep')
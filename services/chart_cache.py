@@ -0,0 +1,178 @@
+"""
+Кэш готовых графиков (PNG).
+
+Ключ — (user_id, тип графика, день, версия данных пользователя). Версия —
+версия группы пользователя в LRUCache (version/invalidate): она меняется
+при каждой записи в таблицы, из которых строятся графики (подписка
+Database.add_write_listener), поэтому повторный просмотр без новых
+данных — один поиск в кэше вместо запроса в базу и рендера. День в ключе
+нужен потому, что окно графиков ("последние 14 дней") сдвигается само.
+
+Горячие записи лежат в памяти (LRU с лимитом), вытесненные — на диске.
+Файлы на диске учитываются в индексе (порядок записи и общий объём), так
+что сброс файла и соблюдение spill_max_bytes не требуют обхода каталога.
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from cache import LRUCache
+
+# Таблицы, от которых зависят графики
+CHART_TABLES = frozenset({
+    'detailed_sessions',
+    'workout_exercise_completions',
+    'eng_exercise_completions',
+    'sleep_records',
+})
+
+
+class ChartCache:
+    """LRU в памяти + сброс вытесненных PNG на диск, инвалидация по записи в базу."""
+
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        spill_dir: Optional[str] = None,
+        spill_max_bytes: int = 256 * 1024 * 1024
+    ):
+        self.spill_dir = spill_dir or os.path.join(tempfile.gettempdir(), "naparnik_charts")
+        self.spill_max_bytes = spill_max_bytes
+        self._memory = LRUCache(max_bytes=max_bytes, group_size=1, on_evict=self._spill)
+        self._lock = threading.Lock()
+        # Файлы на диске в порядке записи: путь -> (байты, user_id)
+        self._disk: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+        self._disk_by_user: Dict[int, Set[str]] = {}
+        self.disk_bytes = 0
+        self.disk_hits = 0
+        # Версии живут только в памяти процесса — файлы прошлого запуска не
+        # годятся, поэтому индекс диска начинается с пустого каталога
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        os.makedirs(self.spill_dir, exist_ok=True)
+
+    def on_write(self, table: str, user_id: int):
+        """Подписчик Database.add_write_listener: новая версия данных пользователя."""
+        if table not in CHART_TABLES:
+            return
+        self._memory.invalidate(user_id)
+        with self._lock:
+            for path in self._disk_by_user.pop(user_id, ()):
+                size, _ = self._disk.pop(path)
+                self.disk_bytes -= size
+        shutil.rmtree(self._user_dir(user_id), ignore_errors=True)
+
+    def key(self, user_id: int, kind: str) -> Tuple:
+        version = self._memory.version((user_id,))
+        return (user_id, kind, datetime.now().strftime("%Y-%m-%d"), version)
+
+    def _user_dir(self, user_id: int) -> str:
+        return os.path.join(self.spill_dir, str(user_id))
+
+    def _path(self, key: Tuple) -> str:
+        user_id, kind, day, (epoch, version) = key
+        return os.path.join(self._user_dir(user_id), f"{kind}_{day}_{epoch}_{version}.png")
+
+    def _spill(self, key: Tuple, png: bytes):
+        """Запись вытесненного из памяти графика на диск (атомарно через rename)."""
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Не удалось сохранить график на диск: {e}")
+            return
+        with self._lock:
+            previous = self._disk.pop(path, None)
+            if previous is not None:
+                self.disk_bytes -= previous[0]
+            self._disk[path] = (len(png), key[0])
+            self._disk_by_user.setdefault(key[0], set()).add(path)
+            self.disk_bytes += len(png)
+            expired = self._trim_disk()
+        for expired_path in expired:
+            try:
+                os.remove(expired_path)
+            except OSError:
+                pass
+
+    def _trim_disk(self) -> List[str]:
+        """Снимает с индекса самые старые файлы сверх spill_max_bytes (под self._lock); возвращает их пути."""
+        expired = []
+        while self.disk_bytes > self.spill_max_bytes and self._disk:
+            path, (size, user_id) = self._disk.popitem(last=False)
+            self.disk_bytes -= size
+            paths = self._disk_by_user.get(user_id)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del self._disk_by_user[user_id]
+            expired.append(path)
+        return expired
+
+    def _read_disk(self, key: Tuple) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    async def get(self, key: Tuple) -> Optional[bytes]:
+        png = self._memory.get(key)
+        if png is not None:
+            return png
+        png = await asyncio.to_thread(self._read_disk, key)
+        if png is not None:
+            self.disk_hits += 1
+            await asyncio.to_thread(self._memory.put, key, png, key[3])
+        return png
+
+    async def put(self, key: Tuple, png: bytes):
+        # put может вытеснить записи на диск — не делаем это в event loop.
+        # Версия из ключа: график, нарисованный до новой записи, не кэшируется
+        await asyncio.to_thread(self._memory.put, key, png, key[3])
+
+    async def get_or_render(
+        self,
+        user_id: int,
+        kind: str,
+        load: Callable[[], Awaitable[List[Dict[str, Any]]]],
+        render: Callable[[List[Dict[str, Any]]], Awaitable[bytes]],
+        allow_empty: bool = False
+    ) -> Optional[bytes]:
+        """
+        Готовый график из кэша или load() + render() при промахе.
+
+        Args:
+            allow_empty: Рисовать график и при пустых данных (заглушка «нет данных»)
+
+        Returns:
+            PNG или None, если для графика нет данных
+        """
+        key = self.key(user_id, kind)
+        png = await self.get(key)
+        if png is not None:
+            return png
+        rows = await load()
+        if not rows and not allow_empty:
+            return None
+        png = await render(rows)
+        if rows:
+            # Заглушку «нет данных» не кэшируем: по этому ключу её получил бы и тот, кому нужен None
+            await self.put(key, png)
+        return png
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._memory.stats()
+        stats['disk_hits'] = self.disk_hits
+        stats['disk_files'] = len(self._disk)
+        stats['disk_bytes'] = self.disk_bytes
+        return stats
@@ -0,0 +1,224 @@
+"""
+Бэкенд графиков на matplotlib (CHART_BACKEND=matplotlib, по умолчанию).
+
+Фигуры собираются один раз на процесс (шаблоны) и при рендере меняют
+только данные. Полноценные оси дат, сглаженный текст и легенды — вариант
+с наилучшим качеством; лёгкая альтернатива — services.chart_pil.
+"""
+
+import functools
+import io
+import threading
+from datetime import datetime
+from typing import Dict
+
+import matplotlib
+matplotlib.use('Agg')  # Для работы без GUI
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
+import seaborn as sns
+from PIL import Image
+
+from .analytics import WEEKDAY_LABELS
+
+sns.set_style("whitegrid")
+plt.rcParams['figure.figsize'] = (10, 6)
+plt.rcParams['font.size'] = 10
+
+
+class _FigureTemplate:
+    """
+    Заранее собранная фигура: оси, подписи, сетка и оформление создаются один
+    раз на процесс, при рендере меняются только данные.
+
+    Фигура создаётся через matplotlib.figure.Figure + FigureCanvasAgg, без
+    глобального состояния pyplot. Обновление и сохранение идут под
+    блокировкой шаблона, а _update обязан переписать всё, что зависит от
+    данных, — так состояние одного пользователя не попадает в график другого.
+    """
+
+    def __init__(self, figsize):
+        self.fig = Figure(figsize=figsize)
+        FigureCanvasAgg(self.fig)
+        self._lock = threading.Lock()
+        self._build()
+
+    def _build(self):
+        raise NotImplementedError
+
+    def _update(self, *data):
+        raise NotImplementedError
+
+    def render(self, *data) -> Image.Image:
+        # Пиксели берутся прямо из холста Agg: savefig перерисовал бы фигуру
+        # ещё раз и сжал PNG, который всё равно перекодирует services.encode
+        with self._lock:
+            self._update(*data)
+            canvas = self.fig.canvas
+            canvas.draw()
+            image = Image.frombuffer("RGBA", canvas.get_width_height(), canvas.buffer_rgba(), "raw", "RGBA", 0, 1)
+            return image.convert("RGB")  # копия: буфер холста перепишет следующий рендер
+
+
+class _HeatmapTemplate(_FigureTemplate):
+    """Тепловая карта 7x24: imshow + подписи в ячейках с данными."""
+
+    def __init__(self):
+        super().__init__(figsize=(14, 6))
+
+    def _build(self):
+        self.fig.subplots_adjust(left=0.06, right=1.02, bottom=0.1, top=0.93)
+        ax = self.ax = self.fig.add_subplot()
+        self.image = ax.imshow(np.zeros((7, 24)), cmap='YlOrRd', vmin=0, vmax=1,
+                               aspect='auto', interpolation='nearest')
+        self.fig.colorbar(self.image, ax=ax, label='Успешность')
+        ax.set_xticks(range(24))
+        ax.set_yticks(range(7))
+        ax.set_yticklabels(WEEKDAY_LABELS)
+        ax.set_xlabel('Час дня', fontsize=12)
+        ax.set_ylabel('День недели', fontsize=12)
+        ax.set_title('Тепловая карта продуктивности', fontsize=14, fontweight='bold')
+        ax.grid(False)
+        self.labels = []
+
+    def _update(self, rates: np.ndarray, counts: np.ndarray):
+        self.image.set_data(rates)
+        for label in self.labels:
+            label.remove()
+        self.labels = [
+            self.ax.text(hour, weekday, f"{rates[weekday, hour]:.2f}", ha='center', va='center',
+                         fontsize=8, color='white' if rates[weekday, hour] > 0.6 else 'black')
+            for weekday, hour in zip(*np.nonzero(counts))
+        ]
+
+
+def _date_axis(ax):
+    """Ось дат: значения подаются числами matplotlib (date2num), как их строит pyplot для date."""
+    locator = mdates.AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(locator))
+    ax.tick_params(axis='x', rotation=45)
+    ax.grid(True, alpha=0.3)
+
+
+def _set_line(ax, line, x, y, ylim=None):
+    line.set_data(x, y)
+    ax.relim()
+    # set_ylim прошлого рендера выключает автомасштаб по y — включаем обратно
+    ax.set_autoscaley_on(True)
+    ax.autoscale_view()
+    if ylim is None:
+        ax.set_ylim(bottom=0)
+    else:
+        ax.set_ylim(*ylim)
+
+
+class _StatsTemplate(_FigureTemplate):
+    """Три линейных графика: сессии по дням, средняя длительность, процент завершённых."""
+
+    PANELS = [
+        ('Количество сессий по дням', 'Количество сессий', 'steelblue'),
+        ('Средняя длительность сессий (минуты)', 'Минуты', 'green'),
+        ('Процент завершённых сессий', 'Процент (%)', 'orange'),
+    ]
+
+    def __init__(self):
+        super().__init__(figsize=(12, 10))
+
+    def _build(self):
+        self.fig.subplots_adjust(left=0.08, right=0.97, bottom=0.08, top=0.96, hspace=0.75)
+        self.axes = self.fig.subplots(3, 1)
+        self.lines = []
+        for ax, (title, ylabel, color) in zip(self.axes, self.PANELS):
+            line, = ax.plot([], [], color=color, linewidth=2, marker='o', markersize=5)
+            ax.set_title(title, fontweight='bold')
+            ax.set_xlabel('Дата')
+            ax.set_ylabel(ylabel)
+            _date_axis(ax)
+            self.lines.append(line)
+
+    def _update(self, dates, counts, avg_duration, completion_rate):
+        x = mdates.date2num(dates)
+        _set_line(self.axes[0], self.lines[0], x, counts)
+        _set_line(self.axes[1], self.lines[1], x, avg_duration)
+        _set_line(self.axes[2], self.lines[2], x, completion_rate, ylim=(0, 100))
+
+
+class _SleepTemplate(_FigureTemplate):
+    """Длительность сна по дням с линиями рекомендуемого минимума."""
+
+    def __init__(self):
+        super().__init__(figsize=(12, 6))
+
+    def _build(self):
+        self.fig.subplots_adjust(left=0.07, right=0.97, bottom=0.2, top=0.92)
+        ax = self.ax = self.fig.add_subplot()
+        self.line, = ax.plot([], [], color='navy', linewidth=2, marker='o', markersize=5)
+        ax.axhline(y=7, color='green', linestyle='--', linewidth=2, label='Рекомендуемый минимум (7ч)')
+        ax.axhline(y=6, color='orange', linestyle='--', linewidth=2, label='Минимум (6ч)')
+        ax.set_title('График сна', fontsize=14, fontweight='bold')
+        ax.set_xlabel('Дата')
+        ax.set_ylabel('Длительность (часы)')
+        _date_axis(ax)
+        ax.legend()
+
+    def _update(self, dates, hours):
+        _set_line(self.ax, self.line, mdates.date2num(dates), hours)
+
+
+_templates: Dict[str, _FigureTemplate] = {}
+_templates_lock = threading.Lock()
+_TEMPLATE_CLASSES = {'heatmap': _HeatmapTemplate, 'stats': _StatsTemplate, 'sleep': _SleepTemplate}
+
+
+def _template(kind: str) -> _FigureTemplate:
+    """Шаблон фигуры текущего процесса (создаётся при первом обращении)."""
+    template = _templates.get(kind)
+    if template is None:
+        with _templates_lock:
+            template = _templates.get(kind)
+            if template is None:
+                template = _templates[kind] = _TEMPLATE_CLASSES[kind]()
+    return template
+
+
+def warm():
+    """Собирает все шаблоны и прогоняет первый рендер (для инициализатора воркера)."""
+    _template('heatmap').render(np.zeros((7, 24)), np.zeros((7, 24)))
+    _template('stats').render([datetime.now().date()], [0], [0], [0])
+    _template('sleep').render([datetime.now().date()], [0])
+    _empty_image('Нет данных для отображения')
+
+
+@functools.lru_cache(maxsize=None)
+def _empty_image(text: str) -> Image.Image:
+    """Заглушка «нет данных» не зависит от пользователя — рисуется один раз."""
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.text(0.5, 0.5, text, ha='center', va='center', fontsize=16)
+    ax.axis('off')
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight', dpi=100)
+    buf.seek(0)
+    return Image.open(buf).convert("RGB")
+
+
+def empty(text: str) -> Image.Image:
+    return _empty_image(text)
+
+
+def heatmap(rates: np.ndarray, counts: np.ndarray) -> Image.Image:
+    """Тепловая карта 7x24: imshow + подписи только в ячейках с данными."""
+    return _template('heatmap').render(rates, counts)
+
+
+def stats(dates, counts, avg_duration, completion_rate) -> Image.Image:
+    return _template('stats').render(dates, counts, avg_duration, completion_rate)
+
+
+def sleep(dates, hours) -> Image.Image:
+    return _template('sleep').render(dates, hours)
@@ -0,0 +1,276 @@
+"""
+Лёгкий бэкенд графиков на Pillow (CHART_BACKEND=pillow).
+
+Сетка тепловой карты, линии и пороговые уровни рисуются прямо в буфер
+изображения через ImageDraw — без matplotlib, pandas-осей и Agg. Оформление
+упрощённое (подписи дат ДД.ММ, без сглаживания линий), зато рендер в разы
+быстрее и процессу не нужен импорт matplotlib.
+
+Шрифт с кириллицей: CHART_FONT (путь к .ttf), иначе DejaVu Sans из системы
+или из поставки matplotlib, иначе встроенный шрифт Pillow.
+"""
+
+import functools
+import importlib.util
+import math
+import os
+from datetime import date
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from .analytics import WEEKDAY_LABELS
+
+BACKGROUND = (255, 255, 255)
+TEXT = (38, 38, 38)
+AXIS = (204, 204, 204)
+GRID = (234, 234, 242)
+
+# Палитра YlOrRd (ColorBrewer, 9 цветов) — та же, что у matplotlib
+_YLORRD = np.array([
+    (255, 255, 204), (255, 237, 160), (254, 217, 118), (254, 178, 76), (253, 141, 60),
+    (252, 78, 42), (227, 26, 28), (189, 0, 38), (128, 0, 38),
+], dtype=np.float64)
+
+_FONT_CANDIDATES = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+]
+
+
+def _font_path(bold: bool) -> Optional[str]:
+    configured = os.getenv("CHART_FONT")
+    if configured and os.path.exists(configured):
+        return configured
+    candidates = list(_FONT_CANDIDATES)
+    if bold:
+        candidates = [path.replace("DejaVuSans.ttf", "DejaVuSans-Bold.ttf").replace("arial.ttf", "arialbd.ttf")
+                      for path in candidates] + candidates
+    # DejaVu из поставки matplotlib: find_spec не импортирует сам пакет
+    spec = importlib.util.find_spec("matplotlib")
+    if spec is not None and spec.origin:
+        ttf_dir = os.path.join(os.path.dirname(spec.origin), "mpl-data", "fonts", "ttf")
+        if bold:
+            candidates.append(os.path.join(ttf_dir, "DejaVuSans-Bold.ttf"))
+        candidates.append(os.path.join(ttf_dir, "DejaVuSans.ttf"))
+    return next((path for path in candidates if os.path.exists(path)), None)
+
+
+@functools.lru_cache(maxsize=None)
+def _font(size: int, bold: bool = False) -> ImageFont.ImageFont:
+    path = _font_path(bold)
+    if path is None:
+        return ImageFont.load_default(size)
+    return ImageFont.truetype(path, size)
+
+
+def _colors(values: np.ndarray) -> np.ndarray:
+    """Значения 0..1 -> RGB по палитре YlOrRd (линейная интерполяция)."""
+    positions = np.clip(values, 0, 1) * (len(_YLORRD) - 1)
+    anchors = np.arange(len(_YLORRD))
+    channels = [np.interp(positions, anchors, _YLORRD[:, c]) for c in range(3)]
+    return np.stack(channels, axis=-1).round().astype(np.uint8)
+
+
+def _text(draw: ImageDraw.ImageDraw, xy, text: str, size: int, anchor: str = "mm",
+          bold: bool = False, fill=TEXT):
+    draw.text(xy, text, font=_font(size, bold), fill=fill, anchor=anchor)
+
+
+def _vertical_text(image: Image.Image, xy, text: str, size: int):
+    """Подпись оси Y: текст, повёрнутый на 90°, с центром в xy."""
+    font = _font(size)
+    left, top, right, bottom = font.getbbox(text)
+    label = Image.new("RGBA", (right - left + 4, bottom - top + 4), (0, 0, 0, 0))
+    ImageDraw.Draw(label).text((2 - left, 2 - top), text, font=font, fill=TEXT)
+    label = label.rotate(90, expand=True)
+    image.paste(label, (int(xy[0] - label.width / 2), int(xy[1] - label.height / 2)), label)
+
+
+def _nice_ticks(top: float, count: int = 5) -> List[float]:
+    """Круглые деления оси 0..top (1, 2, 2.5, 5 × 10^n)."""
+    if top <= 0:
+        return [0.0]
+    raw = top / count
+    magnitude = 10 ** math.floor(math.log10(raw))
+    step = next(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= raw)
+    return [i * step for i in range(int(top / step + 1e-9) + 1)]
+
+
+def _format_tick(value: float) -> str:
+    return f"{value:g}"
+
+
+def _dashed_line(draw: ImageDraw.ImageDraw, x0: int, x1: int, y: int, fill, width: int = 2,
+                 dash: int = 8, gap: int = 5):
+    for x in range(x0, x1, dash + gap):
+        draw.line([(x, y), (min(x + dash, x1), y)], fill=fill, width=width)
+
+
+def _line_panel(
+    image: Image.Image,
+    box: Tuple[int, int, int, int],
+    title: str,
+    ylabel: str,
+    dates: Sequence[date],
+    values: Sequence[float],
+    color,
+    ylim: Optional[Tuple[float, float]] = None,
+    thresholds: Sequence[Tuple[float, tuple, str]] = ()
+):
+    """
+    Линейный график с маркерами в прямоугольнике box (left, top, right, bottom).
+
+    Args:
+        thresholds: Пороговые горизонтальные линии (значение, цвет, подпись для легенды)
+    """
+    draw = ImageDraw.Draw(image)
+    left, top, right, bottom = box
+    _text(draw, ((left + right) / 2, top - 14), title, 14, bold=True)
+    _vertical_text(image, (left - 55, (top + bottom) / 2), ylabel, 12)
+    _text(draw, ((left + right) / 2, bottom + 42), 'Дата', 12)
+
+    values = [float(v) for v in values]
+    if ylim is None:
+        peak = max(values + [t[0] for t in thresholds] + [0.0])
+        ticks = _nice_ticks(peak * 1.05 or 1.0)
+        if ticks[-1] < peak:
+            ticks.append(ticks[-1] + (ticks[1] - ticks[0] if len(ticks) > 1 else 1))
+        y_min, y_max = 0.0, ticks[-1]
+    else:
+        y_min, y_max = ylim
+        ticks = _nice_ticks(y_max)
+
+    def y_of(value: float) -> float:
+        return bottom - (value - y_min) / (y_max - y_min or 1) * (bottom - top)
+
+    for tick in ticks:
+        y = y_of(tick)
+        draw.line([(left, y), (right, y)], fill=GRID, width=1)
+        _text(draw, (left - 8, y), _format_tick(tick), 12, anchor="rm")
+    draw.rectangle(box, outline=AXIS, width=1)
+
+    ordinals = [d.toordinal() for d in dates]
+    first, last = min(ordinals), max(ordinals)
+    span = last - first
+    pad = (right - left) * 0.05
+
+    def x_of(ordinal: int) -> float:
+        if span == 0:
+            return (left + right) / 2
+        return left + pad + (ordinal - first) / span * (right - left - 2 * pad)
+
+    # Подписи дат: не больше ~10, чтобы не наезжали друг на друга
+    step = max(1, math.ceil((span + 1) / 10))
+    for ordinal in range(first, last + 1, step):
+        x = x_of(ordinal)
+        draw.line([(x, bottom), (x, bottom + 4)], fill=AXIS)
+        _text(draw, (x, bottom + 16), date.fromordinal(ordinal).strftime("%d.%m"), 12)
+
+    for value, line_color, _ in thresholds:
+        _dashed_line(draw, left + 1, right - 1, int(y_of(value)), line_color)
+
+    points = [(x_of(o), y_of(v)) for o, v in zip(ordinals, values)]
+    if len(points) > 1:
+        draw.line(points, fill=color, width=3, joint="curve")
+    for x, y in points:
+        draw.ellipse([x - 4, y - 4, x + 4, y + 4], fill=color)
+
+    if thresholds:
+        font = _font(12)
+        width = max(int(font.getlength(label)) for _, _, label in thresholds) + 50
+        lx, ly = right - width - 10, top + 10
+        draw.rectangle([lx, ly, lx + width, ly + 10 + 22 * len(thresholds)], fill=BACKGROUND, outline=AXIS)
+        for i, (_, line_color, label) in enumerate(thresholds):
+            y = ly + 16 + 22 * i
+            _dashed_line(draw, lx + 8, lx + 36, y, line_color, dash=6, gap=4)
+            _text(draw, (lx + 44, y), label, 12, anchor="lm")
+
+
+def heatmap(rates: np.ndarray, counts: np.ndarray) -> Image.Image:
+    """Тепловая карта 7x24: ячейки — блоки пикселей, подписи только в ячейках с данными."""
+    width, height = 1400, 600
+    left, top, right, bottom = 80, 45, 1160, 540
+    image = Image.new("RGB", (width, height), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+
+    # Сетка целиком: массив 7x24 цветов, растянутый без сглаживания
+    grid = Image.fromarray(_colors(rates)).resize((right - left, bottom - top), Image.NEAREST)
+    image.paste(grid, (left, top))
+
+    cell_w = (right - left) / 24
+    cell_h = (bottom - top) / 7
+    for weekday, hour in zip(*np.nonzero(counts)):
+        rate = rates[weekday, hour]
+        _text(draw, (left + (hour + 0.5) * cell_w, top + (weekday + 0.5) * cell_h), f"{rate:.2f}", 11,
+              fill=(255, 255, 255) if rate > 0.6 else (0, 0, 0))
+
+    for hour in range(24):
+        _text(draw, (left + (hour + 0.5) * cell_w, bottom + 14), str(hour), 12)
+    for weekday, label in enumerate(WEEKDAY_LABELS):
+        _text(draw, (left - 10, top + (weekday + 0.5) * cell_h), label, 12, anchor="rm")
+    draw.rectangle([left, top, right, bottom], outline=AXIS)
+
+    _text(draw, ((left + right) / 2, 22), 'Тепловая карта продуктивности', 16, bold=True)
+    _text(draw, ((left + right) / 2, bottom + 40), 'Час дня', 14)
+    _vertical_text(image, (28, (top + bottom) / 2), 'День недели', 14)
+
+    # Шкала цветов справа
+    bar_left, bar_right = 1225, 1250
+    gradient = _colors(np.linspace(1, 0, bottom - top))[:, None, :].repeat(bar_right - bar_left, axis=1)
+    image.paste(Image.fromarray(gradient), (bar_left, top))
+    draw.rectangle([bar_left, top, bar_right, bottom], outline=AXIS)
+    for tick in (0.0, 0.2, 0.4, 0.6, 0.8, 1.0):
+        y = bottom - tick * (bottom - top)
+        draw.line([(bar_right, y), (bar_right + 4, y)], fill=TEXT)
+        _text(draw, (bar_right + 8, y), f"{tick:.1f}", 12, anchor="lm")
+    _vertical_text(image, (1300, (top + bottom) / 2), 'Успешность', 12)
+    return image
+
+
+def stats(dates, counts, avg_duration, completion_rate) -> Image.Image:
+    """Три линейных графика: сессии по дням, средняя длительность, процент завершённых."""
+    image = Image.new("RGB", (1200, 1000), BACKGROUND)
+    panels = [
+        ('Количество сессий по дням', 'Количество сессий', counts, (70, 130, 180), None),
+        ('Средняя длительность сессий (минуты)', 'Минуты', avg_duration, (0, 128, 0), None),
+        ('Процент завершённых сессий', 'Процент (%)', completion_rate, (255, 165, 0), (0, 100)),
+    ]
+    for i, (title, ylabel, values, color, ylim) in enumerate(panels):
+        top = 40 + i * 330
+        _line_panel(image, (95, top, 1165, top + 220), title, ylabel, dates, values, color, ylim=ylim)
+    return image
+
+
+def sleep(dates, hours) -> Image.Image:
+    """Длительность сна по дням с линиями рекомендуемого минимума."""
+    image = Image.new("RGB", (1200, 600), BACKGROUND)
+    _line_panel(
+        image, (85, 50, 1165, 500), 'График сна', 'Длительность (часы)', dates, hours, (0, 0, 128),
+        thresholds=[(7, (0, 128, 0), 'Рекомендуемый минимум (7ч)'), (6, (255, 165, 0), 'Минимум (6ч)')]
+    )
+    return image
+
+
+@functools.lru_cache(maxsize=None)
+def _empty_image(text: str) -> Image.Image:
+    """Заглушка «нет данных» не зависит от пользователя — рисуется один раз."""
+    image = Image.new("RGB", (800, 480), BACKGROUND)
+    _text(ImageDraw.Draw(image), (400, 240), text, 20)
+    return image
+
+
+def empty(text: str) -> Image.Image:
+    return _empty_image(text)
+
+
+def warm():
+    """Загружает шрифты и прогоняет первый рендер (для инициализатора воркера)."""
+    today = date.today()
+    heatmap(np.zeros((7, 24)), np.zeros((7, 24)))
+    stats([today], [0], [0], [0])
+    sleep([today], [0])
+    _empty_image('Нет данных для отображения')
@@ -0,0 +1,104 @@
+"""
+Кодирование готовых графиков для отправки в Telegram.
+
+Бэкенды (chart_mpl, chart_pil) возвращают картинку PIL, а формат выбирается
+здесь — по типу графика. У наших графиков плоские заливки, тонкие линии и
+текст: палитровый PNG (256 цветов, без дизеринга) для них почти без потерь
+(средняя ошибка ~1/255 на канал) и в 2,5–3 раза меньше полноцветного.
+JPEG на таких картинках и больше, и даёт ореолы вокруг букв, поэтому он
+оставлен только как явный выбор через CHART_ENCODING.
+
+Каждое кодирование записывается (тип, формат, байты, время) — воркер
+рендера отдаёт эти записи главному процессу вместе с картинкой.
+"""
+
+import io
+import os
+import time
+from collections import deque
+from typing import List, NamedTuple, Optional
+
+from PIL import Image
+
+# Формат -> (формат Pillow, параметры сохранения). Параметры общие для всех
+# графиков: собраны один раз, а не подбираются на каждый вызов
+FORMATS = {
+    'png': ('PNG', {'compress_level': 6}),
+    'png8': ('PNG', {'compress_level': 6}),
+    'jpeg': ('JPEG', {'quality': 88, 'optimize': True, 'progressive': True, 'subsampling': '4:2:0'}),
+}
+
+# Тип графика -> формат по умолчанию
+CHART_ENCODINGS = {
+    'heatmap': 'png8',
+    'stats': 'png8',
+    'sleep': 'png8',
+    'empty': 'png8',
+}
+
+PALETTE_COLORS = 256
+
+
+class EncodeRecord(NamedTuple):
+    kind: str
+    format: str
+    bytes: int
+    encode_ms: float
+
+
+# Ограничено: вне воркера рендера записи никто не забирает
+_records = deque(maxlen=1000)
+
+
+def get_encoding(kind: str, name: Optional[str] = None) -> str:
+    """
+    Формат для графика: явно переданный, из CHART_ENCODING или по типу графика.
+
+    Raises:
+        ValueError: Неизвестный формат
+    """
+    name = (name or os.getenv("CHART_ENCODING") or CHART_ENCODINGS.get(kind, 'png8')).lower()
+    if name not in FORMATS:
+        raise ValueError(f"Неизвестный формат графиков: {name}. Доступны: {', '.join(FORMATS)}")
+    return name
+
+
+def _quantize(image: Image.Image) -> Image.Image:
+    # FASTOCTREE без дизеринга: плоские заливки остаются плоскими, а
+    # градиенты (шкала цветов, сглаживание текста) укладываются в палитру
+    return image.quantize(PALETTE_COLORS, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+
+
+def encode(image: Image.Image, kind: str, encoding: Optional[str] = None) -> io.BytesIO:
+    """
+    Кодирует график в формат, выбранный для его типа, и записывает размер и время.
+
+    Args:
+        image: Картинка RGB от бэкенда
+        kind: 'heatmap', 'stats', 'sleep' или 'empty'
+        encoding: Формат вместо выбранного по умолчанию ('png', 'png8', 'jpeg')
+
+    Returns:
+        Буфер с закодированной картинкой (позиция в начале)
+    """
+    encoding = get_encoding(kind, encoding)
+    pil_format, options = FORMATS[encoding]
+    started = time.perf_counter()
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if encoding == 'png8':
+        image = _quantize(image)
+    buf = io.BytesIO()
+    image.save(buf, format=pil_format, **options)
+    encode_ms = (time.perf_counter() - started) * 1000
+    _records.append(EncodeRecord(kind, encoding, buf.tell(), encode_ms))
+    buf.seek(0)
+    return buf
+
+
+def drain_records() -> List[EncodeRecord]:
+    """Забирает накопленные в этом процессе записи о кодировании."""
+    records = []
+    while _records:
+        records.append(_records.popleft())
+    return records
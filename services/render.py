@@ -0,0 +1,247 @@
+"""
+Рендер графиков в отдельных процессах.
+
+matplotlib держит GIL и блокирует event loop на сотни миллисекунд, поэтому
+графики рисуются в воркерах services.render_worker: каждый один раз
+импортирует бэкенд графиков при старте и дальше остаётся «тёплым». Главный
+процесс эти библиотеки не импортирует вовсе. Наружу —
+асинхронный API, возвращающий байты картинки (формат выбирает
+services.encode); размер и время кодирования каждого графика воркер
+возвращает вместе с картинкой, сводка — ChartRenderer.stats().
+
+Воркеры — отдельные интерпретаторы (asyncio.create_subprocess_exec), а не
+пул multiprocessing: fork процесса бота с уже запущенными потоками базы
+может зависнуть, а spawn и forkserver заново выполняют bot.py в каждом
+воркере. Процессы принадлежат ChartRenderer, поэтому зависший воркер
+убивается и заменяется по отдельности.
+"""
+
+import asyncio
+import os
+import pickle
+import statistics
+import struct
+import sys
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set
+
+# Кадр протокола с воркером: длина тела (4 байта, big-endian) и тело pickle
+HEADER = struct.Struct(">I")
+
+
+def encode_frame(obj: Any) -> bytes:
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    return HEADER.pack(len(data)) + data
+
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class RenderError(RuntimeError):
+    """Ошибка рендера в воркере или падение воркера."""
+
+
+class ChartRenderer:
+    """
+    Пул процессов для рендера графиков с ограниченной очередью и таймаутами.
+
+    Не больше max_queue задач одновременно ждут или выполняются — остальные
+    вызовы ждут свободного места. Задача, не уложившаяся в timeout, снимается;
+    если она уже выполняется, её воркер убивается и заменяется новым.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 16, timeout: float = 30.0, start_timeout: float = 120.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self._processes: Set[asyncio.subprocess.Process] = set()
+        self._idle: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._ready: Optional[asyncio.Future] = None
+        self._warmup: Optional[asyncio.Task] = None
+        self._replacing: Set[asyncio.Task] = set()
+        # Тип графика -> последние (формат, байты, мс кодирования)
+        self._encoded: Dict[str, Deque[tuple]] = {}
+
+    @staticmethod
+    async def _read_frame(process: asyncio.subprocess.Process) -> Any:
+        (size,) = HEADER.unpack(await process.stdout.readexactly(HEADER.size))
+        return pickle.loads(await process.stdout.readexactly(size))
+
+    async def _spawn(self) -> asyncio.subprocess.Process:
+        """Запускает воркер и ждёт его прогрева (первый кадр — pid)."""
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, (_PROJECT_ROOT, env.get('PYTHONPATH'))))
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "services.render_worker",
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, env=env
+        )
+        try:
+            await asyncio.wait_for(self._read_frame(process), self.start_timeout)
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+            raise
+        self._processes.add(process)
+        return process
+
+    async def _fill(self):
+        results = await asyncio.gather(
+            *(self._spawn() for _ in range(self.max_workers - len(self._processes))),
+            return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, BaseException)]
+        for process in results:
+            if not isinstance(process, BaseException):
+                self._idle.put_nowait(process)
+        if errors and not self._processes:
+            raise RenderError(f"не удалось запустить воркеры рендера: {errors[0]!r}")
+        for error in errors:
+            print(f"Рендер графиков: воркер не запустился: {error!r}")
+
+    async def _ensure_pool(self):
+        if self._ready is None:
+            if self._idle is None:
+                self._idle = asyncio.Queue()
+                self._slots = asyncio.Semaphore(self.max_queue)
+            self._ready = asyncio.ensure_future(self._fill())
+        ready = self._ready
+        try:
+            await asyncio.shield(ready)
+        except RenderError:
+            if self._ready is ready:
+                self._ready = None  # следующий вызов попробует снова
+            raise
+
+    async def start(self):
+        """
+        Поднимает воркеры заранее, чтобы первый график не ждал импорта matplotlib.
+
+        Бот запускает это фоновой задачей (start_background): webhook отвечает сразу, а воркеры
+        импортируют matplotlib/pandas параллельно. Ошибка прогрева не роняет
+        бота — воркеры запустятся при первом графике.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            await self._ensure_pool()
+        except Exception as e:
+            print(f"Рендер графиков: прогрев воркеров не удался: {e}")
+            return
+        print(f"Рендер графиков: {len(self._processes)} процесс(ов) запущено за {loop.time() - started:.1f} с")
+
+    def start_background(self) -> asyncio.Task:
+        """start() фоновой задачей; ссылка хранится здесь, чтобы задачу не собрал GC."""
+        self._warmup = asyncio.create_task(self.start())
+        return self._warmup
+
+    def _replace(self, process: asyncio.subprocess.Process):
+        """Убивает воркер (завис, упал или прерван посреди задачи) и запускает ему замену."""
+        self._processes.discard(process)
+        if process.returncode is None:
+            process.kill()
+
+        async def replace():
+            await process.wait()
+            try:
+                self._idle.put_nowait(await self._spawn())
+            except Exception as e:
+                print(f"Рендер графиков: замена воркера не запустилась: {e!r}")
+                if not self._processes:
+                    self._ready = None  # следующий вызов поднимет пул заново
+
+        task = asyncio.ensure_future(replace())
+        self._replacing.add(task)
+        task.add_done_callback(self._replacing.discard)
+
+    async def _call(self, process: asyncio.subprocess.Process, kind: str, rows: List[Dict[str, Any]]) -> tuple:
+        process.stdin.write(encode_frame((kind, rows)))
+        await process.stdin.drain()
+        return await self._read_frame(process)
+
+    async def render(self, kind: str, rows: List[Dict[str, Any]], timeout: Optional[float] = None) -> bytes:
+        """
+        Рисует график в воркере.
+
+        Args:
+            kind: 'heatmap', 'stats' или 'sleep'
+            rows: Строки из базы (список словарей): ячейки тепловой карты,
+                дневные итоги сессий или записи сна
+            timeout: Лимит на задачу в секундах, с ожиданием свободного воркера
+                (по умолчанию self.timeout)
+
+        Returns:
+            Изображение (по умолчанию палитровый PNG)
+
+        Raises:
+            RenderError: Ошибка рендера или падение воркера
+            asyncio.TimeoutError: Не уложились в timeout
+        """
+        await self._ensure_pool()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        rows = [dict(row) for row in rows]
+        async with self._slots:
+            process = await asyncio.wait_for(self._idle.get(), deadline - loop.time())
+            healthy = False
+            try:
+                reply = await asyncio.wait_for(self._call(process, kind, rows), max(deadline - loop.time(), 0))
+                healthy = True
+            except asyncio.TimeoutError:
+                print(f"Рендер графика '{kind}' превысил таймаут, перезапускаем воркер")
+                raise
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                # Воркер упал (например, OOM) — на его место запускается новый
+                raise RenderError(f"воркер рендера завершился: {e!r}")
+            finally:
+                if healthy:
+                    self._idle.put_nowait(process)
+                else:
+                    self._replace(process)
+        if reply[0] != 'ok':
+            raise RenderError(reply[1])
+        _, image, records = reply
+        for record_kind, encoding, size, encode_ms in records:
+            self._encoded.setdefault(record_kind, deque(maxlen=500)).append((encoding, size, encode_ms))
+        return image
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Медианы размера и времени кодирования по последним графикам каждого типа."""
+        return {
+            kind: {
+                'count': len(records),
+                'format': records[-1][0],
+                'median_kb': round(statistics.median(r[1] for r in records) / 1024, 1),
+                'median_encode_ms': round(statistics.median(r[2] for r in records), 1),
+            }
+            for kind, records in self._encoded.items()
+        }
+
+    async def render_heatmap(self, cells: List[Dict[str, Any]]) -> bytes:
+        return await self.render('heatmap', cells)
+
+    async def render_stats(self, daily: List[Dict[str, Any]]) -> bytes:
+        return await self.render('stats', daily)
+
+    async def render_sleep(self, sleep_records: List[Dict[str, Any]]) -> bytes:
+        return await self.render('sleep', sleep_records)
+
+    async def close(self):
+        if self._warmup is not None and not self._warmup.done():
+            self._warmup.cancel()
+        for task in list(self._replacing):
+            task.cancel()
+        processes, self._processes = list(self._processes), set()
+        self._ready = None
+        for process in processes:
+            # EOF на stdin — воркер завершается сам; не успел — убиваем
+            if process.stdin is not None:
+                process.stdin.close()
+        for process in processes:
+            try:
+                await asyncio.wait_for(process.wait(), 5)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
@@ -0,0 +1,66 @@
+"""
+Воркер рендера графиков: отдельный процесс `python -m services.render_worker`.
+
+ChartRenderer запускает его чистым интерпретатором: без fork процесса бота
+(в нём уже работают потоки базы, а fork при чужой захваченной блокировке —
+sqlite, malloc, stdio — может повесить ребёнка) и без повторного импорта
+bot.py, который делают spawn и forkserver.
+
+Протокол — кадры pickle по stdin/stdout (services.render.encode_frame).
+Первый кадр воркера — его pid после прогрева бэкенда; дальше на
+каждый запрос (kind, rows) — ответ ('ok', картинка, записи о кодировании)
+или ('error', текст ошибки). EOF на stdin — сигнал завершиться.
+"""
+
+import os
+import pickle
+import sys
+from typing import Any, BinaryIO, Optional
+
+from .render import HEADER, encode_frame
+
+
+def _read_frame(stream: BinaryIO) -> Optional[Any]:
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    (size,) = HEADER.unpack(header)
+    return pickle.loads(stream.read(size))
+
+
+def _write_frame(stream: BinaryIO, obj: Any):
+    stream.write(encode_frame(obj))
+    stream.flush()
+
+
+def main():
+    requests, replies = sys.stdin.buffer, sys.stdout.buffer
+    # stdout занят протоколом: print() бэкендов и миграций уходит в stderr (лог бота)
+    sys.stdout = sys.stderr
+
+    from . import analytics, encode
+    charts = {
+        'heatmap': analytics.generate_heatmap_from_cells,
+        'stats': analytics.generate_daily_stats_chart,
+        'sleep': analytics.generate_sleep_chart,
+    }
+    analytics.warm_backend()
+    _write_frame(replies, os.getpid())
+
+    while True:
+        request = _read_frame(requests)
+        if request is None:
+            return
+        kind, rows = request
+        try:
+            image = charts[kind](rows).getvalue()
+            # Записи — обычные кортежи: главному процессу не нужен services.encode (и Pillow)
+            reply = ('ok', image, [tuple(record) for record in encode.drain_records()])
+        except Exception as e:
+            encode.drain_records()
+            reply = ('error', f"{type(e).__name__}: {e}")
+        _write_frame(replies, reply)
+
+
+if __name__ == "__main__":
+    main()
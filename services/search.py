@@ -1,12 +1,13 @@
 """
 Сервис для поиска информации (YouTube, Habr).
+
+requests и googleapiclient импортируются внутри функций: поиск нужен редко,
+а эти библиотеки заметно замедляют старт бота.
 """
 
 import os
-import requests
 import re
 from typing import List, Dict
-from googleapiclient.discovery import build
 
 
 def search_youtube(query: str, max_results: int = 5) -> List[Dict[str, str]]:
@@ -26,6 +27,8 @@ def search_youtube(query: str, max_results: int = 5) -> List[Dict[str, str]]:
         return []
     
     try:
+        from googleapiclient.discovery import build
+        
         youtube = build('youtube', 'v3', developerKey=api_key)
         
         request = youtube.search().list(
@@ -66,6 +69,8 @@ def search_web(query: str, max_results: int = 3) -> List[Dict[str, str]]:
     Returns:
         Список словарей с title и link
     """
+    import requests
+    
     try:
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"